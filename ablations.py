@@ -1,40 +1,27 @@
 import numpy as np
 from game_engine import Game2048
-from expectimax_agent import ExpectimaxAgent
 from expectimax_tc_agent import ExpectimaxTimeControlled
-from heuristics import heuristic_score
-from evaluate import play_one_game
+from heuristics import heuristic_score, DEFAULT_WEIGHTS
+from evaluate import play_one_game, play_games, game_seeds
+from experiments import grid, run_grid, print_progress
 
 import time
 import numpy as np
 from game_engine import Game2048
 
-def eval_agent(agent, n=50, seed=0):
-    rng = np.random.default_rng(seed)
-    scores, tiles = [], []
-
-    for idx in range(n):
-        t0 = time.perf_counter()
-
-        s = int(rng.integers(0, 1e9))
-        g = Game2048(seed=s)
-        while not g.is_game_over():
-            a = agent.select_action(g)
-            g.step(a)
-
-        t1 = time.perf_counter()
-        elapsed = t1 - t0
-
-        scores.append(g.score)
-        tiles.append(g.max_tile())
-
+def eval_agent(agent, n=50, seed=0, workers=1):
+    def report(n_done, n_total, r):
         # Print Progress
         print(
-            f"[{agent.__class__.__name__}] game {idx+1}/{n} "
-            f"score={g.score} max_tile={g.max_tile()} "
-            f"time={elapsed:.3f}s"
+            f"[{agent.__class__.__name__}] game {n_done}/{n_total} "
+            f"score={r['score']} max_tile={r['max_tile']} "
+            f"time={r['time_sec']:.3f}s"
         )
 
+    results = play_games(agent, game_seeds(n, seed), workers=workers, progress=report)
+    scores = [r["score"] for r in results]
+    tiles = [r["max_tile"] for r in results]
+
     return (
         np.mean(scores),
         np.median(scores),
@@ -45,34 +32,42 @@ def eval_agent(agent, n=50, seed=0):
 
 # ---- Depth Ablation ---------------------------------------------------------
 
-def depth_ablation(depths=(1,2,3,4)):
+# Both ablations run through experiments.run_grid: finished games are cached under
+# cache_dir, so a rerun (or a run with more games) only plays the missing ones.
+
+def depth_ablation(depths=(1,2,3,4), workers=1, n=1, cache_dir="experiments"):
     print("\n=== DEPTH ABLATION ===")
-    for d in depths:
-        agent = ExpectimaxAgent(depth=d)
-        avg, med, mx, wr = eval_agent(agent, n=1, seed=10)
-        print(f"Depth {d}: avg={avg:.1f}, median={med:.1f}, best={mx}, win2048={wr:.2f}")
+    rows = run_grid(grid({"agent": "expectimax"}, depth=depths), game_seeds(n, 10),
+                    cache_dir=cache_dir, workers=workers, progress=print_progress)
+    for r in rows:
+        print(f"Depth {r['config']['depth']}: avg={r['avg_score']:.1f}, median={r['median_score']:.1f}, "
+              f"best={r['best_score']}, win2048={r['win_rate_2048']:.2f} ({r['cached']} cached)")
+    return rows
 
 # ---- Heuristic Ablation -----------------------------------------------------
 
-def heuristic_ablation():
+def single_term_weights(term):
+    """DEFAULT_WEIGHTS with every term but one zeroed, e.g. 'empty' -> 250*count_empty(b)."""
+    return {k: (v if k == term else 0.0) for k, v in DEFAULT_WEIGHTS.items()}
+
+def heuristic_ablation(workers=1, n=1, cache_dir="experiments"):
     print("\n=== HEURISTIC ABLATION ===")
-    from heuristics import count_empty, smoothness, monotonicity, corner_max, positional_score
 
+    # plain weight dicts (instead of per-term lambdas) keep the agents picklable for workers > 1
     heuristics = {
-        "empty_only": lambda b: 250*count_empty(b),
-        "mono_only": lambda b: 2*monotonicity(b),
-        "smooth_only": lambda b: 0.1*smoothness(b),
-        "corner_only": lambda b: 50*corner_max(b),
-        "pos_only": lambda b: 0.5*positional_score(b),
+        "empty_only": single_term_weights("empty"),
+        "mono_only": single_term_weights("mono"),
+        "smooth_only": single_term_weights("smooth"),
+        "corner_only": single_term_weights("corner"),
+        "pos_only": single_term_weights("pos"),
     }
 
-    for name, hfun in heuristics.items():
-        class CustomHeuristicAgent(ExpectimaxAgent):
-            def leaf_eval(self, board): return hfun(board)
-
-        agent = CustomHeuristicAgent(depth=3)
-        avg, med, mx, wr = eval_agent(agent, n=1, seed=5)
-        print(f"{name}: avg={avg:.1f}, median={med:.1f}, best={mx}, win2048={wr:.2f}")
+    configs = [{"agent": "expectimax", "depth": 3, "weights": w} for w in heuristics.values()]
+    rows = run_grid(configs, game_seeds(n, 5), cache_dir=cache_dir, workers=workers, progress=print_progress)
+    for name, r in zip(heuristics, rows):
+        print(f"{name}: avg={r['avg_score']:.1f}, median={r['median_score']:.1f}, best={r['best_score']}, "
+              f"win2048={r['win_rate_2048']:.2f} ({r['cached']} cached)")
+    return rows
 
 if __name__ == "__main__":
     depth_ablation()
@@ -0,0 +1,356 @@
+"""
+Long-running move server: agents stay resident and answer board-in / move-out
+requests over a local TCP socket, so clients skip interpreter start-up and
+keep their search caches warm from move to move.
+
+Protocol: one JSON object per line in each direction.
+
+    {"id": 7, "game": "g1", "board": [[0, 2, 0, 0], ...]}
+        -> {"id": 7, "game": "g1", "action": 2, "move": "LEFT", "value": ..., "depth": 4, "nodes": ..., "ms": 19.8}
+    A game's first request may also pick "agent" (one of AGENTS) and "budget_ms".
+    A board without a legal move is answered with "action": null, "game_over": true.
+    {"op": "end", "game": "g1"}   drop the game's agent and transposition table
+    {"op": "stats"}                games and requests per worker
+    Errors are answered as {"id": ..., "error": message}.
+
+Each game gets its own agent, with a fixed-size search_utils.ArrayTranspositionTable
+(tt_mb) that is kept across its moves. A game is pinned to one of 'workers' processes (the one with the
+fewest games when it is first seen), so its table never leaves that process.
+Requests arriving in the same event-loop pass are sent to each worker as one batch,
+and the worker answers the whole batch in one message. Responses on a connection
+come back in completion order; match them by "id".
+"""
+import asyncio
+import itertools
+import json
+import multiprocessing as mp
+import queue
+import socket
+import threading
+import time
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from game_engine import Game2048, ACTION_NAMES
+from agents import RandomAgent, GreedyImmediateAgent
+from expectimax_agent import ExpectimaxAgent
+from profile_search import ExpectimaxTimeControlled
+from mc_agent import MonteCarloAgent
+from search_utils import ArrayTranspositionTable
+import bitboard
+
+DEFAULT_PORT = 2048
+AGENTS = ("random", "greedy", "expectimax", "expectimax_tc", "montecarlo")
+
+
+def make_agent(name: str = "expectimax_tc", budget_ms: float = 20.0, depth: int = 3,
+               tt_mb: float = 4.0, seed: Optional[int] = None):
+    """Agent by name; the expectimax agents search bitboards with their own tt_mb-sized transposition table."""
+    rng = np.random.default_rng(seed)
+    if name == "random":
+        return RandomAgent(rng=rng)
+    if name == "greedy":
+        return GreedyImmediateAgent()
+    if name == "expectimax":
+        return ExpectimaxAgent(depth=depth, rng=rng, use_bitboard=True, tt=ArrayTranspositionTable(tt_mb))
+    if name == "expectimax_tc":
+        return ExpectimaxTimeControlled(timer_budget_sec=budget_ms / 1000.0, rng=rng, use_bitboard=True,
+                                        tt=ArrayTranspositionTable(tt_mb))
+    if name == "montecarlo":
+        return MonteCarloAgent(timer_budget_sec=budget_ms / 1000.0, rng=rng)
+    raise ValueError(f"unknown agent {name!r} (choose from {', '.join(AGENTS)})")
+
+
+# ----- worker process -----
+
+def _answer(games: "OrderedDict[str, object]", req: Dict, defaults: Dict, max_games: int,
+            evicted: List[str]) -> Dict:
+    gid = req.get("game")
+    if req.get("op", "move") == "end":
+        return {"game": gid, "ended": games.pop(gid, None) is not None}
+    board = np.asarray(req["board"], dtype=np.int64)
+    if board.shape != (4, 4):
+        raise ValueError(f"board must be 4x4, got shape {board.shape}")
+    agent = games.get(gid)
+    if agent is None:
+        agent = make_agent(req.get("agent", defaults["agent"]), req.get("budget_ms", defaults["budget_ms"]),
+                           tt_mb=defaults["tt_mb"])
+        games[gid] = agent
+        if len(games) > max_games:
+            evicted.append(games.popitem(last=False)[0])      # least recently moved game
+    else:
+        games.move_to_end(gid)
+    if not bitboard.successors(bitboard.to_bitboard(board)):
+        return {"game": gid, "action": None, "move": None, "game_over": True}
+    t0 = time.perf_counter()
+    action = int(agent.select_action(Game2048(board=board)))
+    stats = getattr(agent, "stats", None)
+    return {"game": gid, "action": action, "move": ACTION_NAMES[action],
+            "value": getattr(agent, "last_value", None),
+            "depth": getattr(stats, "completed_depth", None),
+            "nodes": getattr(stats, "nodes", None),
+            "ms": 1000 * (time.perf_counter() - t0)}
+
+
+def _worker_main(worker: int, inbox, outbox, defaults: Dict, max_games: int):
+    games: "OrderedDict[str, object]" = OrderedDict()
+    while True:
+        batches = [inbox.get()]
+        while batches[-1] is not None:        # take every batch already queued
+            try:
+                batches.append(inbox.get_nowait())
+            except queue.Empty:
+                break
+        replies, evicted = [], []
+        for req in itertools.chain.from_iterable(b for b in batches if b is not None):
+            try:
+                reply = _answer(games, req, defaults, max_games, evicted)
+            except Exception as e:
+                reply = {"error": f"{type(e).__name__}: {e}"}
+            reply.update(id=req.get("id"), _rid=req["_rid"])
+            replies.append(reply)
+        if evicted:
+            # tells the server which games this worker dropped (they were never ended)
+            replies.append({"_rid": None, "worker": worker, "evicted": evicted})
+        if replies:
+            outbox.put(replies)
+        if batches[-1] is None:
+            return
+
+
+# ----- server -----
+
+class AgentServer:
+    """
+    Socket front end plus worker processes. start() returns once it is listening
+    (port=0 picks a free port, see self.port); close() stops everything.
+    - workers: processes searching moves; games are spread over them
+    - agent / budget_ms: defaults for games whose first request does not name them
+    - max_games: games kept per worker; the least recently moved one is dropped beyond it
+      (the worker reports the drop, so assignment / load and {"op": "stats"} stay exact)
+    - tt_mb: transposition-table memory of each expectimax game; a worker holds up to
+      max_games * tt_mb of tables (256 MB with the defaults), raise max_games with care
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, workers: int = 1,
+                 agent: str = "expectimax_tc", budget_ms: float = 20.0, max_games: int = 64,
+                 tt_mb: float = 4.0):
+        if agent not in AGENTS:
+            raise ValueError(f"unknown agent {agent!r} (choose from {', '.join(AGENTS)})")
+        self.host, self.port = host, port
+        self.n_workers = max(1, int(workers))
+        self.max_games = int(max_games)
+        self.defaults = {"agent": agent, "budget_ms": float(budget_ms), "tt_mb": float(tt_mb)}
+        self.assignment: Dict[str, int] = {}     # game -> worker
+        self.load = [0] * self.n_workers         # games per worker
+        self.served = [0] * self.n_workers
+        self._pending: Dict[int, Tuple[asyncio.Future, str]] = {}
+        self._inflight: Dict[str, int] = {}     # game -> requests sent and not yet answered
+        self._outgoing: List[List[Dict]] = [[] for _ in range(self.n_workers)]
+        self._flush_scheduled = False
+        self._rids = itertools.count()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> "AgentServer":
+        self._outbox = mp.Queue()
+        self._inboxes = [mp.Queue() for _ in range(self.n_workers)]
+        self._procs = [mp.Process(target=_worker_main, args=(w, q, self._outbox, self.defaults, self.max_games),
+                                  daemon=True) for w, q in enumerate(self._inboxes)]
+        for p in self._procs:
+            p.start()
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run_loop():
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._serve_connection, self.host, self.port))
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+        self._loop_thread = threading.Thread(target=run_loop, daemon=True)
+        self._loop_thread.start()
+        self._reader = threading.Thread(target=self._read_replies, daemon=True)
+        self._reader.start()
+        ready.wait()
+        return self
+
+    def serve_forever(self):
+        self.start()
+        print(f"Serving {self.defaults['agent']} on {self.host}:{self.port} with {self.n_workers} worker(s)")
+        try:
+            self._loop_thread.join()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self._loop is None:
+            return
+        async def shutdown():
+            self._server.close()
+            await self._server.wait_closed()
+        asyncio.run_coroutine_threadsafe(shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop_thread.join()
+        for q in self._inboxes:
+            q.put(None)
+        for p in self._procs:
+            p.join()
+        self._outbox.put(None)
+        self._reader.join()
+        self._loop.close()
+        self._loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ----- event loop side -----
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.ensure_future(self._respond(line, writer))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, line: bytes, writer: asyncio.StreamWriter):
+        req = None
+        try:
+            req = json.loads(line)
+            if not isinstance(req, dict):
+                raise ValueError("request must be a JSON object")
+            if req.get("op") == "stats":
+                reply = {"id": req.get("id"), "workers": self.n_workers, "games": list(self.load),
+                         "requests": list(self.served)}
+            elif req.get("op", "move") in ("move", "end"):
+                reply = await self._submit(req)
+            else:
+                raise ValueError(f"unknown op {req.get('op')!r}")
+        except Exception as e:
+            reply = {"id": req.get("id") if isinstance(req, dict) else None, "error": f"{type(e).__name__}: {e}"}
+        writer.write(json.dumps(reply).encode() + b"\n")
+
+    def _submit(self, req: Dict) -> asyncio.Future:
+        gid = str(req.get("game", ""))
+        worker = self.assignment.get(gid)
+        if worker is None:
+            worker = min(range(self.n_workers), key=self.load.__getitem__)
+            self.assignment[gid] = worker
+            self.load[worker] += 1
+        if req.get("op") == "end":
+            del self.assignment[gid]
+            self.load[worker] -= 1
+        self.served[worker] += 1
+        self._inflight[gid] = self._inflight.get(gid, 0) + 1
+        rid = next(self._rids)
+        fut = self._loop.create_future()
+        self._pending[rid] = fut, gid
+        self._outgoing[worker].append({**req, "game": gid, "_rid": rid})
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self._loop.call_soon(self._flush)
+        return fut
+
+    def _flush(self):
+        self._flush_scheduled = False
+        for w, batch in enumerate(self._outgoing):
+            if batch:
+                self._inboxes[w].put(batch)
+                self._outgoing[w] = []
+
+    def _resolve(self, replies: List[Dict]):
+        evictions = []
+        for reply in replies:
+            rid = reply.pop("_rid")
+            if rid is None:
+                evictions.append(reply)
+                continue
+            fut, gid = self._pending.pop(rid, (None, None))
+            if gid is not None:
+                self._inflight[gid] -= 1
+                if not self._inflight[gid]:
+                    del self._inflight[gid]
+            if fut is not None and not fut.done():
+                fut.set_result(reply)
+        for ev in evictions:
+            for gid in ev["evicted"]:
+                # a request still in flight was sent after the eviction: the worker recreates the game
+                if self.assignment.get(gid) == ev["worker"] and gid not in self._inflight:
+                    del self.assignment[gid]
+                    self.load[ev["worker"]] -= 1
+
+    def _read_replies(self):
+        while True:
+            replies = self._outbox.get()
+            if replies is None:
+                return
+            self._loop.call_soon_threadsafe(self._resolve, replies)
+
+
+# ----- client -----
+
+class MoveClient:
+    """Blocking client, one request in flight at a time."""
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, timeout: Optional[float] = None):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self.sock.makefile("rwb")
+        self._ids = itertools.count()
+
+    def request(self, msg: Dict) -> Dict:
+        msg = {"id": next(self._ids), **msg}
+        self._file.write(json.dumps(msg).encode() + b"\n")
+        self._file.flush()
+        reply = json.loads(self._file.readline())
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply
+
+    def move(self, game: str, board, **options) -> Dict:
+        """options: agent / budget_ms (used on the game's first request)."""
+        return self.request({"game": game, "board": np.asarray(board).tolist(), **options})
+
+    def end(self, game: str) -> Dict:
+        return self.request({"op": "end", "game": game})
+
+    def stats(self) -> Dict:
+        return self.request({"op": "stats"})
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def play_remote(client: MoveClient, game_id: str, seed: Optional[int] = None, **options) -> Dict:
+    """Play one local game with moves from the server; returns score, max tile and moves."""
+    game = Game2048(seed=seed)
+    moves = 0
+    while not game.is_game_over():
+        reply = client.move(game_id, game.board, **options)
+        if reply["action"] is None:
+            break
+        game.step(reply["action"])
+        moves += 1
+    client.end(game_id)
+    return {"score": int(game.score), "max_tile": int(game.max_tile()), "moves": moves}
@@ -12,6 +12,15 @@ class RandomAgent:
             return LEFT
         return int(self.rng.choice(legals))
 
+    def select_actions(self, venv) -> np.ndarray:
+        """Batch version for a VecGame2048: one uniform legal move per game."""
+        legal = venv.legal_mask()
+        r = self.rng.random(legal.shape)
+        r[~legal] = -1.0
+        actions = np.argmax(r, axis=1)
+        actions[~legal.any(axis=1)] = LEFT
+        return actions
+
 
 class GreedyImmediateAgent:
     """Greedy agent that picks move with highest immediate merge reward."""
@@ -37,3 +46,17 @@ class GreedyImmediateAgent:
                 best = a
                 best_tuple = key
         return best if best is not None else LEFT
+
+    def select_actions(self, venv) -> np.ndarray:
+        """Batch version for a VecGame2048, same (reward, empties, corner) ordering and tie-breaks."""
+        after, rewards, changed = venv.peek_all()
+        empties = np.sum(after == 0, axis=(2, 3))
+        top = after.max(axis=(2, 3))
+        corners = np.stack([after[..., 0, 0], after[..., 0, 3], after[..., 3, 0], after[..., 3, 3]], axis=-1)
+        corner = np.any(corners == top[..., None], axis=-1)
+        # lexicographic (reward, empties, corner) as one integer; empties < 32, corner < 2
+        key = rewards * 64 + empties * 2 + corner
+        key = np.where(changed, key, -1)
+        actions = np.argmax(key, axis=0)
+        actions[~changed.any(axis=0)] = LEFT
+        return actions
@@ -0,0 +1,84 @@
+"""
+Breadth-first expectimax over whole frontiers of (N,4,4) boards.
+
+The agents hand a shallow chance node (depth 1 or 2) to chance_values_batch,
+which builds every spawn child at once, moves all of them with
+apply_move_batch and scores the frontier with a single evaluate_batch call
+(e.g. heuristics.heuristic_score_batch) instead of one Python call per node.
+Values follow the scalar search: 0.9/0.1 spawn weights per cell averaged over the
+(empty_cell_cap-subsampled) cells, and a board without legal moves scored by the
+evaluator.
+"""
+import numpy as np
+from typing import Callable, Optional, Tuple
+from game_engine import UP, DOWN, LEFT, RIGHT
+from bitboard import apply_move_batch
+
+ACTIONS = (UP, DOWN, LEFT, RIGHT)
+
+
+def spawn_children(boards: np.ndarray, empty_cell_cap: int, rng) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    All spawn children of a (K,4,4) stack of chance-node boards.
+    Returns (children, parent_index, weight); a parent's weights sum to 1. A board
+    with no empty cell is passed through as its own single child with weight 1.
+    """
+    k = len(boards)
+    flat = boards.reshape(k, 16)
+    mask = flat == 0
+    counts = mask.sum(axis=1)
+    if empty_cell_cap:
+        for p in np.nonzero(counts > empty_cell_cap)[0]:
+            cells = np.flatnonzero(mask[p])
+            idxs = rng.choice(len(cells), size=empty_cell_cap, replace=False)
+            mask[p] = False
+            mask[p, cells[idxs]] = True
+    scale = 1.0 / np.maximum(mask.sum(axis=1), 1)
+
+    parent, cell = np.nonzero(mask)
+    rows = np.arange(len(parent))
+    twos = flat[parent].copy(); twos[rows, cell] = 2
+    fours = flat[parent].copy(); fours[rows, cell] = 4
+    full = np.nonzero(counts == 0)[0]
+
+    children = np.concatenate([twos, fours, flat[full]]).reshape(-1, 4, 4)
+    parents = np.concatenate([parent, parent, full])
+    weights = np.concatenate([0.9 * scale[parent], 0.1 * scale[parent], np.ones(len(full))])
+    return children, parents, weights
+
+
+def max_values_batch(boards: np.ndarray, depth: int, empty_cell_cap: int, rng, gamma: float,
+                     evaluate_batch: Callable[[np.ndarray], np.ndarray], stats=None,
+                     dead_value: Optional[float] = None) -> np.ndarray:
+    """Values of max nodes at the given depth for a (M,4,4) stack; dead_value (if set) scores boards without a move."""
+    if stats is not None:
+        stats.add_nodes(depth, len(boards))
+    if depth <= 0 or len(boards) == 0:
+        return evaluate_batch(boards)
+
+    q = np.full((len(ACTIONS), len(boards)), -np.inf)
+    for i, a in enumerate(ACTIONS):
+        after, reward, changed = apply_move_batch(boards, a)
+        if changed.any():
+            v = chance_values_batch(after[changed], depth - 1, empty_cell_cap, rng, gamma, evaluate_batch, stats,
+                                    dead_value)
+            q[i, changed] = reward[changed] + gamma * v
+    best = q.max(axis=0)
+    stuck = np.isneginf(best)
+    if stuck.any():
+        best[stuck] = evaluate_batch(boards[stuck]) if dead_value is None else dead_value
+    return best
+
+
+def chance_values_batch(boards: np.ndarray, depth: int, empty_cell_cap: int, rng, gamma: float,
+                        evaluate_batch: Callable[[np.ndarray], np.ndarray], stats=None,
+                        dead_value: Optional[float] = None) -> np.ndarray:
+    """Values of chance nodes (afterstates) at the given depth for a (K,4,4) stack."""
+    if stats is not None:
+        stats.add_nodes(depth, len(boards))
+    if depth <= 0 or len(boards) == 0:
+        return evaluate_batch(boards)
+
+    children, parents, weights = spawn_children(boards, empty_cell_cap, rng)
+    v = max_values_batch(children, depth, empty_cell_cap, rng, gamma, evaluate_batch, stats, dead_value)
+    return np.bincount(parents, weights=weights * v, minlength=len(boards))
@@ -1,8 +1,6 @@
 import csv
-from agents import RandomAgent, GreedyImmediateAgent
-from evaluate import evaluate_agent
-from expectimax_agent import ExpectimaxAgent   
-import numpy as np
+from evaluate import game_seeds
+from experiments import run_grid, ExperimentCache
 
 def print_summary(title, res):
     print(f"\n=== {title} ===")
@@ -22,36 +20,30 @@ def save_csv(path, rows):
         w.writerows(rows)
     print(f"Saved CSV -> {path}")
 
-def collect_scores(agent, n_games=200, seed=123):
-    rng = np.random.default_rng(seed)
-    from evaluate import play_one_game
-    per_game = []
-    for idx in range(n_games):
-        s = int(rng.integers(0, 1_000_000_000))
-        out = play_one_game(agent, seed=s, verbose=False)
-        per_game.append({"score": out["score"], "max_tile": out["max_tile"]})
-        print(f"[{agent.__class__.__name__}] finished game {idx+1}/{n_games}")
-    return per_game
 
+def main(n=30, workers=1, cache_dir="experiments"):
+    """Summaries and score CSVs; missing games are played on 'workers' processes (<= 0: all cores)."""
+    # finished games are cached in cache_dir (see experiments.py): a rerun only
+    # plays the agents whose code or config changed
+    configs = {"random": {"agent": "random"}, "greedy": {"agent": "greedy"},
+               "expectimax_d3": {"agent": "expectimax", "depth": 3, "empty_cell_cap": 8}}
 
-
-if __name__ == "__main__":
-    N = 30
-
-    res_random = evaluate_agent(RandomAgent(), n_games=N, seed=7)
-    res_greedy = evaluate_agent(GreedyImmediateAgent(), n_games=N, seed=7)
-
-    ex = ExpectimaxAgent(depth=2, empty_cell_cap=6)
-    res_ex = evaluate_agent(ex, n_games=N, seed=7)
+    res_random, res_greedy, res_ex = run_grid(
+        [configs["random"], configs["greedy"], {"agent": "expectimax", "depth": 2, "empty_cell_cap": 6}],
+        game_seeds(n, 7), cache_dir=cache_dir, workers=workers)
 
     print_summary("RandomAgent", res_random)
     print_summary("GreedyImmediateAgent", res_greedy)
-    print_summary("Expectimax(depth=3)", res_ex)
+    print_summary("Expectimax(depth=2)", res_ex)
+
+    seeds = game_seeds(n, 99)
+    run_grid(list(configs.values()), seeds, cache_dir=cache_dir, workers=workers)
+    cache = ExperimentCache(cache_dir)
+    for name, config in configs.items():
+        games = cache.load(config)
+        save_csv(f"scores_{name}.csv", [{"score": games[s]["score"], "max_tile": games[s]["max_tile"], "agent": name}
+                                        for s in seeds])
 
-    rows_r = collect_scores(RandomAgent(), n_games=N, seed=99);  [r.update({"agent":"random"}) for r in rows_r]
-    rows_g = collect_scores(GreedyImmediateAgent(), n_games=N, seed=99);  [r.update({"agent":"greedy"}) for r in rows_g]
-    rows_e = collect_scores(ExpectimaxAgent(depth=3, empty_cell_cap=8), n_games=N, seed=99);  [r.update({"agent":"expectimax_d3"}) for r in rows_e]
 
-    save_csv("scores_random.csv", rows_r)
-    save_csv("scores_greedy.csv", rows_g)
-    save_csv("scores_expectimax_d3.csv", rows_e)
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,21 @@
 from game_engine import Game2048, ACTION_NAMES
 from expectimax_tc_agent import ExpectimaxTimeControlled
 
-def run(seed=0, budget_ms=50):
+def run(seed=0, budget_ms=50, workers=1, parallel="root"):
     g = Game2048(seed=seed)
-    a = ExpectimaxTimeControlled(timer_budget_sec=budget_ms/1000.0, empty_cell_cap=8)
+    a = ExpectimaxTimeControlled(timer_budget_sec=budget_ms/1000.0, empty_cell_cap=8,
+                                 workers=workers, parallel=parallel)
     moves = 0
     while not g.is_game_over():
         act = a.select_action(g)
         _, r, done, _ = g.step(act)
         moves += 1
         if done: break
+    a.close()
     print({
         "seed": seed,
         "budget_ms": budget_ms,
+        "workers": workers,
         "score": g.score,
         "max_tile": g.max_tile(),
         "moves": moves
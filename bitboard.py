@@ -0,0 +1,264 @@
+"""
+Packed 64-bit board representation.
+
+Cell (i, j) is stored as a 4-bit tile exponent (0 = empty, 1 = 2, 2 = 4, ...)
+at nibble 4*i + j, so row i occupies bits [16*i, 16*i + 16).
+LEFT moves tiles towards column 0 (the low nibble of each row).
+Moves are four lookups into 65536-entry row tables; UP/DOWN transpose first.
+Exponents are capped at 15 (tile 32768): two 32768 tiles are not merged.
+"""
+import numpy as np
+from typing import List, Tuple
+from game_engine import UP, DOWN, LEFT, RIGHT
+
+ACTIONS = (UP, DOWN, LEFT, RIGHT)
+ROW_MASK = 0xFFFF
+_SHIFTS = np.arange(16, dtype=np.uint64) * np.uint64(4)
+
+
+def _reverse_row(r: int) -> int:
+    return ((r & 0xF) << 12) | (((r >> 4) & 0xF) << 8) | (((r >> 8) & 0xF) << 4) | (r >> 12)
+
+
+def _build_row_tables():
+    left = np.zeros(65536, dtype=np.uint16)
+    right = np.zeros(65536, dtype=np.uint16)
+    score_left = np.zeros(65536, dtype=np.int64)
+    score_right = np.zeros(65536, dtype=np.int64)
+
+    for r in range(65536):
+        cells = [(r >> (4 * j)) & 0xF for j in range(4)]
+        non_zero = [c for c in cells if c != 0]
+        merged, gain, i = [], 0, 0
+        while i < len(non_zero):
+            if i + 1 < len(non_zero) and non_zero[i] == non_zero[i+1] and non_zero[i] < 15:
+                merged.append(non_zero[i] + 1)
+                gain += 1 << (non_zero[i] + 1)
+                i += 2
+            else:
+                merged.append(non_zero[i])
+                i += 1
+        out = 0
+        for j, c in enumerate(merged):
+            out |= c << (4 * j)
+        left[r] = out
+        score_left[r] = gain
+
+    for r in range(65536):
+        rev = _reverse_row(r)
+        right[r] = _reverse_row(int(left[rev]))
+        score_right[r] = score_left[rev]
+    return left, right, score_left, score_right
+
+
+ROW_LEFT, ROW_RIGHT, ROW_SCORE_LEFT, ROW_SCORE_RIGHT = _build_row_tables()
+
+# Plain-list copies: indexing a list with a Python int is much cheaper than a NumPy scalar lookup.
+_LEFT = ROW_LEFT.tolist()
+_RIGHT = ROW_RIGHT.tolist()
+_SCORE_LEFT = ROW_SCORE_LEFT.tolist()
+_SCORE_RIGHT = ROW_SCORE_RIGHT.tolist()
+
+
+def transpose(b: int) -> int:
+    """Swap nibble (i, j) with nibble (j, i)."""
+    a1 = b & 0xF0F00F0FF0F00F0F
+    a2 = b & 0x0000F0F00000F0F0
+    a3 = b & 0x0F0F00000F0F0000
+    a = a1 | (a2 << 12) | (a3 >> 12)
+    b1 = a & 0xFF00FF0000FF00FF
+    b2 = a & 0x00FF00FF00000000
+    b3 = a & 0x00000000FF00FF00
+    return b1 | (b2 >> 24) | (b3 << 24)
+
+
+# ----- dihedral symmetries -----
+
+_REVERSE = [_reverse_row(r) for r in range(65536)]
+
+
+def flip_lr(b: int) -> int:
+    """Mirror columns (j -> 3 - j)."""
+    return (_REVERSE[b & ROW_MASK] | (_REVERSE[(b >> 16) & ROW_MASK] << 16)
+            | (_REVERSE[(b >> 32) & ROW_MASK] << 32) | (_REVERSE[(b >> 48) & ROW_MASK] << 48))
+
+
+def flip_ud(b: int) -> int:
+    """Mirror rows (i -> 3 - i)."""
+    return ((b >> 48) | ((b >> 16) & 0xFFFF0000) | ((b << 16) & 0xFFFF00000000)
+            | ((b << 48) & 0xFFFF000000000000))
+
+
+def symmetries(b: int) -> Tuple[int, ...]:
+    """The board under all 8 rotations/reflections (identity first)."""
+    h = flip_lr(b)
+    t = transpose(b)
+    th = flip_lr(t)
+    return (b, h, flip_ud(b), flip_ud(h), t, th, flip_ud(t), flip_ud(th))
+
+
+def canonical(b: int) -> int:
+    """Smallest packed value among the 8 symmetric boards: equal for all of them."""
+    return min(symmetries(b))
+
+
+def _symmetry_actions():
+    lr = {UP: UP, DOWN: DOWN, LEFT: RIGHT, RIGHT: LEFT}
+    ud = {UP: DOWN, DOWN: UP, LEFT: LEFT, RIGHT: RIGHT}
+    tr = {UP: LEFT, LEFT: UP, DOWN: RIGHT, RIGHT: DOWN}
+    # the flips / transpose making up symmetries()[k], in the order they are applied
+    ops = ((), (lr,), (ud,), (lr, ud), (tr,), (tr, lr), (tr, ud), (tr, lr, ud))
+    forward = []
+    for seq in ops:
+        row = []
+        for a in range(4):
+            for op in seq:
+                a = op[a]
+            row.append(a)
+        forward.append(tuple(row))
+    inverse = [tuple(row.index(a) for a in range(4)) for row in forward]
+    return tuple(forward), tuple(inverse)
+
+
+# SYMMETRY_ACTIONS[k][a]: the move on symmetries(b)[k] that corresponds to move a on b,
+# i.e. symmetries(move(b, a))[k] == move(symmetries(b)[k], SYMMETRY_ACTIONS[k][a]);
+# INVERSE_SYMMETRY_ACTIONS[k] maps moves on symmetries(b)[k] back to moves on b.
+SYMMETRY_ACTIONS, INVERSE_SYMMETRY_ACTIONS = _symmetry_actions()
+
+
+def canonical_with_index(b: int) -> Tuple[int, int]:
+    """(canonical(b), k) with symmetries(b)[k] the canonical board."""
+    syms = symmetries(b)
+    c = min(syms)
+    return c, syms.index(c)
+
+
+def _move_rows(b: int, table, score) -> Tuple[int, int]:
+    r0 = b & ROW_MASK
+    r1 = (b >> 16) & ROW_MASK
+    r2 = (b >> 32) & ROW_MASK
+    r3 = (b >> 48) & ROW_MASK
+    out = table[r0] | (table[r1] << 16) | (table[r2] << 32) | (table[r3] << 48)
+    return out, score[r0] + score[r1] + score[r2] + score[r3]
+
+
+def move(b: int, action: int) -> Tuple[int, int]:
+    """Apply action to a packed board (without spawning). Returns (new_board, merge_reward)."""
+    if action == LEFT:
+        return _move_rows(b, _LEFT, _SCORE_LEFT)
+    if action == RIGHT:
+        return _move_rows(b, _RIGHT, _SCORE_RIGHT)
+    if action == UP:
+        out, reward = _move_rows(transpose(b), _LEFT, _SCORE_LEFT)
+        return transpose(out), reward
+    if action == DOWN:
+        out, reward = _move_rows(transpose(b), _RIGHT, _SCORE_RIGHT)
+        return transpose(out), reward
+    raise ValueError(f"Invalid action: {action}")
+
+
+def apply_move(b: int, action: int) -> Tuple[int, int, bool]:
+    """Packed counterpart of apply_move_on_board: returns (new_board, merge_reward, changed)."""
+    out, reward = move(b, action)
+    return out, reward, out != b
+
+
+def successors(b: int) -> List[Tuple[int, int, int]]:
+    """(action, child, merge_reward) for every legal move, in ACTIONS order; one transpose for UP/DOWN."""
+    out = []
+    t = transpose(b)
+    up, r = _move_rows(t, _LEFT, _SCORE_LEFT)
+    if up != t: out.append((UP, transpose(up), r))
+    down, r = _move_rows(t, _RIGHT, _SCORE_RIGHT)
+    if down != t: out.append((DOWN, transpose(down), r))
+    left, r = _move_rows(b, _LEFT, _SCORE_LEFT)
+    if left != b: out.append((LEFT, left, r))
+    right, r = _move_rows(b, _RIGHT, _SCORE_RIGHT)
+    if right != b: out.append((RIGHT, right, r))
+    return out
+
+
+def legal_moves(b: int) -> List[int]:
+    return [a for a, _, _ in successors(b)]
+
+
+def empty_cells(b: int) -> List[int]:
+    """Nibble indices (4*i + j) of the empty cells."""
+    return [k for k in range(16) if not (b >> (4 * k)) & 0xF]
+
+
+def count_empty(b: int) -> int:
+    return sum(1 for k in range(16) if not (b >> (4 * k)) & 0xF)
+
+
+def place_tile(b: int, cell: int, value: int) -> int:
+    """Put a tile of the given value (2 or 4) into an empty cell."""
+    return b | ((value.bit_length() - 1) << (4 * cell))
+
+
+def max_tile(b: int) -> int:
+    e = max((b >> (4 * k)) & 0xF for k in range(16))
+    return (1 << e) if e else 0
+
+
+# ----- conversion to / from np.ndarray boards -----
+
+def to_bitboard(board: np.ndarray) -> int:
+    """Pack a (4,4) board of tile values into a 64-bit integer."""
+    out = 0
+    for k, v in enumerate(board.ravel().tolist()):
+        if v:
+            out |= (int(v).bit_length() - 1) << (4 * k)
+    return out
+
+
+def from_bitboard(b: int) -> np.ndarray:
+    """Unpack a 64-bit board into a (4,4) int64 array of tile values."""
+    exps = ((np.uint64(b) >> _SHIFTS) & np.uint64(0xF)).astype(np.int64)
+    return np.where(exps > 0, np.left_shift(1, exps), 0).reshape(4, 4)
+
+
+def apply_move_array(board: np.ndarray, action: int) -> Tuple[np.ndarray, int]:
+    """Drop-in for Game2048._apply_move that goes through the row tables."""
+    out, reward = move(to_bitboard(board), action)
+    return from_bitboard(out).astype(board.dtype, copy=False), reward
+
+
+# ----- batched moves on (N,4,4) arrays -----
+
+_NIBBLE_SHIFTS = np.arange(4, dtype=np.int64) * 4
+
+
+def _exponents(boards: np.ndarray) -> np.ndarray:
+    exps = np.zeros(boards.shape, dtype=np.int64)
+    nz = boards > 0
+    exps[nz] = np.log2(boards[nz]).astype(np.int64)
+    return exps
+
+
+def _move_rows_batch(exps: np.ndarray, table: np.ndarray, score: np.ndarray):
+    codes = np.sum(exps << _NIBBLE_SHIFTS, axis=-1)          # (N,4) row codes
+    new = table[codes].astype(np.int64)
+    out = (new[..., None] >> _NIBBLE_SHIFTS) & 0xF
+    return out, score[codes].sum(axis=-1)
+
+
+def apply_move_batch(boards: np.ndarray, action: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Batched apply_move_on_board for a stack of (N,4,4) tile-value boards.
+    Returns (new_boards, merge_rewards, changed) with shapes (N,4,4), (N,), (N,).
+    """
+    exps = _exponents(boards)
+    if action in (UP, DOWN):
+        exps = exps.transpose(0, 2, 1)
+    if action in (LEFT, UP):
+        out, reward = _move_rows_batch(exps, ROW_LEFT, ROW_SCORE_LEFT)
+    elif action in (RIGHT, DOWN):
+        out, reward = _move_rows_batch(exps, ROW_RIGHT, ROW_SCORE_RIGHT)
+    else:
+        raise ValueError(f"Invalid action: {action}")
+    if action in (UP, DOWN):
+        out = out.transpose(0, 2, 1)
+    new_boards = np.where(out > 0, np.left_shift(1, out), 0).astype(boards.dtype, copy=False)
+    changed = np.any(new_boards != boards, axis=(1, 2))
+    return new_boards, reward, changed
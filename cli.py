@@ -1,6 +1,6 @@
 import argparse
 from game_engine import Game2048, ACTION_NAMES, UP, DOWN, LEFT, RIGHT
-from agents import RandomAgent, GreedyImmediateAgent
+from agent_server import AGENTS, DEFAULT_PORT, AgentServer, make_agent
 
 KEY_TO_ACTION = {"w": UP, "s": DOWN, "a": LEFT, "d": RIGHT}
 
@@ -20,8 +20,8 @@ def human_loop(seed=None):
             print("Game over!")
             break
 
-def agent_loop(agent_name="greedy", seed=None, verbose=False):
-    agent = RandomAgent() if agent_name == "random" else GreedyImmediateAgent()
+def agent_loop(agent_name="greedy", seed=None, verbose=False, budget_ms=20.0):
+    agent = make_agent(agent_name, budget_ms)
     game = Game2048(seed=seed)
     if verbose:
         game.render()
@@ -37,13 +37,24 @@ def agent_loop(agent_name="greedy", seed=None, verbose=False):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("--mode", choices=["human", "agent"], default="agent")
-    parser.add_argument("--agent", choices=["random", "greedy"], default="greedy")
+    parser.add_argument("--mode", choices=["human", "agent", "serve"], default="agent")
+    parser.add_argument("--agent", choices=AGENTS, default=None,
+                        help="agent to play (default greedy) or to serve by default (default expectimax_tc)")
     parser.add_argument("--seed", type=int, default=42)
     parser.add_argument("--verbose", action="store_true")
+    parser.add_argument("--budget-ms", type=float, default=20.0, help="per-move time of expectimax_tc / montecarlo")
+    parser.add_argument("--host", default="127.0.0.1", help="serve mode: address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="serve mode: port to listen on")
+    parser.add_argument("--workers", type=int, default=1, help="serve mode: search processes")
+    parser.add_argument("--max-games", type=int, default=64,
+                        help="serve mode: resident games per worker (4 MB of transposition table each)")
     args = parser.parse_args()
 
     if args.mode == "human":
         human_loop(seed=args.seed)
+    elif args.mode == "serve":
+        AgentServer(args.host, args.port, args.workers, args.agent or "expectimax_tc", args.budget_ms,
+                    args.max_games).serve_forever()
     else:
-        agent_loop(agent_name=args.agent, seed=args.seed, verbose=args.verbose)
+        agent_loop(agent_name=args.agent or "greedy", seed=args.seed, verbose=args.verbose,
+                   budget_ms=args.budget_ms)
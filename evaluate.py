@@ -1,31 +1,129 @@
+import copy
+import os
+import time
 import numpy as np
-from typing import Dict, Any
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Any, List, Optional, Callable
 from game_engine import Game2048
 from agents import RandomAgent, GreedyImmediateAgent
+from vec_game import VecGame2048
+from trajectory import GameTrajectory, TrajectoryWriter
 
-def play_one_game(agent, seed=None, verbose=False) -> Dict[str, Any]:
+def play_one_game(agent, seed=None, verbose=False, recorder=None) -> Dict[str, Any]:
+    """recorder (e.g. trajectory.TrajectoryWriter) gets record(board, action, reward, spawn) per move and end_game(board, seed)."""
     game = Game2048(seed=seed)
     if verbose:
         game.render()
-    while not game.is_game_over():
+    done = game.is_game_over()
+    while not done:
         action = agent.select_action(game)
+        before = game.board.copy() if recorder is not None else None
         board, reward, done, info = game.step(action)
+        if recorder is not None:
+            recorder.record(before, action, reward, game.last_spawn)
         if verbose:
             print(f"Move reward: {reward}")
             game.render()
-        if done:
-            break
+    if recorder is not None:
+        recorder.end_game(game.board, seed)
     return {"score": game.score, "max_tile": game.max_tile()}
 
-def evaluate_agent(agent, n_games=100, seed=123) -> Dict[str, Any]:
+def game_seeds(n_games, seed=123) -> List[int]:
+    """Per-game seeds drawn exactly as the serial evaluation loops always did."""
     rng = np.random.default_rng(seed)
-    scores, max_tiles = [], []
-    for _ in range(n_games):
-        s = int(rng.integers(0, 1_000_000_000))
-        result = play_one_game(agent, seed=s)
-        scores.append(result["score"])
-        max_tiles.append(result["max_tile"])
+    return [int(rng.integers(0, 1_000_000_000)) for _ in range(n_games)]
+
+def play_seeded_game(agent, seed, record=False) -> Dict[str, Any]:
+    """
+    Play one game with a fresh copy of agent whose rng (if any) is seeded by the game seed,
+    so the result depends only on (agent config, seed) - not on which process or in
+    which order the game was played. Agents built with telemetry=True also return
+    their per-move records under "trace"; record=True returns the game's
+    trajectory.GameTrajectory under "trajectory".
+    """
+    agent = copy.deepcopy(agent)
+    if hasattr(agent, "rng"):
+        agent.rng = np.random.default_rng(seed)
+    if getattr(agent, "trace", None) is not None:
+        agent.trace = []
+    recorder = GameTrajectory() if record else None
+    t0 = time.perf_counter()
+    result = play_one_game(agent, seed=seed, recorder=recorder)
+    if recorder is not None:
+        result["trajectory"] = recorder
+    result.update({"seed": seed, "time_sec": time.perf_counter() - t0})
+    if getattr(agent, "trace", None) is not None:
+        result["trace"] = agent.trace   # per-move SearchStats records (telemetry=True agents)
+    return result
+
+_worker_agent = None
+
+def _init_worker(agent):
+    global _worker_agent
+    _worker_agent = agent
+
+def _play_in_worker(seed, record=False):
+    return play_seeded_game(_worker_agent, seed, record)
+
+def play_games(agent, seeds, workers=1, progress: Optional[Callable] = None,
+               record_path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Play one game per seed and return the results in seed order.
+    - workers > 1 spreads games over a process pool (workers <= 0 uses all cores);
+      results are identical to workers=1 for the same seeds.
+    - progress(n_done, n_total, result) is called as each game finishes.
+    - record_path appends every game (in completion order, with its seed) to a
+      trajectory.TrajectoryWriter store at that directory.
+    """
+    seeds = list(seeds)
+    if workers is not None and workers <= 0:
+        workers = os.cpu_count() or 1
+    record = record_path is not None
+    writer = TrajectoryWriter(record_path) if record else None
+    results: List[Optional[Dict[str, Any]]] = [None] * len(seeds)
+
+    def finish(i, result, n_done):
+        if writer is not None:
+            writer.append_game(result.pop("trajectory"))
+        results[i] = result
+        if progress: progress(n_done, len(seeds), result)
+
+    try:
+        if not workers or workers == 1:
+            for i, s in enumerate(seeds):
+                finish(i, play_seeded_game(agent, s, record), i + 1)
+            return results
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(agent,)) as pool:
+            futures = {pool.submit(_play_in_worker, s, record): i for i, s in enumerate(seeds)}
+            for n_done, fut in enumerate(as_completed(futures), start=1):
+                finish(futures[fut], fut.result(), n_done)
+        return results
+    finally:
+        if writer is not None:
+            writer.close()
+
+def play_vectorized(agent, n_games=100, seed=123):
+    """
+    Play n_games in lockstep with a VecGame2048; the agent needs select_actions(venv).
+    Spawns come from one RNG stream, so games differ from play_one_game's per-seed games.
+    Returns (scores, max_tiles) arrays.
+    """
+    venv = VecGame2048(n_games, seed=seed, auto_reset=False)
+    scores = np.zeros(n_games, dtype=np.int64)
+    max_tiles = np.zeros(n_games, dtype=np.int64)
+    finished = ~venv.legal_mask().any(axis=1)
+    scores[finished], max_tiles[finished] = venv.scores[finished], venv.max_tiles()[finished]
+    while not finished.all():
+        _, _, dones, info = venv.step(agent.select_actions(venv))
+        new = dones & ~finished
+        scores[new], max_tiles[new] = venv.scores[new], venv.max_tiles()[new]
+        finished |= dones
+    return scores, max_tiles
+
+def summarize(scores, max_tiles) -> Dict[str, Any]:
     scores, max_tiles = np.array(scores), np.array(max_tiles)
+    n_games = len(scores)
     return {
         "games": n_games,
         "avg_score": float(np.mean(scores)),
@@ -35,6 +133,19 @@ def evaluate_agent(agent, n_games=100, seed=123) -> Dict[str, Any]:
         "best_tile_hist": {int(v): int(np.sum(max_tiles == v)) for v in np.unique(max_tiles)},
     }
 
+def evaluate_agent(agent, n_games=100, seed=123, vectorized=False, workers=1, progress=None,
+                   record_path=None) -> Dict[str, Any]:
+    """
+    vectorized=True plays all games at once through agent.select_actions (see play_vectorized);
+    otherwise games are played per seed, on 'workers' processes (see play_games), and
+    record_path stores their trajectories.
+    """
+    if vectorized:
+        return summarize(*play_vectorized(agent, n_games=n_games, seed=seed))
+    results = play_games(agent, game_seeds(n_games, seed), workers=workers, progress=progress,
+                         record_path=record_path)
+    return summarize([r["score"] for r in results], [r["max_tile"] for r in results])
+
 if __name__ == "__main__":
     print("RandomAgent results:")
     ra = RandomAgent()
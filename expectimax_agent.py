@@ -1,7 +1,11 @@
+import time
 import numpy as np
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple, Optional
 from game_engine import UP, DOWN, LEFT, RIGHT, ACTION_NAMES, _slide_and_merge
-from heuristics import heuristic_score
+from heuristics import heuristic_score, heuristic_score_packed, heuristic_score_batch
+import bitboard
+from batch_search import chance_values_batch
+from search_utils import TranspositionTable, SearchStats, instrument
 
 ACTIONS = (UP, DOWN, LEFT, RIGHT)
 
@@ -40,101 +44,259 @@ def apply_move_on_board(board: np.ndarray, action: int) -> Tuple[np.ndarray, int
     changed = not np.array_equal(out, b)
     return out, reward, changed
 
-def legal_moves_for_board(board: np.ndarray):
+def legal_moves_for_board(board: np.ndarray, simulate_move_fn=apply_move_on_board):
     legals = []
     for a in ACTIONS:
-        _, _, changed = apply_move_on_board(board, a)
+        _, _, changed = simulate_move_fn(board, a)
         if changed:
             legals.append(a)
     return legals
 
+def successors_for_board(board: np.ndarray, simulate_move_fn=apply_move_on_board):
+    """(action, child, merge_reward) for every legal move: each child is computed once per node."""
+    succs = []
+    for a in ACTIONS:
+        child, reward, changed = simulate_move_fn(board, a)
+        if changed:
+            succs.append((a, child, reward))
+    return succs
+
+def empty_cells_on_board(board: np.ndarray):
+    return [tuple(c) for c in np.argwhere(board == 0)]
+
+def place_tile_on_board(board: np.ndarray, cell, value: int) -> np.ndarray:
+    b = board.copy()
+    b[cell] = value
+    return b
+
 
 class ExpectimaxAgent:
     """
     Depth-limited Expectimax with a composite heuristic at leaves.
-    - Chance nodes enumerate empty cells and spawn {2,4} with probs {0.9, 0.1}.
+    - Chance nodes enumerate empty cells and spawn {2,4} with probs {0.9, 0.1}; their value
+      is the expectation (mean over the searched cells), so values of every depth share one scale.
     - Optional 'empty_cell_cap' subsamples empties to curb branching when the board is very open.
     - Caching by (board_bytes, is_max_turn, depth) to avoid recomputation.
+    - 'use_bitboard' searches on packed 64-bit boards (bitboard.py) instead of arrays;
+      leaves are then scored with the table-driven heuristic_score_packed.
+    - 'weights' overrides the heuristic weight dict (heuristics.DEFAULT_WEIGHTS).
+    - 'tt': optional search_utils.TranspositionTable kept across moves; entries are
+      reused when their searched depth equals the requested depth. An
+      ArrayTranspositionTable caps its memory (needs use_bitboard or symmetric keys).
+    - 'batch_chance' evaluates chance nodes of depth <= 2 breadth-first on whole
+      (N,4,4) frontiers (batch_search.py) instead of node by node.
+    - 'prob_threshold' replaces empty-cell subsampling by a cutoff on the probability of
+      the path (0.9/0.1 spawn odds times 1/E cell odds): chance nodes reached with a lower
+      probability are scored by the heuristic instead of searched.
+    - 'max_fours' caps the number of 4-spawns searched along one path; further 4-spawn
+      children are scored by the heuristic. With either of these two options a node's value
+      depends on the path to it, so nothing is cached (nor stored in 'tt').
+    - 'symmetric' scores leaves with the rotation/reflection-invariant heuristic and keys the
+      cache by the canonical board among its 8 symmetries, so symmetric positions share entries.
+    - 'stats' (search_utils.SearchStats) holds the node and cache hit counts of the last move.
+    - 'evaluator' replaces the heuristic at the leaves by a learned value with value(board),
+      value_packed(b) and value_batch(boards), e.g. ntuple.NTupleNetwork or
+      value_estimator.LinearValueModel; boards without a legal move are then worth 0 unless the
+      evaluator sets zero_at_terminal = False. With batch_chance the leaf frontiers below depth-2
+      chance nodes are scored by one value_batch call each.
+    - 'telemetry' times move generation / evaluation (search_utils.instrument) and appends
+      every move's stats.to_dict() to self.trace (see search_utils.write_trace_jsonl).
+    - 'book': opening_book.OpeningBook probed before searching; a hit plays the book move
+      (stats.book_hit, stats.completed_depth = the book's search depth). Its 'symmetric'
+      setting must match the agent's.
+    - last_value: value of the chosen move in the last search (or its book value);
+      root_values: every legal move's value in the last search (empty after a book move).
     """
-    def __init__(self, depth: int = 3, empty_cell_cap: int = 6, rng=None, gamma: float = 1.0):
+    def __init__(self, depth: int = 3, empty_cell_cap: int = 6, rng=None, gamma: float = 1.0,
+                 use_bitboard: bool = False, weights=None, tt: Optional[TranspositionTable] = None,
+                 batch_chance: bool = False, prob_threshold: Optional[float] = None,
+                 max_fours: Optional[int] = None, symmetric: bool = False, telemetry: bool = False,
+                 evaluator=None, book=None):
         self.depth = depth
         self.empty_cell_cap = empty_cell_cap
         self.rng = rng or np.random.default_rng()
         self.gamma = gamma
-        self.cache: Dict[Tuple[bytes, bool, int], float] = {}
+        self.use_bitboard = use_bitboard
+        self.weights = weights
+        self.cache: Dict[Tuple[object, bool, int], float] = {}
+        self.tt = tt
+        if getattr(tt, "needs_packed_keys", False) and not (use_bitboard or symmetric):
+            raise ValueError(f"{type(tt).__name__} needs packed board keys: use use_bitboard=True or symmetric=True")
+        self.batch_chance = batch_chance
+        self.prob_threshold = prob_threshold
+        self.max_fours = max_fours
+        self.symmetric = symmetric
+        self.evaluator = evaluator
+        self.book = book
+        if book is not None and book.symmetric != bool(symmetric):
+            raise ValueError(f"opening book was built with symmetric={book.symmetric}, agent has symmetric={bool(symmetric)}")
+        self.last_value = None
+        self.root_values: Dict[int, float] = {}
+        self.stats = SearchStats()
+        if use_bitboard:
+            self._apply, self._empties, self._place = bitboard.apply_move, bitboard.empty_cells, bitboard.place_tile
+            self._successors = bitboard.successors
+        else:
+            self._apply, self._empties, self._place = apply_move_on_board, empty_cells_on_board, place_tile_on_board
+            self._successors = successors_for_board
+        self.trace: Optional[List[dict]] = [] if telemetry else None
+        if telemetry:
+            instrument(self)
 
-    def select_action(self, game) -> int:
-        self.cache.clear()
+    def _key(self, board):
+        if self.symmetric:
+            return bitboard.canonical(board if self.use_bitboard else bitboard.to_bitboard(board))
+        return board if self.use_bitboard else board.tobytes()
+
+    def _evaluate(self, board) -> float:
+        if self.evaluator is not None:
+            return self.evaluator.value_packed(board) if self.use_bitboard else self.evaluator.value(board)
+        if self.use_bitboard:
+            return heuristic_score_packed(board, self.weights, self.symmetric)
+        return heuristic_score(board, self.weights, self.symmetric)
+
+    def _evaluate_batch(self, boards: np.ndarray) -> np.ndarray:
+        if self.evaluator is not None:
+            return self.evaluator.value_batch(boards)
+        return heuristic_score_batch(boards, self.weights, self.symmetric)
+
+    def _dead_value(self, board) -> float:
+        # a learned value predicts the reward still to come: none once no move is legal
+        # (unless the evaluator opts out with zero_at_terminal = False, e.g. a fit of search values)
+        return 0.0 if self._zero_at_terminal() else self._evaluate(board)
 
+    def _zero_at_terminal(self) -> bool:
+        return self.evaluator is not None and getattr(self.evaluator, "zero_at_terminal", True)
 
-        board = game.board.copy()
+    def _expect_batch(self, board, depth: int) -> float:
+        boards = (bitboard.from_bitboard(board) if self.use_bitboard else board)[None]
+        return float(chance_values_batch(boards, depth, self.empty_cell_cap, self.rng, self.gamma,
+                                         self._evaluate_batch, self.stats,
+                                         0.0 if self._zero_at_terminal() else None)[0])
+
+    def _path_dependent(self) -> bool:
+        # with a probability cutoff or a 4-spawn cap a node's value depends on the path to it
+        # (its probability, the 4-spawns so far), which cache keys leave out: cache nothing then
+        return self.prob_threshold is not None or self.max_fours is not None
+
+    def _lookup(self, board, is_max: bool, depth: int):
+        if self._path_dependent():
+            return None
+        self.stats.tt_probes += 1
+        if self.tt is not None:
+            v = self.tt.get((self._key(board), is_max), depth)
+        else:
+            v = self.cache.get((self._key(board), is_max, depth))
+        if v is not None:
+            self.stats.tt_hits += 1
+        return v
+
+    def _store(self, board, is_max: bool, depth: int, v: float):
+        if self._path_dependent():
+            return
+        self.stats.tt_puts += 1
+        if self.tt is not None:
+            self.tt.put((self._key(board), is_max), depth, v)
+        else:
+            self.cache[(self._key(board), is_max, depth)] = v
+
+    def select_action(self, game) -> int:
+        if self.tt is not None:
+            self.tt.new_search()
+        else:
+            self.cache.clear()
+        self.stats = SearchStats()
+        t0 = time.perf_counter()
+
+        board = bitboard.to_bitboard(game.board) if self.use_bitboard else game.board.copy()
         best_a, best_v = None, -float("inf")
+        self.root_values = {}
 
-        for a in ACTIONS:
-            child, reward, changed = apply_move_on_board(board, a)
-            if not changed:
-                continue
-            v = reward + self.gamma * self._expect_value(child, depth=self.depth-1)
-            if v > best_v:
-                best_v, best_a = v, a
+        hit = self.book.probe(board) if self.book is not None else None
+        if hit is not None:
+            best_a, best_v, self.stats.completed_depth = hit     # depth of the offline search
+            self.stats.book_hit = True
+        else:
+            for a, child, reward in self._successors(board):
+                v = reward + self.gamma * self._expect_value(child, depth=self.depth-1)
+                self.root_values[a] = v
+                if v > best_v:
+                    best_v, best_a = v, a
+            self.stats.completed_depth = self.depth
 
+        self.last_value = best_v if best_a is not None else None
+        self.stats.elapsed_sec = time.perf_counter() - t0
+        if self.trace is not None:
+            self.trace.append(self.stats.to_dict())
         return best_a if best_a is not None else UP
 
 
-    def _max_value(self, board: np.ndarray, depth: int) -> float:
-        key = (board.tobytes(), True, depth)
-        if key in self.cache:
-            return self.cache[key]
+    def _max_value(self, board, depth: int, prob: float = 1.0, fours: int = 0) -> float:
+        self.stats.bump(depth)
+        cached = self._lookup(board, True, depth)
+        if cached is not None:
+            return cached
         if depth <= 0:
-            v = heuristic_score(board)
-            self.cache[key] = v
+            v = self._evaluate(board)
+            self._store(board, True, depth, v)
             return v
 
-        legals = legal_moves_for_board(board)
-        if not legals:
-            v = heuristic_score(board)
-            self.cache[key] = v
+        succs = self._successors(board)
+        if not succs:
+            v = self._dead_value(board)
+            self._store(board, True, depth, v)
             return v
 
         best = -float("inf")
-        for a in legals:
-            child, reward, _ = apply_move_on_board(board, a)
-            v = reward + self.gamma * self._expect_value(child, depth - 1)
+        for a, child, reward in succs:
+            v = reward + self.gamma * self._expect_value(child, depth - 1, prob, fours)
             if v > best:
                 best = v
 
-        self.cache[key] = best
+        self._store(board, True, depth, best)
         return best
 
-    def _expect_value(self, board: np.ndarray, depth: int) -> float:
-        key = (board.tobytes(), False, depth)
-        if key in self.cache:
-            return self.cache[key]
+    def _expect_value(self, board, depth: int, prob: float = 1.0, fours: int = 0) -> float:
+        self.stats.bump(depth)
+        cached = self._lookup(board, False, depth)
+        if cached is not None:
+            return cached
         if depth <= 0:
-            v = heuristic_score(board)
-            self.cache[key] = v
+            v = self._evaluate(board)
+            self._store(board, False, depth, v)
+            return v
+
+        if self.prob_threshold is not None and prob < self.prob_threshold:
+            # improbable branch: score it, but do not cache it as a searched value
+            return self._evaluate(board)
+
+        if self.batch_chance and depth <= 2:
+            v = self._expect_batch(board, depth)
+            self._store(board, False, depth, v)
             return v
 
-        empties = np.argwhere(board == 0)
-        if empties.size == 0:
-            v = self._max_value(board, depth)
-            self.cache[key] = v
+        empties = self._empties(board)
+        if not empties:
+            v = self._max_value(board, depth, prob, fours)
+            self._store(board, False, depth, v)
             return v
 
         cells = empties
-        if self.empty_cell_cap and len(empties) > self.empty_cell_cap:
+        if self.prob_threshold is None and self.empty_cell_cap and len(empties) > self.empty_cell_cap:
             idxs = self.rng.choice(len(empties), size=self.empty_cell_cap, replace=False)
-            cells = empties[idxs]
+            cells = [empties[i] for i in idxs]
 
+        cell_prob = prob / len(empties)
         exp_val = 0.0
-        for (i, j) in cells:
-            b2 = board.copy(); b2[i, j] = 2
-            exp_val += 0.9 * self._max_value(b2, depth)
-            b4 = board.copy(); b4[i, j] = 4
-            exp_val += 0.1 * self._max_value(b4, depth)
+        for cell in cells:
+            exp_val += 0.9 * self._max_value(self._place(board, cell, 2), depth, 0.9 * cell_prob, fours)
+            b4 = self._place(board, cell, 4)
+            if self.max_fours is not None and fours >= self.max_fours:
+                exp_val += 0.1 * self._evaluate(b4)
+            else:
+                exp_val += 0.1 * self._max_value(b4, depth, 0.1 * cell_prob, fours + 1)
 
-        if len(cells) != len(empties):
-            exp_val *= (len(empties) / len(cells))
+        exp_val /= len(cells)       # each cell is equally likely (sampled cells stand for all of them)
 
-        self.cache[key] = exp_val
+        self._store(board, False, depth, exp_val)
         return exp_val
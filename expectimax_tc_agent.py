@@ -1,5 +1,5 @@
 from game_engine import Game2048, ACTION_NAMES
-from expectimax_tc_agent import ExpectimaxTimeControlled
+from profile_search import ExpectimaxTimeControlled
 
 def run(seed=0, budget_ms=50):
     g = Game2048(seed=seed)
@@ -0,0 +1,188 @@
+"""
+Resumable experiment grids with an on-disk result cache.
+
+A config is a JSON-able dict naming an agent and its constructor arguments:
+
+    {"agent": "expectimax", "depth": 3, "empty_cell_cap": 6, "weights": {...}}
+    {"agent": "expectimax_tc", "budget_ms": 50, "use_bitboard": True}
+
+Every finished game is appended to cache_dir/<key>/games.jsonl, where key hashes the
+config together with the code version (a hash of the sources that decide how that
+agent plays, see CODE_MODULES). A rerun plays only the (config, seed) pairs missing
+from the cache, so an interrupted sweep resumes where it stopped, and editing the
+search code starts new entries for the search agents only, instead of mixing old
+and new results. Each config's summary is updated as its games finish.
+
+    rows = run_grid(grid({"agent": "expectimax"}, depth=[1, 2, 3]), game_seeds(20, 10))
+"""
+import bisect
+import hashlib
+import importlib
+import itertools
+import json
+import math
+import os
+import numpy as np
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from agents import RandomAgent, GreedyImmediateAgent
+from expectimax_agent import ExpectimaxAgent
+from profile_search import ExpectimaxTimeControlled
+from mc_agent import MonteCarloAgent
+from evaluate import play_games
+
+AGENT_CLASSES = {"random": RandomAgent, "greedy": GreedyImmediateAgent,
+                 "expectimax": ExpectimaxAgent, "expectimax_tc": ExpectimaxTimeControlled,
+                 "montecarlo": MonteCarloAgent}
+
+# per agent: modules whose source decides the outcome of its seeded games
+_BASE_MODULES = ("game_engine", "bitboard", "agents", "evaluate")
+_SEARCH_MODULES = _BASE_MODULES + ("heuristics", "batch_search", "search_utils", "expectimax_agent")
+CODE_MODULES = {"random": _BASE_MODULES, "greedy": _BASE_MODULES, "expectimax": _SEARCH_MODULES,
+                "expectimax_tc": _SEARCH_MODULES + ("orderings", "profile_search"),
+                "montecarlo": _BASE_MODULES + ("vec_game", "search_utils", "mc_agent")}
+
+
+def build_agent(config: Dict[str, Any]):
+    """Agent for a config; 'budget_ms' is the per-move budget of the time-controlled agents."""
+    kwargs = dict(config)
+    name = kwargs.pop("agent")
+    if name not in AGENT_CLASSES:
+        raise ValueError(f"unknown agent {name!r} (choose from {', '.join(AGENT_CLASSES)})")
+    if "budget_ms" in kwargs:
+        kwargs["timer_budget_sec"] = kwargs.pop("budget_ms") / 1000.0
+    return AGENT_CLASSES[name](**kwargs)
+
+
+def grid(base: Dict[str, Any], **axes: Iterable) -> List[Dict[str, Any]]:
+    """Cartesian product of the axes on top of base, e.g. grid({"agent": "expectimax"}, depth=[2, 3])."""
+    names = list(axes)
+    return [{**base, **dict(zip(names, values))} for values in itertools.product(*(axes[n] for n in names))]
+
+
+def code_version(modules: Iterable[str]) -> str:
+    h = hashlib.sha256()
+    for name in modules:
+        with open(importlib.import_module(name).__file__, "rb") as f:
+            h.update(name.encode() + b"\0" + f.read())
+    return h.hexdigest()[:12]
+
+
+class ExperimentCache:
+    """
+    Finished games per config: cache_dir/<key>/config.json and one JSON line per game.
+    A fixed 'version' replaces the per-agent source hash (e.g. to keep results across edits).
+    """
+    def __init__(self, cache_dir: str = "experiments", version: Optional[str] = None):
+        self.cache_dir = cache_dir
+        self.version = version
+        self._versions: Dict[str, str] = {}
+
+    def code(self, config: Dict[str, Any]) -> str:
+        if self.version is not None:
+            return self.version
+        name = config["agent"]
+        if name not in self._versions:
+            self._versions[name] = code_version(CODE_MODULES[name])
+        return self._versions[name]
+
+    def key(self, config: Dict[str, Any]) -> str:
+        blob = json.dumps({"config": config, "code": self.code(config)}, sort_keys=True)
+        return hashlib.sha256(blob.encode()).hexdigest()[:16]
+
+    def _dir(self, config: Dict[str, Any]) -> str:
+        return os.path.join(self.cache_dir, self.key(config))
+
+    def load(self, config: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+        """seed -> stored result (a line cut off by a crash is ignored)."""
+        path = os.path.join(self._dir(config), "games.jsonl")
+        games = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        r = json.loads(line)
+                    except ValueError:
+                        continue
+                    games[int(r["seed"])] = r
+        return games
+
+    def store(self, config: Dict[str, Any], result: Dict[str, Any]):
+        d = self._dir(config)
+        if not os.path.exists(os.path.join(d, "config.json")):
+            os.makedirs(d, exist_ok=True)
+            with open(os.path.join(d, "config.json"), "w") as f:
+                json.dump({"config": config, "code": self.code(config)}, f, indent=1)
+        row = {"seed": int(result["seed"]), "score": int(result["score"]), "max_tile": int(result["max_tile"]),
+               "time_sec": float(result.get("time_sec", 0.0))}
+        with open(os.path.join(d, "games.jsonl"), "a") as f:
+            f.write("\n" + json.dumps(row) + "\n")     # leading newline ends a torn last line
+
+
+class RunningSummary:
+    """evaluate.summarize-style aggregate (plus std / sem of the score), updated one game at a time."""
+    def __init__(self):
+        self.scores: List[int] = []     # sorted, for the median
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.wins = 0
+        self.tiles: Dict[int, int] = {}
+        self.time_sec = 0.0
+
+    def add(self, result: Dict[str, Any]):
+        score, tile = int(result["score"]), int(result["max_tile"])
+        bisect.insort(self.scores, score)
+        self.n += 1
+        delta = score - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (score - self.mean)
+        self.wins += tile >= 2048
+        self.tiles[tile] = self.tiles.get(tile, 0) + 1
+        self.time_sec += float(result.get("time_sec", 0.0))
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.n:
+            return {"games": 0}
+        std = math.sqrt(self._m2 / (self.n - 1)) if self.n > 1 else 0.0
+        return {"games": self.n, "avg_score": self.mean, "median_score": float(np.median(self.scores)),
+                "best_score": self.scores[-1], "std_score": std, "sem_score": std / math.sqrt(self.n),
+                "win_rate_2048": self.wins / self.n, "best_tile_hist": dict(sorted(self.tiles.items())),
+                "mean_time_sec": self.time_sec / self.n}
+
+
+def run_grid(configs: List[Dict[str, Any]], seeds: Iterable[int], cache_dir: str = "experiments",
+             workers: int = 1, version: Optional[str] = None,
+             progress: Optional[Callable[[Dict[str, Any], Dict[str, Any], int, int], None]] = None
+             ) -> List[Dict[str, Any]]:
+    """
+    Play every config on every seed, skipping games already in the cache, and return one row per
+    config: {"config", "key", "cached", "played", **summary}. Each finished game is stored before
+    the next one is reported, and progress(config, summary, n_done, n_total) sees the running
+    summary of its config (cached games included).
+    """
+    seeds = [int(s) for s in seeds]
+    cache = ExperimentCache(cache_dir, version)
+    rows = []
+    for config in configs:
+        done = cache.load(config)
+        running = RunningSummary()
+        for s in seeds:
+            if s in done:
+                running.add(done[s])
+        missing = [s for s in seeds if s not in done]
+
+        def finish(n_done, n_total, result, config=config, running=running, n_cached=len(seeds) - len(missing)):
+            cache.store(config, result)
+            running.add(result)
+            if progress: progress(config, running.summary(), n_cached + n_done, len(seeds))
+
+        if missing:
+            play_games(build_agent(config), missing, workers=workers, progress=finish)
+        rows.append({"config": config, "key": cache.key(config), "cached": len(seeds) - len(missing),
+                     "played": len(missing), **running.summary()})
+    return rows
+
+
+def print_progress(config: Dict[str, Any], summary: Dict[str, Any], n_done: int, n_total: int):
+    label = ", ".join(f"{k}={v}" for k, v in config.items() if k != "weights")
+    print(f"[{label}] {n_done}/{n_total} avg={summary['avg_score']:.1f} +- {summary['sem_score']:.1f}")
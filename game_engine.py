@@ -38,7 +38,13 @@ class Game2048:
     seed: Optional[int] = None
     board: np.ndarray = field(default_factory=lambda: np.zeros((4,4), dtype=np.int64))
     score: int = 0
+    use_bitboard: bool = False
     rng: np.random.Generator = field(init=False)
+    # move results for the current board, keyed by board bytes (see _peek)
+    _peeks: Dict[int, Tuple[np.ndarray, int, bool]] = field(init=False, default_factory=dict, repr=False, compare=False)
+    _peeks_key: bytes = field(init=False, default=b"", repr=False, compare=False)
+    # (i, j, value) of the most recent spawn, None when the last step spawned nothing
+    last_spawn: Optional[Tuple[int, int, int]] = field(init=False, default=None, repr=False, compare=False)
 
     def __post_init__(self):
         self.rng = np.random.default_rng(self.seed)
@@ -57,7 +63,7 @@ class Game2048:
         return self.board.copy()
 
     def clone(self) -> "Game2048":
-        g = Game2048(seed=self.seed)
+        g = Game2048(seed=self.seed, use_bitboard=self.use_bitboard)
         g.board = self.board.copy()
         g.score = self.score
         g.rng = np.random.default_rng()
@@ -67,10 +73,12 @@ class Game2048:
         """Spawn a 2 (90%) or 4 (10%) in a random empty cell."""
         empties = np.argwhere(self.board == 0)
         if empties.size == 0:
+            self.last_spawn = None
             return False
         idx = self.rng.integers(0, len(empties))
         i, j = empties[idx]
         self.board[i, j] = 4 if self.rng.random() < 0.1 else 2
+        self.last_spawn = (int(i), int(j), int(self.board[i, j]))
         return True
 
     def legal_moves(self) -> List[int]:
@@ -82,8 +90,20 @@ class Game2048:
                 legals.append(a)
         return legals
 
+    def legal_mask(self) -> np.ndarray:
+        """(4,) boolean mask of legal moves, indexed by action."""
+        return np.array([self._peek(a)[2] for a in (UP, DOWN, LEFT, RIGHT)])
+
+    def bitboard(self) -> int:
+        """Current board packed into a 64-bit integer (see bitboard.py)."""
+        from bitboard import to_bitboard
+        return to_bitboard(self.board)
+
     def _apply_move(self, action: int) -> Tuple[np.ndarray, int]:
         """Apply action to board (without spawning tile)."""
+        if self.use_bitboard:
+            from bitboard import apply_move_array
+            return apply_move_array(self.board, action)
         b = self.board
         out = np.zeros_like(b)
         score_gain_total = 0
@@ -116,23 +136,47 @@ class Game2048:
         return out, score_gain_total
 
     def _peek(self, action: int) -> Tuple[np.ndarray, int, bool]:
-        """Return (candidate_board, score_gain, changed_flag) without mutating game state."""
+        """
+        Return (candidate_board, score_gain, changed_flag) without mutating game state.
+        Results are memoized until the board changes (compared by bytes, so direct
+        writes to self.board are picked up too); treat candidate_board as read-only.
+        """
+        key = self.board.tobytes()
+        if key != self._peeks_key:
+            self._peeks = {}
+            self._peeks_key = key
+        hit = self._peeks.get(action)
+        if hit is not None:
+            return hit
         new_board, gain = self._apply_move(action)
         changed = not np.array_equal(new_board, self.board)
-        return new_board, gain, changed
+        hit = self._peeks[action] = (new_board, gain, changed)
+        return hit
 
     def step(self, action: int) -> Tuple[np.ndarray, int, bool, Dict]:
         """Take a step: if move changes the board, apply it, spawn a tile, update score."""
         new_board, gain, changed = self._peek(action)
         if not changed:
+            self.last_spawn = None
             return self.board.copy(), 0, self.is_game_over(), {"changed": False, "invalid": True}
 
-        self.board = new_board
+        self.board = new_board.copy()
         self.score += gain
         self._spawn_tile()
         done = self.is_game_over()
         return self.board.copy(), gain, done, {"changed": True, "invalid": False}
 
+    def step_fused(self, action: int) -> Tuple[np.ndarray, int, bool, Dict]:
+        """
+        step() that also computes all four moves of the new state in the same pass:
+        info["legal_mask"] holds the next legal moves and done is derived from it.
+        The moves stay memoized, so the agent's next peeks cost nothing.
+        """
+        board, gain, _, info = self.step(action)
+        mask = self.legal_mask()
+        info["legal_mask"] = mask
+        return board, gain, not mask.any(), info
+
     def is_game_over(self) -> bool:
         if np.any(self.board == 0):
             return False
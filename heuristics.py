@@ -1,4 +1,5 @@
 import numpy as np
+from bitboard import transpose, symmetries
 
 POSITION_MASK = np.array([
     [16, 15, 14, 13],
@@ -7,6 +8,14 @@ POSITION_MASK = np.array([
     [ 1,  2,  3,  4],
 ], dtype=np.float64)
 
+DEFAULT_WEIGHTS = {
+    "empty":  250.0,
+    "mono":    2.0,
+    "smooth":  0.1,
+    "corner": 50.0,
+    "pos":     0.5,
+}
+
 def count_empty(board: np.ndarray) -> int:
     return int(np.sum(board == 0))
 
@@ -47,26 +56,130 @@ def monotonicity(board: np.ndarray) -> float:
 def positional_score(board: np.ndarray) -> float:
     return float(np.sum(POSITION_MASK * board.astype(np.float64)))
 
-def heuristic_score(board: np.ndarray, weights=None) -> float:
+# POSITION_MASK under all 8 rotations/reflections
+POSITION_MASKS = np.stack([m for k in range(4) for m in (np.rot90(POSITION_MASK, k), np.rot90(POSITION_MASK, k).T)])
+
+def positional_score_symmetric(board: np.ndarray) -> float:
+    """Best positional score over the 8 orientations of POSITION_MASK (rotation/reflection invariant)."""
+    return float(np.max(np.sum(POSITION_MASKS * board.astype(np.float64), axis=(1, 2))))
+
+def heuristic_score(board: np.ndarray, weights=None, symmetric=False) -> float:
     """
     Composite evaluator for leaf nodes.
-    Default weights are reasonable starting points; we'll tune later.
+    Default weights are reasonable starting points; tuner.py tunes them (CMA-ES).
+    symmetric=True uses positional_score_symmetric, making the score invariant
+    under rotations and reflections (the other terms already are).
     """
     if weights is None:
-        weights = {
-            "empty":  250.0,     
-            "mono":    2.0,
-            "smooth":  0.1,      
-            "corner": 50.0,
-            "pos":     0.5,
-        }
+        weights = DEFAULT_WEIGHTS
     e  = count_empty(board)
     m  = monotonicity(board)
     sm = smoothness(board)
     c  = corner_max(board)
-    p  = positional_score(board)
+    p  = positional_score_symmetric(board) if symmetric else positional_score(board)
     return (weights["empty"] * e
           + weights["mono"]  * m
           + weights["smooth"]* sm
           + weights["corner"]* c
           + weights["pos"]   * p)
+
+
+# ---- Table-driven evaluation on packed boards -------------------------------
+#
+# Every term except corner_max is a sum over rows and columns, so the integer
+# feature sums of each 16-bit row/column are precomputed and packed into one
+# int64 per table entry:
+#   bits  0-23 positional sum, 24-47 smoothness (sum of |diffs|),
+#   bits 48-55 monotone pair count, 56-63 empty count.
+# Field totals over a whole board never overflow their width, so a leaf is
+# 4 row lookups + 4 column lookups + one add per lookup. The weights are applied
+# afterwards exactly as heuristic_score does, which keeps scores bit-identical
+# for any weight dict.
+
+_POS_SHIFT, _SMOOTH_SHIFT, _MONO_SHIFT, _EMPTY_SHIFT = 0, 24, 48, 56
+_FIELD24 = (1 << 24) - 1
+
+def _build_feature_tables():
+    rows = np.arange(65536, dtype=np.int64)
+    exps = np.stack([(rows >> (4 * j)) & 0xF for j in range(4)], axis=1)
+    vals = np.where(exps > 0, np.left_shift(1, exps), 0)
+
+    empty = np.sum(vals == 0, axis=1)
+    left, right = vals[:, :-1], vals[:, 1:]
+    mono = np.sum(left <= right, axis=1) + np.sum(left >= right, axis=1)
+    smooth = np.sum(np.abs(right - left), axis=1)
+    line = (smooth << _SMOOTH_SHIFT) | (mono << _MONO_SHIFT)
+
+    # rows carry the empties and the positional mask for their row index;
+    # columns only carry the vertical pair terms
+    row_tables = []
+    for i in range(4):
+        pos = vals @ POSITION_MASK[i].astype(np.int64)
+        row_tables.append(line | (empty << _EMPTY_SHIFT) | (pos << _POS_SHIFT))
+    return np.stack(row_tables), line, exps.max(axis=1)
+
+ROW_FEATURES, COL_FEATURES, ROW_MAX_EXP = _build_feature_tables()
+_ROW0, _ROW1, _ROW2, _ROW3 = (t.tolist() for t in ROW_FEATURES)
+_COL = COL_FEATURES.tolist()
+_ROW_MAX = ROW_MAX_EXP.tolist()
+_POS0, _POS1, _POS2, _POS3 = ((t & _FIELD24).tolist() for t in ROW_FEATURES)
+
+def _positional_packed(b: int) -> int:
+    return (_POS0[b & 0xFFFF] + _POS1[(b >> 16) & 0xFFFF]
+            + _POS2[(b >> 32) & 0xFFFF] + _POS3[(b >> 48) & 0xFFFF])
+
+def heuristic_score_packed(b: int, weights=None, symmetric=False) -> float:
+    """heuristic_score for a packed 64-bit board (see bitboard.py), via feature tables."""
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+    t = transpose(b)
+    f = (_ROW0[b & 0xFFFF] + _ROW1[(b >> 16) & 0xFFFF]
+         + _ROW2[(b >> 32) & 0xFFFF] + _ROW3[(b >> 48) & 0xFFFF]
+         + _COL[t & 0xFFFF] + _COL[(t >> 16) & 0xFFFF]
+         + _COL[(t >> 32) & 0xFFFF] + _COL[(t >> 48) & 0xFFFF])
+    e  = f >> _EMPTY_SHIFT
+    m  = (f >> _MONO_SHIFT) & 0xFF
+    sm = -((f >> _SMOOTH_SHIFT) & _FIELD24)
+    p  = max(_positional_packed(v) for v in symmetries(b)) if symmetric else f & _FIELD24
+
+    top = max(_ROW_MAX[b & 0xFFFF], _ROW_MAX[(b >> 16) & 0xFFFF],
+              _ROW_MAX[(b >> 32) & 0xFFFF], _ROW_MAX[(b >> 48) & 0xFFFF])
+    c = 1 if top in (b & 0xF, (b >> 12) & 0xF, (b >> 48) & 0xF, b >> 60) else 0
+    return (weights["empty"] * e
+          + weights["mono"]  * float(m)
+          + weights["smooth"]* float(sm)
+          + weights["corner"]* c
+          + weights["pos"]   * float(p))
+
+
+# ---- Vectorized evaluation of (N,4,4) stacks --------------------------------
+
+_POSITION_MASK_INT = POSITION_MASK.astype(np.int64)
+
+_POSITION_MASKS_INT = POSITION_MASKS.astype(np.int64)
+
+def heuristic_score_batch(boards: np.ndarray, weights=None, symmetric=False) -> np.ndarray:
+    """heuristic_score for every board in an (N,4,4) stack; returns an (N,) float64 array."""
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
+    b = boards.astype(np.int64, copy=False)
+    e = np.sum(b == 0, axis=(1, 2))
+
+    h_lo, h_hi = b[:, :, :-1], b[:, :, 1:]
+    v_lo, v_hi = b[:, :-1, :], b[:, 1:, :]
+    m = (np.sum(h_lo <= h_hi, axis=(1, 2)) + np.sum(h_lo >= h_hi, axis=(1, 2))
+         + np.sum(v_lo <= v_hi, axis=(1, 2)) + np.sum(v_lo >= v_hi, axis=(1, 2)))
+    sm = -(np.sum(np.abs(h_hi - h_lo), axis=(1, 2)) + np.sum(np.abs(v_hi - v_lo), axis=(1, 2)))
+
+    top = b.max(axis=(1, 2))
+    corners = np.stack([b[:, 0, 0], b[:, 0, 3], b[:, 3, 0], b[:, 3, 3]], axis=1)
+    c = np.any(corners == top[:, None], axis=1).astype(np.int64)
+    if symmetric:
+        p = np.einsum("nij,kij->nk", b, _POSITION_MASKS_INT).max(axis=1)
+    else:
+        p = np.sum(b * _POSITION_MASK_INT, axis=(1, 2))
+    return (weights["empty"] * e
+          + weights["mono"]  * m.astype(np.float64)
+          + weights["smooth"]* sm.astype(np.float64)
+          + weights["corner"]* c
+          + weights["pos"]   * p.astype(np.float64))
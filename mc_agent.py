@@ -0,0 +1,149 @@
+"""
+Monte Carlo rollout agent.
+
+Every legal root move is scored by the mean return of rollouts that start at its
+afterstate: the move's merge reward plus the merge rewards a rollout policy collects
+over max_rollout_moves moves (or until the game ends). All rollouts of a round
+(rollouts_per_move for every legal move) are played together as one VecGame2048 board array, so a
+lockstep step costs a few NumPy calls however many rollouts are in flight; more
+rollouts per round mainly cost vector width, not Python overhead.
+"""
+import numpy as np
+from dataclasses import dataclass, asdict
+from typing import List, Optional
+from game_engine import UP
+from agents import RandomAgent
+from vec_game import VecGame2048
+from search_utils import Timer
+import bitboard
+
+
+@dataclass
+class RolloutStats:
+    """
+    Per-move rollout telemetry. rollouts / rollout_moves / rounds count the rounds played to
+    their end (rollout_moves: moves of every rollout); full_rounds those of them not capped by
+    first_round_moves; discarded_moves the moves of a round cut off by the deadline.
+    """
+    rollouts: int = 0
+    rollout_moves: int = 0
+    rounds: int = 0
+    full_rounds: int = 0
+    discarded_moves: int = 0
+    elapsed_sec: float = 0.0
+    budget_sec: float = 0.0
+
+    @property
+    def rollouts_per_sec(self) -> float:
+        return self.rollouts / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+    @property
+    def moves_per_sec(self) -> float:
+        return self.rollout_moves / self.elapsed_sec if self.elapsed_sec > 0 else 0.0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "rollouts_per_sec": self.rollouts_per_sec, "moves_per_sec": self.moves_per_sec}
+
+
+class MonteCarloAgent:
+    """
+    Time-controlled Monte Carlo move selection.
+    - timer_budget_sec: per-move time; rounds of rollouts are played until it runs out
+    - rollouts_per_move: rollouts per legal move in one round (one batch of
+      rollouts_per_move x #legal boards)
+    - policy: "random" (uniform legal move) or "greedy" (largest merge reward, ties at random)
+    - max_rollout_moves: rollouts stop after this many moves (None: at the end of the game).
+      The default 20 fits a few full rounds into the default budget; a round of whole-game
+      random rollouts outlasts it, so the capped first round would decide every move
+    - first_round_moves: the first round is always played, ignoring the clock, but stops after
+      this many moves; its returns decide the move only if no full round finishes in time, so
+      a budget too small for a full round still gives a move that depends on the rng alone
+      (it costs a few ms whatever the budget).
+      Later rounds run to the end (or max_rollout_moves); one cut off by the deadline is
+      discarded. With a fixed rng the move depends on timing only through the number of
+      full rounds that finished.
+    - stats (RolloutStats) reports rollouts and rollout moves per second of the last move;
+      telemetry=True appends every move's stats.to_dict() to self.trace
+    """
+    def __init__(self, timer_budget_sec: float = 0.05, rollouts_per_move: int = 32, policy: str = "random",
+                 max_rollout_moves: Optional[int] = 20, first_round_moves: int = 4, rng=None,
+                 telemetry: bool = False):
+        if policy not in ("random", "greedy"):
+            raise ValueError(f"policy must be 'random' or 'greedy', got {policy!r}")
+        self.t_budget = float(timer_budget_sec)
+        self.rollouts_per_move = int(rollouts_per_move)
+        self.policy = policy
+        self.max_rollout_moves = max_rollout_moves
+        self.first_round_moves = int(first_round_moves)
+        self.rng = rng or np.random.default_rng()
+        self.stats = RolloutStats()
+        self.trace: Optional[List[dict]] = [] if telemetry else None
+
+    def _policy_actions(self, venv: VecGame2048) -> np.ndarray:
+        if self.policy == "random":
+            return RandomAgent(rng=self.rng).select_actions(venv)
+        _, rewards, changed = venv.peek_all()
+        noisy = rewards.T + 0.5 * self.rng.random(changed.T.shape)     # ties broken at random
+        return np.argmax(np.where(changed.T, noisy, -1.0), axis=1)
+
+    def _round(self, afters: np.ndarray, timer: Optional[Timer], limit: Optional[int] = None):
+        """
+        Per-rollout returns (len(afters) x k) and whether 'limit' cut the rollouts short. Without a
+        timer the round ignores the clock; with one, a round cut off by it returns (None, True).
+        """
+        if self.max_rollout_moves is not None:
+            limit = self.max_rollout_moves if limit is None else min(limit, self.max_rollout_moves)
+        k = self.rollouts_per_move
+        venv = VecGame2048(k * len(afters), auto_reset=False)
+        venv.rng = self.rng
+        venv.boards[:] = np.repeat(afters, k, axis=0)
+        venv.scores[:] = 0
+        venv._peek = None
+        venv._spawn(np.ones(venv.n_games, dtype=bool))
+        alive = venv.legal_mask().any(axis=1)
+        moves, played = 0, 0
+        capped = False
+        while alive.any():
+            if limit is not None and moves >= limit:
+                capped = limit != self.max_rollout_moves
+                break
+            if timer is not None and timer.expired():
+                self.stats.discarded_moves += played
+                return None, True
+            _, _, dones, _ = venv.step(self._policy_actions(venv))
+            played += int(alive.sum())
+            alive &= ~dones
+            moves += 1
+        self.stats.rollouts += venv.n_games
+        self.stats.rollout_moves += played
+        self.stats.rounds += 1
+        self.stats.full_rounds += not capped
+        return venv.scores.reshape(len(afters), k), capped
+
+    def select_action(self, game) -> int:
+        timer = Timer(self.t_budget); timer.start_now()
+        self.stats = RolloutStats(budget_sec=self.t_budget)
+        succs = bitboard.successors(bitboard.to_bitboard(game.board))
+        if not succs:
+            return UP
+        actions = [a for a, _, _ in succs]
+        if len(succs) == 1:
+            best = actions[0]
+        else:
+            afters = np.stack([bitboard.from_bitboard(child) for _, child, _ in succs])
+            rewards = np.array([r for _, _, r in succs], dtype=np.float64)
+            first, capped = self._round(afters, None, self.first_round_moves)
+            total, count = (np.zeros(len(succs)), 0) if capped else (first.sum(axis=1), first.shape[1])
+            while not timer.expired():
+                returns, _ = self._round(afters, timer)
+                if returns is None:
+                    break
+                total += returns.sum(axis=1)
+                count += returns.shape[1]
+            if count == 0:          # no full round in time: the capped first round decides
+                total, count = first.sum(axis=1), first.shape[1]
+            best = actions[int(np.argmax(rewards + total / count))]
+        self.stats.elapsed_sec = timer.elapsed()
+        if self.trace is not None:
+            self.trace.append(self.stats.to_dict())
+        return best
@@ -0,0 +1,247 @@
+"""
+Speed microbenchmarks for the engine and search hot paths.
+
+Every benchmark runs over a fixed corpus of boards recorded from seeded games
+(stored in the baseline file, so later comparisons replay exactly the same
+positions), with warmup passes and repeated timed passes. Rates are reported as
+ops/sec and, for searches, nodes/sec.
+
+    python microbench.py --save bench_baseline.json        # record a baseline
+    python microbench.py --compare bench_baseline.json     # flag regressions
+
+A benchmark is flagged as a regression when its mean rate dropped by more than
+--min-change and Welch's t-test over the repeat rates gives p < --alpha. Searches
+are compared on nodes/sec: the ops/sec of a time-controlled search is set by its
+budget, not by its speed.
+"""
+import argparse
+import json
+import math
+import platform
+import subprocess
+import time
+import numpy as np
+from scipy import stats
+from typing import Callable, Dict, List, Tuple
+from game_engine import Game2048, UP, DOWN, LEFT, RIGHT, _slide_and_merge
+from heuristics import heuristic_score, heuristic_score_packed
+import bitboard
+from expectimax_agent import ExpectimaxAgent, apply_move_on_board
+from profile_search import ExpectimaxTimeControlled
+
+ACTIONS = (UP, DOWN, LEFT, RIGHT)
+
+
+# ----- corpus -----
+
+def record_corpus(n_games: int = 2, every: int = 12, seed: int = 0) -> List[int]:
+    """Packed boards sampled every few moves from seeded depth-2 expectimax games (all game phases)."""
+    boards = []
+    for g_seed in range(seed, seed + n_games):
+        game = Game2048(seed=g_seed, use_bitboard=True)
+        agent = ExpectimaxAgent(depth=2, empty_cell_cap=4, rng=np.random.default_rng(g_seed), use_bitboard=True)
+        moves = 0
+        while not game.is_game_over():
+            if moves % every == 0:
+                boards.append(bitboard.to_bitboard(game.board))
+            game.step(agent.select_action(game))
+            moves += 1
+    return boards
+
+
+def _spread(items, k):
+    """k items evenly spaced over the list (early, mid and late game)."""
+    idx = np.linspace(0, len(items) - 1, num=min(k, len(items))).astype(int)
+    return [items[i] for i in idx]
+
+
+# ----- benchmarks: each returns (ops, nodes) for one pass over its boards -----
+
+def _bench_slide_and_merge(boards):
+    rows = [row for b in boards for row in b]
+    def run():
+        for row in rows:
+            _slide_and_merge(row)
+        return len(rows), 0
+    return run
+
+def _bench_apply_move(boards):
+    def run():
+        for b in boards:
+            for a in ACTIONS:
+                apply_move_on_board(b, a)
+        return 4 * len(boards), 0
+    return run
+
+def _bench_bitboard_successors(packed):
+    def run():
+        for b in packed:
+            bitboard.successors(b)
+        return len(packed), 0
+    return run
+
+def _bench_heuristic(boards):
+    def run():
+        for b in boards:
+            heuristic_score(b)
+        return len(boards), 0
+    return run
+
+def _bench_heuristic_packed(packed):
+    def run():
+        for b in packed:
+            heuristic_score_packed(b)
+        return len(packed), 0
+    return run
+
+def _bench_select_action(games, make_agent):
+    def run():
+        nodes = 0
+        for g in games:
+            agent = make_agent()
+            agent.select_action(g)
+            nodes += agent.stats.nodes
+        return len(games), nodes
+    return run
+
+
+def build_benchmarks(packed: List[int], quick: bool = False) -> Dict[str, Callable[[], Tuple[int, int]]]:
+    boards = [bitboard.from_bitboard(b) for b in packed]
+    games = [Game2048(board=b.copy()) for b in boards]
+    n_search = 2 if quick else 4
+    seeded = lambda: np.random.default_rng(0)
+    return {
+        "slide_and_merge": _bench_slide_and_merge(boards),
+        "apply_move_on_board": _bench_apply_move(boards),
+        "bitboard_successors": _bench_bitboard_successors(packed),
+        "heuristic_score": _bench_heuristic(boards),
+        "heuristic_score_packed": _bench_heuristic_packed(packed),
+        "select_action_d3": _bench_select_action(
+            _spread(games, n_search), lambda: ExpectimaxAgent(depth=3, rng=seeded())),
+        "select_action_d3_bitboard": _bench_select_action(
+            _spread(games, 4 * n_search), lambda: ExpectimaxAgent(depth=3, rng=seeded(), use_bitboard=True)),
+        "select_action_tc_50ms": _bench_select_action(
+            _spread(games, 4 * n_search), lambda: ExpectimaxTimeControlled(0.05, rng=seeded(), use_bitboard=True)),
+    }
+
+
+def measure(run: Callable[[], Tuple[int, int]], warmup: int = 1, repeats: int = 5, min_time: float = 0.2) -> Dict:
+    """Warm up, then time 'repeats' samples; cheap passes are looped so each sample lasts about min_time."""
+    for _ in range(warmup):
+        run()
+    t0 = time.perf_counter()
+    run()
+    loops = max(1, math.ceil(min_time / max(time.perf_counter() - t0, 1e-9)))
+    ops_rates, node_rates, seconds = [], [], []
+    for _ in range(repeats):
+        ops = nodes = 0
+        t0 = time.perf_counter()
+        for _ in range(loops):
+            o, n = run()
+            ops, nodes = ops + o, nodes + n
+        dt = time.perf_counter() - t0
+        seconds.append(dt)
+        ops_rates.append(ops / dt)
+        node_rates.append(nodes / dt)
+    out = {"ops": ops, "loops": loops, "seconds": seconds, "ops_per_sec": ops_rates,
+           "mean_ops_per_sec": float(np.mean(ops_rates)), "std_ops_per_sec": float(np.std(ops_rates, ddof=1)) if repeats > 1 else 0.0}
+    if nodes:
+        out.update(nodes=nodes, nodes_per_sec=node_rates, mean_nodes_per_sec=float(np.mean(node_rates)))
+    return out
+
+
+# ----- statistics -----
+
+def welch_test(x, y) -> Tuple[float, float, float]:
+    """Welch's unequal-variance t-test of y against x: (t, degrees of freedom, two-sided p-value)."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    if x.var(ddof=1) == 0.0 and y.var(ddof=1) == 0.0:        # scipy returns nan here
+        return 0.0, float("inf"), (1.0 if x.mean() == y.mean() else 0.0)
+    r = stats.ttest_ind(y, x, equal_var=False)
+    return float(r.statistic), float(r.df), float(r.pvalue)
+
+
+def compare(baseline: Dict, current: Dict, alpha: float = 0.01, min_change: float = 0.10) -> List[Dict]:
+    """
+    Per-benchmark change of the mean rate, Welch p-value and verdict (regression / improvement / ok).
+    The rate is nodes/sec when both runs recorded it, else ops/sec ("metric" names the one used).
+    """
+    rows = []
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        metric = "nodes_per_sec" if "nodes_per_sec" in base and "nodes_per_sec" in cur else "ops_per_sec"
+        _, _, p = welch_test(base[metric], cur[metric])
+        change = cur["mean_" + metric] / base["mean_" + metric] - 1.0
+        verdict = "ok"
+        if p < alpha and abs(change) > min_change:
+            verdict = "REGRESSION" if change < 0 else "improvement"
+        rows.append({"name": name, "metric": metric, "base": base["mean_" + metric], "current": cur["mean_" + metric],
+                     "change": change, "p_value": p, "verdict": verdict})
+    return rows
+
+
+# ----- driver -----
+
+def _git_rev() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run_suite(corpus: List[int], warmup: int = 1, repeats: int = 5, only=None, quick: bool = False) -> Dict:
+    results = {}
+    for name, run in build_benchmarks(corpus, quick).items():
+        if only and name not in only:
+            continue
+        results[name] = measure(run, warmup, repeats)
+        r = results[name]
+        extra = f"  {r['mean_nodes_per_sec']:12.0f} nodes/s" if "nodes" in r else ""
+        print(f"{name:28s} {r['mean_ops_per_sec']:12.1f} ops/s  +- {r['std_ops_per_sec']:9.1f}{extra}")
+    return {"meta": {"git": _git_rev(), "python": platform.python_version(), "numpy": np.__version__,
+                     "machine": platform.machine(), "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+                     "warmup": warmup, "repeats": repeats, "quick": quick},
+            "corpus": corpus, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--save", help="write results (and the board corpus) to this JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to compare against (reuses its corpus)")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--only", nargs="*", help="benchmark names to run")
+    parser.add_argument("--quick", action="store_true", help="fewer boards for the search benchmarks")
+    parser.add_argument("--alpha", type=float, default=0.01)
+    parser.add_argument("--min-change", type=float, default=0.10)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        corpus, quick = baseline["corpus"], baseline["meta"].get("quick", args.quick)
+    else:
+        corpus, quick = record_corpus(), args.quick
+    print(f"corpus: {len(corpus)} boards")
+
+    current = run_suite(corpus, args.warmup, args.repeats, args.only, quick)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=1)
+        print(f"Saved: {args.save}")
+
+    if baseline is not None:
+        print(f"\nvs {args.compare} (git {baseline['meta']['git']}):")
+        rows = compare(baseline, current, args.alpha, args.min_change)
+        for r in rows:
+            print(f"{r['name']:28s} {r['change']:+7.1%} {r['metric']:13s}  p={r['p_value']:.4f}  {r['verdict']}")
+        if any(r["verdict"] == "REGRESSION" for r in rows):
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+N-tuple network value function for 2048 afterstates.
+
+Each tuple is a list of board cells (nibble indices 4*i + j). Its weight table
+has 16**len entries indexed by the tile exponents on those cells. The value of a
+board sums, over every tuple and all 8 rotations/reflections of the board
+(symmetric sampling: one table is shared by the 8 placements), the weights at
+those indices. A leaf therefore costs len(tuples) * 8 table lookups.
+
+Weights are float32 in one flat array, optionally a np.memmap of a checkpoint
+file (path + ".json" holds the tuples). train_td0 learns them by TD(0) on
+afterstates from self-play, playing many games in lockstep with VecGame2048.
+The value estimates the merge reward still to come, so it plugs into expectimax
+as a leaf evaluator (ExpectimaxAgent / ExpectimaxTimeControlled evaluator=...):
+search values are then rewards along the path plus that estimate.
+"""
+import json
+import os
+import numpy as np
+from typing import Callable, Optional, Sequence, Tuple
+from bitboard import symmetries, to_bitboard, _exponents
+from vec_game import VecGame2048
+
+# Szubert & Jaskowski (2014): two straight and two square-ish 6-tuples, 4 x 16.7M weights (268 MB)
+DEFAULT_TUPLES = ((0, 1, 2, 3, 4, 5), (4, 5, 6, 7, 8, 9), (0, 1, 2, 4, 5, 6), (4, 5, 6, 8, 9, 10))
+# rows and 2x2 squares: 5 x 65536 weights (1.3 MB), trains in minutes
+SMALL_TUPLES = ((0, 1, 2, 3), (4, 5, 6, 7), (0, 1, 4, 5), (1, 2, 5, 6), (5, 6, 9, 10))
+
+
+def _symmetry_perms() -> np.ndarray:
+    """perm[k, c] = cell of the board that lands on cell c of symmetries(board)[k]."""
+    ident = sum(c << (4 * c) for c in range(16))
+    return np.array([[(s >> (4 * c)) & 0xF for c in range(16)] for s in symmetries(ident)], dtype=np.int64)
+
+
+_PERMS = _symmetry_perms()
+
+
+def _runs(cells: Sequence[int]) -> Tuple[Tuple[int, int, int], ...]:
+    """(board bit shift, mask, index shift) for each run of consecutive cells, to read an index in a few ops."""
+    runs, k = [], 0
+    while k < len(cells):
+        n = 1
+        while k + n < len(cells) and cells[k + n] == cells[k] + n:
+            n += 1
+        runs.append((4 * cells[k], (1 << (4 * n)) - 1, 4 * k))
+        k += n
+    return tuple(runs)
+
+
+def _index_fn(runs) -> Callable[[int], int]:
+    """Weight index of a tuple on a packed board; closures for the usual 1- and 2-run tuples."""
+    if len(runs) == 1:
+        (a, m, _), = runs
+        return lambda s: (s >> a) & m
+    if len(runs) == 2:
+        (a, m, _), (c, n, o) = runs
+        return lambda s: ((s >> a) & m) | (((s >> c) & n) << o)
+    def index(s):
+        idx = 0
+        for shift, mask, out in runs:
+            idx |= ((s >> shift) & mask) << out
+        return idx
+    return index
+
+
+class NTupleNetwork:
+    def __init__(self, tuples=SMALL_TUPLES, weights: Optional[np.ndarray] = None):
+        self.tuples = tuple(tuple(int(c) for c in t) for t in tuples)
+        sizes = [16 ** len(t) for t in self.tuples]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        self.flat = np.zeros(int(self.offsets[-1]), dtype=np.float32) if weights is None else weights
+        if len(self.flat) != self.offsets[-1]:
+            raise ValueError(f"expected {self.offsets[-1]} weights, got {len(self.flat)}")
+        self.path: Optional[str] = None
+        self._writable = False
+        self._bind()
+
+    def _bind(self):
+        base = np.asarray(self.flat)   # plain ndarray view: cheaper scalar indexing than np.memmap
+        self.tables = [base[self.offsets[i]:self.offsets[i + 1]] for i in range(len(self.tuples))]
+        self._lookups = [(_index_fn(_runs(t)), table) for t, table in zip(self.tuples, self.tables)]
+        self._sym_cells = [_PERMS[:, list(t)] for t in self.tuples]          # (8, len) per tuple
+        self._shifts = [4 * np.arange(len(t), dtype=np.int64) for t in self.tuples]
+
+    # ----- checkpoints -----
+
+    @classmethod
+    def create(cls, path: str, tuples=SMALL_TUPLES) -> "NTupleNetwork":
+        """New zero-initialized network backed by a writable memory-mapped file."""
+        n = sum(16 ** len(t) for t in tuples)
+        with open(path + ".json", "w") as f:
+            json.dump({"tuples": [list(t) for t in tuples], "dtype": "float32"}, f)
+        weights = np.memmap(path, dtype=np.float32, mode="w+", shape=(n,))
+        net = cls(tuples, weights)
+        net.path, net._writable = path, True
+        return net
+
+    @classmethod
+    def load(cls, path: str, writable: bool = False) -> "NTupleNetwork":
+        """Memory-map a checkpoint (read-only unless writable, e.g. to resume training)."""
+        with open(path + ".json") as f:
+            tuples = [tuple(t) for t in json.load(f)["tuples"]]
+        weights = np.memmap(path, dtype=np.float32, mode="r+" if writable else "r")
+        net = cls(tuples, weights)
+        net.path, net._writable = path, writable
+        return net
+
+    def save(self, path: str):
+        with open(path + ".json", "w") as f:
+            json.dump({"tuples": [list(t) for t in self.tuples], "dtype": "float32"}, f)
+        np.asarray(self.flat, dtype=np.float32).tofile(path)
+
+    def checkpoint(self):
+        """Flush a memory-mapped network's weights to its file."""
+        if isinstance(self.flat, np.memmap):
+            self.flat.flush()
+
+    def __getstate__(self):
+        # a file-backed network is re-mapped in the receiving process instead of copied
+        state = self.__dict__.copy()
+        for k in ("tables", "_lookups", "_sym_cells", "_shifts"):
+            state.pop(k)
+        if self.path is not None:
+            self.checkpoint()
+            state["flat"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.flat is None:
+            self.flat = np.memmap(self.path, dtype=np.float32, mode="r+" if self._writable else "r")
+        self._bind()
+
+    # ----- evaluation -----
+
+    def value_packed(self, b: int) -> float:
+        total = 0.0
+        for s in symmetries(b):
+            for index, table in self._lookups:
+                total += table[index(s)]
+        return float(total)
+
+    def value(self, board: np.ndarray) -> float:
+        return self.value_packed(to_bitboard(board))
+
+    def _indices(self, exps: np.ndarray):
+        """Per tuple: (N, 8) weight indices of every symmetric placement, from (N,16) exponents."""
+        return [(exps[:, cells] << shifts).sum(axis=-1) for cells, shifts in zip(self._sym_cells, self._shifts)]
+
+    def value_batch(self, boards: np.ndarray) -> np.ndarray:
+        """Values of a (N,4,4) stack of tile-value boards."""
+        exps = np.minimum(_exponents(boards).reshape(len(boards), 16), 15)
+        out = np.zeros(len(boards), dtype=np.float64)
+        for idx, table in zip(self._indices(exps), self.tables):
+            out += table[idx].sum(axis=1)
+        return out
+
+    def update_batch(self, boards: np.ndarray, deltas: np.ndarray):
+        """Add deltas[n] to every weight read for boards[n] (each of the 8 placements)."""
+        exps = np.minimum(_exponents(boards).reshape(len(boards), 16), 15)
+        d = np.repeat(np.asarray(deltas, dtype=np.float32), 8)
+        for idx, table in zip(self._indices(exps), self.tables):
+            np.add.at(table, idx.ravel(), d)
+
+
+def train_td0(net: NTupleNetwork, n_games: int, n_envs: int = 64, alpha: float = 0.0025, seed: int = 0,
+              checkpoint_every: int = 1000, progress: Optional[Callable[[int, float], None]] = None) -> np.ndarray:
+    """
+    TD(0) on afterstates (Szubert & Jaskowski 2014) with n_envs self-play games in lockstep.
+    Each step plays argmax_a r + V(after_a) in every game and moves V(previous afterstate)
+    towards r + V(new afterstate); a game's last afterstate is moved towards 0. Every weight
+    read for a board gets alpha * td_error. A memory-mapped network is flushed every
+    checkpoint_every finished games, and progress(games_done, mean_recent_score) is called then.
+    Returns the final scores of the finished games.
+    """
+    venv = VecGame2048(n_envs, seed=seed)
+    rows = np.arange(n_envs)
+    prev = np.zeros((n_envs, 4, 4), dtype=np.int64)
+    has_prev = np.zeros(n_envs, dtype=bool)
+    scores = []
+    next_checkpoint = checkpoint_every
+    while len(scores) < n_games:
+        after, rewards, changed = venv.peek_all()
+        v = net.value_batch(after.reshape(-1, 4, 4)).reshape(4, n_envs)
+        actions = np.argmax(np.where(changed, rewards + v, -np.inf), axis=0)
+        new_after, r, v_new = after[actions, rows], rewards[actions, rows], v[actions, rows]
+        if has_prev.any():
+            p = prev[has_prev]
+            net.update_batch(p, alpha * (r[has_prev] + v_new[has_prev] - net.value_batch(p)))
+        prev[:] = new_after
+        has_prev[:] = True
+
+        _, _, dones, info = venv.step(actions)
+        if dones.any():
+            p = prev[dones]
+            net.update_batch(p, -alpha * net.value_batch(p))
+            has_prev[dones] = False
+            scores.extend(info["final_score"].tolist())
+            if len(scores) >= next_checkpoint:
+                next_checkpoint += checkpoint_every
+                net.checkpoint()
+                if progress: progress(len(scores), float(np.mean(scores[-checkpoint_every:])))
+    net.checkpoint()
+    return np.array(scores[:n_games])
+
+
+if __name__ == "__main__":
+    path = "ntuple_small.f32"
+    net = NTupleNetwork.load(path, writable=True) if os.path.exists(path) else NTupleNetwork.create(path)
+    train_td0(net, n_games=20000, checkpoint_every=1000,
+              progress=lambda n, s: print(f"{n} games, mean score of last 1000: {s:.0f}"))
+    print(f"Saved: {path} (+ .json)")
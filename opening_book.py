@@ -0,0 +1,153 @@
+"""
+Opening book: best moves of early positions, searched deeply offline.
+
+build_book expands the positions the book itself reaches. Level 0 holds every
+starting position with its exact probability. Each position of a level is searched
+(ExpectimaxAgent at 'depth'), its best move is played, and every spawn after it
+(uniform empty cell, 2 with 0.9 / 4 with 0.1) goes to the next level with its
+probability; a level keeps its 'width' most likely positions. These are the boards
+that recur across seeds, as long as the agent plays the book's moves.
+
+With symmetric=True (the default) the searches use the rotation/reflection-invariant
+heuristic and positions are merged by bitboard.canonical, so one entry serves all 8
+symmetric boards; the stored move belongs to the canonical board and is mapped back
+through bitboard.INVERSE_SYMMETRY_ACTIONS. A book is only valid for agents whose
+'symmetric' setting matches it (the agents check).
+
+The file is a .npy array of BOOK_DTYPE rows sorted by board (plus path + ".json" with
+the build settings). OpeningBook memory-maps it; a probe is the 8 symmetries and one
+np.searchsorted over the keys, a few microseconds.
+
+    python opening_book.py      # builds opening_book.npy
+"""
+import json
+import os
+import numpy as np
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+from game_engine import Game2048
+from expectimax_agent import ExpectimaxAgent
+import bitboard
+
+BOOK_DTYPE = np.dtype([("board", "<u8"), ("move", "u1"), ("depth", "u1"), ("value", "<f4")])
+SPAWNS = ((1, 0.9), (2, 0.1))          # (exponent, probability)
+
+
+def _key(b: int, symmetric: bool) -> int:
+    return bitboard.canonical(b) if symmetric else b
+
+
+def start_positions(symmetric: bool = True) -> Dict[int, float]:
+    """Packed starting board (canonical if symmetric) -> probability that a new game starts there."""
+    out: Dict[int, float] = defaultdict(float)
+    for c1 in range(16):
+        for c2 in range(16):
+            if c1 == c2:
+                continue
+            for e1, p1 in SPAWNS:
+                for e2, p2 in SPAWNS:
+                    b = (e1 << (4 * c1)) | (e2 << (4 * c2))
+                    out[_key(b, symmetric)] += p1 * p2 / (16 * 15)
+    return dict(out)
+
+
+def search_position(b: int, depth: int, empty_cell_cap: int, symmetric: bool) -> Tuple[int, float]:
+    """(best move, search value) of one packed board; subsampling is seeded by the board."""
+    agent = ExpectimaxAgent(depth=depth, empty_cell_cap=empty_cell_cap, rng=np.random.default_rng(b),
+                            use_bitboard=True, symmetric=symmetric)
+    move = agent.select_action(Game2048(board=bitboard.from_bitboard(b)))
+    return int(move), float(agent.last_value)
+
+
+def build_book(path: str = "opening_book.npy", plies: int = 8, width: int = 300, depth: int = 5,
+               empty_cell_cap: int = 6, symmetric: bool = True, workers: int = 1,
+               progress: Optional[Callable[[int, int, float], None]] = None) -> int:
+    """
+    Search 'plies' levels of at most 'width' positions each and write the book to path.
+    workers > 1 searches a level on a process pool (workers <= 0 uses all cores).
+    progress(ply, n_entries, covered) gets, per level, the probability that a game
+    following the book reaches one of the level's kept positions. Returns the book size.
+    """
+    if workers is not None and workers <= 0:
+        workers = os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+    entries: Dict[int, Tuple[int, float]] = {}
+    level = start_positions(symmetric)
+    try:
+        for ply in range(plies):
+            kept = sorted(level.items(), key=lambda kv: -kv[1])[:width]
+            todo = [b for b, _ in kept if b not in entries and bitboard.successors(b)]
+            args = (todo, [depth] * len(todo), [empty_cell_cap] * len(todo), [symmetric] * len(todo))
+            results = pool.map(search_position, *args, chunksize=4) if pool else map(search_position, *args)
+            entries.update(zip(todo, results))
+            if progress: progress(ply, len(entries), sum(p for _, p in kept))
+            nxt: Dict[int, float] = defaultdict(float)
+            for b, p in kept:
+                if b not in entries:
+                    continue
+                after, _ = bitboard.move(b, entries[b][0])
+                cells = bitboard.empty_cells(after)
+                for cell in cells:
+                    for e, pe in SPAWNS:
+                        nxt[_key(after | (e << (4 * cell)), symmetric)] += p * pe / len(cells)
+            level = nxt
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    write_book(path, entries, {"plies": plies, "width": width, "depth": depth, "empty_cell_cap": empty_cell_cap,
+                               "symmetric": symmetric})
+    return len(entries)
+
+
+def write_book(path: str, entries: Dict[int, Tuple[int, float]], meta: Dict):
+    book = np.zeros(len(entries), dtype=BOOK_DTYPE)
+    for n, (b, (move, value)) in enumerate(sorted(entries.items())):
+        book[n] = (b, move, meta["depth"], value)
+    np.save(path, book)
+    with open(path + ".json", "w") as f:
+        json.dump({**meta, "entries": len(entries)}, f)
+
+
+class OpeningBook:
+    """Memory-mapped book; probe(board) -> (move, value, depth) or None, counting hits and misses."""
+    def __init__(self, path: str = "opening_book.npy"):
+        self.path = path
+        with open(path + ".json") as f:
+            self.meta = json.load(f)
+        self.symmetric = bool(self.meta["symmetric"])
+        self.entries = np.load(path, mmap_mode="r")
+        self.keys = self.entries["board"]
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __getstate__(self):
+        # copies (worker processes) re-map the file instead of pickling it
+        return {"path": self.path, "hits": self.hits, "misses": self.misses}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+        self.hits, self.misses = state["hits"], state["misses"]
+
+    def probe(self, board) -> Optional[Tuple[int, float, int]]:
+        """board: packed int or (4,4) array."""
+        b = board if isinstance(board, int) else bitboard.to_bitboard(board)
+        k = 0
+        if self.symmetric:
+            b, k = bitboard.canonical_with_index(b)
+        i = int(np.searchsorted(self.keys, np.uint64(b)))
+        if i == len(self.keys) or int(self.keys[i]) != b:
+            self.misses += 1
+            return None
+        self.hits += 1
+        e = self.entries[i]
+        return bitboard.INVERSE_SYMMETRY_ACTIONS[k][int(e["move"])], float(e["value"]), int(e["depth"])
+
+
+if __name__ == "__main__":
+    n = build_book("opening_book.npy", workers=0,
+                   progress=lambda ply, n, p: print(f"ply {ply}: {n} entries, book covers {p:.1%} of games"))
+    print(f"Saved: opening_book.npy (+ .json), {n} positions")
@@ -1,13 +1,26 @@
-import numpy as np
 from game_engine import UP, DOWN, LEFT, RIGHT
 from heuristics import heuristic_score
 
-def order_moves(board: np.ndarray, simulate_move_fn):
+def order_moves(board, simulate_move_fn, score_fn=heuristic_score):
+    """
+    Legal moves sorted best-first by reward + 0.2 * score_fn(child).
+    Pass bitboard.apply_move and a packed-board score_fn to order packed boards.
+    """
     scored = []
     for a in (UP, DOWN, LEFT, RIGHT):
         child, reward, changed = simulate_move_fn(board, a)
         if not changed:
             continue
-        scored.append((a, reward + 0.2 * heuristic_score(child)))
+        scored.append((a, reward + 0.2 * score_fn(child)))
     scored.sort(key=lambda x: x[1], reverse=True)
     return [a for (a, _) in scored]
+
+def order_successors(succs, values=None):
+    """
+    Order (action, child, reward) successors best-first without evaluating children:
+    by known move values (previous iteration / transposition table) when given, moves
+    without one after those, and by merge reward otherwise. Ties keep UP, DOWN, LEFT, RIGHT.
+    """
+    if values:
+        return sorted(succs, key=lambda s: (s[0] in values, values.get(s[0], 0.0), s[2]), reverse=True)
+    return sorted(succs, key=lambda s: s[2], reverse=True)
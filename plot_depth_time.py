@@ -1,38 +1,80 @@
+import os
 import matplotlib.pyplot as plt
+import numpy as np
+import bitboard
 from expectimax_tc_agent import ExpectimaxTimeControlled
+from evaluate import play_games, game_seeds
 from game_engine import Game2048
+from microbench import record_corpus
+from search_utils import write_trace_jsonl, read_trace_jsonl, aggregate_traces
 
-def profile(budget_ms=50, seed=42):
-    g = Game2048(seed=seed)
-    a = ExpectimaxTimeControlled(timer_budget_sec=budget_ms/1000, empty_cell_cap=8)
-    act = a.select_action(g)
-    return a.stats.max_depth_reached, a.stats.nodes
+WHOLE_GAME_MAX_MS = 200     # whole games at longer budgets take too long; only fixed positions are profiled
 
-def main():
-    budgets = [50, 100, 200, 500, 1000, 2000, 3000, 4000, 5000]
-
-    depths, nodes = [], []
+def profile(budget_ms=50, n_games=3, seed=42, out_dir="traces", workers=1):
+    """
+    Play whole games with telemetry on, write one JSONL trace per game
+    (out_dir/tc_<budget>ms_<seed>.jsonl) and return the aggregate over all their moves.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    a = ExpectimaxTimeControlled(timer_budget_sec=budget_ms/1000, empty_cell_cap=8, telemetry=True)
+    paths = []
+    for r in play_games(a, game_seeds(n_games, seed), workers=workers):
+        path = os.path.join(out_dir, f"tc_{budget_ms}ms_{r['seed']}.jsonl")
+        if os.path.exists(path):
+            os.remove(path)
+        write_trace_jsonl(path, r["trace"], run=f"tc_{budget_ms}ms", seed=r["seed"], budget_ms=budget_ms)
+        paths.append(path)
+    return aggregate_traces(read_trace_jsonl(paths))
 
-    for b in budgets:
-        d, n = profile(b)
-        depths.append(d)
-        nodes.append(n)
+def profile_positions(budget_ms, positions, seed=42, out_dir="traces"):
+    """
+    One telemetry move on each packed board of 'positions' (whole games take too long at
+    multi-second budgets); writes out_dir/tc_<budget>ms_positions.jsonl and returns the aggregate.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    a = ExpectimaxTimeControlled(timer_budget_sec=budget_ms/1000, empty_cell_cap=8, telemetry=True,
+                                 rng=np.random.default_rng(seed))
+    for b in positions:
+        a.select_action(Game2048(board=bitboard.from_bitboard(b)))
+    path = os.path.join(out_dir, f"tc_{budget_ms}ms_positions.jsonl")
+    if os.path.exists(path):
+        os.remove(path)
+    write_trace_jsonl(path, a.trace, run=f"tc_{budget_ms}ms", seed=seed, budget_ms=budget_ms)
+    return aggregate_traces(read_trace_jsonl(path))
 
+def _plot(series, key, scale, ylabel, title, path):
+    """One labelled line per series ({label: (budgets, aggregates)}) of scale * aggregate[key]."""
     plt.figure()
-    plt.plot(budgets, depths, marker='o')
+    for (label, (budgets, aggs)), marker in zip(series.items(), "os^"):
+        plt.plot(budgets, [scale * agg[key] for agg in aggs], marker=marker, label=label)
     plt.xlabel("Time per Move (ms)")
-    plt.ylabel("Max Depth Reached")
-    plt.title("Depth vs Time Budget")
-    plt.savefig("depth_vs_time.png")
+    plt.ylabel(ylabel)
+    plt.title(title)
+    plt.legend()
+    plt.savefig(path)
 
-    plt.figure()
-    plt.plot(budgets, nodes, marker='s')
-    plt.xlabel("Time per Move (ms)")
-    plt.ylabel("Nodes Expanded")
-    plt.title("Nodes vs Time Budget")
-    plt.savefig("nodes_vs_time.png")
+def main():
+    budgets = [10, 25, 50, 100, 200, 500, 1000, 2000, 3000, 4000, 5000]
+    # early, mid and late-game boards of one seeded game, profiled at every budget; whole
+    # games (a different mix of positions) only up to WHOLE_GAME_MAX_MS, as a separate series
+    corpus = record_corpus(n_games=1, every=1, seed=42)
+    positions = [corpus[i] for i in np.linspace(0, len(corpus) - 1, num=8).astype(int)]
+    game_budgets = [b for b in budgets if b <= WHOLE_GAME_MAX_MS]
+
+    series = {"8 fixed positions": (budgets, []), "whole games (3 seeds)": (game_budgets, [])}
+    for label, (bs, aggs) in series.items():
+        for b in bs:
+            agg = profile_positions(b, positions) if bs is budgets else profile(b)
+            print(label, b, "ms:", {k: agg[k] for k in ("moves", "mean_completed_depth", "mean_ebf", "tt_hit_rate",
+                                                        "p95_overshoot_sec", "time_split")})
+            aggs.append(agg)
+
+    _plot(series, "mean_completed_depth", 1, "Mean Completed Depth", "Depth vs Time Budget", "depth_vs_time.png")
+    _plot(series, "mean_nodes", 1, "Mean Nodes per Move", "Nodes vs Time Budget", "nodes_vs_time.png")
+    _plot(series, "p95_overshoot_sec", 1000, "p95 Deadline Overshoot (ms)", "Overshoot vs Time Budget",
+          "overshoot_vs_time.png")
 
-    print("Saved: depth_vs_time.png, nodes_vs_time.png")
+    print("Saved: depth_vs_time.png, nodes_vs_time.png, overshoot_vs_time.png (traces in traces/)")
 
 if __name__ == "__main__":
     main()
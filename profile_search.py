@@ -1,9 +1,15 @@
+import os
+import time
+import multiprocessing as mp
 import numpy as np
-from typing import Dict, Tuple, Optional
+from concurrent.futures import ProcessPoolExecutor, wait
+from typing import Dict, List, Tuple, Optional
 from game_engine import UP, DOWN, LEFT, RIGHT, _slide_and_merge
-from heuristics import heuristic_score
-from orderings import order_moves
-from search_utils import Timer, SearchStats
+from heuristics import heuristic_score, heuristic_score_packed, heuristic_score_batch
+from orderings import order_successors
+from search_utils import Timer, TimeManager, SearchStats, TranspositionTable, instrument
+import bitboard
+from batch_search import chance_values_batch
 
 ACTIONS = (UP, DOWN, LEFT, RIGHT)
 
@@ -31,115 +37,466 @@ def apply_move_on_board(board: np.ndarray, action: int):
     changed = not np.array_equal(out, b)
     return out, reward, changed
 
-def legal_moves_for_board(board: np.ndarray):
+def legal_moves_for_board(board: np.ndarray, simulate_move_fn=apply_move_on_board):
     legals = []
     for a in ACTIONS:
-        _, _, changed = apply_move_on_board(board, a)
+        _, _, changed = simulate_move_fn(board, a)
         if changed: legals.append(a)
     return legals
 
+def successors_for_board(board: np.ndarray, simulate_move_fn=apply_move_on_board):
+    """(action, child, merge_reward) for every legal move, each child computed once."""
+    succs = []
+    for a in ACTIONS:
+        child, reward, changed = simulate_move_fn(board, a)
+        if changed: succs.append((a, child, reward))
+    return succs
+
+def empty_cells_on_board(board: np.ndarray):
+    return [tuple(c) for c in np.argwhere(board == 0)]
+
+def place_tile_on_board(board: np.ndarray, cell, value: int) -> np.ndarray:
+    b = board.copy(); b[cell] = value
+    return b
+
 class ExpectimaxTimeControlled:
     """
     Iterative-deepening expectimax under per-move time budget.
     - timer_budget_sec: per-move time (e.g., 0.05 = 50ms)
     - empty_cell_cap: chance-node subsampling to curb branching
+    - use_bitboard: search on packed 64-bit boards (bitboard.py) instead of arrays,
+      with table-driven leaf evaluation (heuristic_score_packed)
+    - weights: heuristic weight dict (defaults to heuristics.DEFAULT_WEIGHTS)
+    - tt: optional TranspositionTable shared by all iterations and moves; without it
+      each iteration gets a fresh cache; ArrayTranspositionTable (fixed MB, needs use_bitboard
+      or symmetric) keeps its memory bounded
+    - batch_chance: evaluate chance nodes of depth <= 2 as whole NumPy frontiers
+      (batch_search.py) instead of node by node
+    - workers > 1: search each iteration on a process pool (started once, reused across
+      moves; call close() when done). parallel="root" sends one task per root move,
+      parallel="chance" one task per spawn child of every root move. Tasks carry the move's
+      absolute (time.time()) deadline, so queued tasks that start late still stop on time, and
+      tasks of an earlier move are dropped unsearched; results are merged into the same best move.
+    - prob_threshold: instead of empty-cell subsampling, chance nodes whose path probability
+      (0.9/0.1 spawn odds times 1/E cell odds) falls below it are scored, not searched
+    - max_fours: cap on 4-spawns searched along one path; later 4-spawn children are scored
+      (with either option values depend on the path to a node, so nothing is cached)
+    - symmetric: rotation/reflection-invariant leaf heuristic plus cache keys canonicalized over
+      the 8 symmetries; stats.tt_hit_rate shows the effect
+    - smart_deepening: carry each iteration's move values into the next one (root and interior
+      max nodes are searched best-first by them), and skip the next iteration when its cost,
+      predicted from the node-count growth of the last iteration, exceeds the time left
+    - adaptive_time: let a search_utils.TimeManager split the time - timer_budget_sec becomes the
+      average per move (or game_budget_sec the total per game), with more time for crowded boards
+      with many distinct tiles and less for open ones; unused time is banked for later moves
+    - early_stop_margin: stop deepening once the best root move has been the same for the last two
+      completed iterations and leads the runner-up by this fraction of its value
+    - last_value / last_depth: value and depth of the deepest completed iteration of the last
+      move (None / 0 if none finished; a board without legal moves gets its dead-board value),
+      e.g. as a training label
+    - evaluator: learned leaf value (value / value_packed / value_batch, e.g. ntuple.NTupleNetwork or
+      value_estimator.LinearValueModel) instead of the heuristic; boards without a legal move are
+      then worth 0 unless the evaluator sets zero_at_terminal = False. With batch_chance the leaf
+      frontiers are scored by one value_batch call per depth-2 chance node
+    - telemetry: time move generation / evaluation / ordering (search_utils.instrument) and
+      append every move's stats.to_dict() to self.trace
+    - book: opening_book.OpeningBook probed before deepening; a hit returns the book move
+      at once (stats.book_hit, last_depth = the book's search depth) and, with adaptive_time,
+      leaves the unused budget in the bank. Its 'symmetric' setting must match the agent's.
     """
-    def __init__(self, timer_budget_sec: float = 0.05, empty_cell_cap: int = 8, gamma: float = 1.0, rng=None):
+    def __init__(self, timer_budget_sec: float = 0.05, empty_cell_cap: int = 8, gamma: float = 1.0, rng=None,
+                 use_bitboard: bool = False, weights=None, tt: Optional[TranspositionTable] = None,
+                 batch_chance: bool = False, workers: int = 1, parallel: str = "root",
+                 prob_threshold: Optional[float] = None, max_fours: Optional[int] = None,
+                 symmetric: bool = False, smart_deepening: bool = False, telemetry: bool = False,
+                 adaptive_time: bool = False, game_budget_sec: Optional[float] = None,
+                 early_stop_margin: Optional[float] = None, evaluator=None, book=None):
         self.t_budget = float(timer_budget_sec)
         self.empty_cell_cap = int(empty_cell_cap)
         self.gamma = float(gamma)
         self.rng = rng or np.random.default_rng()
         self.stats = SearchStats()
+        self.use_bitboard = bool(use_bitboard)
+        self.weights = weights
+        self.tt = tt
+        if getattr(tt, "needs_packed_keys", False) and not (use_bitboard or symmetric):
+            raise ValueError(f"{type(tt).__name__} needs packed board keys: use use_bitboard=True or symmetric=True")
+        self.batch_chance = bool(batch_chance)
+        if parallel not in ("root", "chance"):
+            raise ValueError(f"parallel must be 'root' or 'chance', got {parallel!r}")
+        self.prob_threshold = prob_threshold
+        self.max_fours = max_fours
+        self.symmetric = bool(symmetric)
+        self.evaluator = evaluator
+        self.book = book
+        if book is not None and book.symmetric != bool(symmetric):
+            raise ValueError(f"opening book was built with symmetric={book.symmetric}, agent has symmetric={bool(symmetric)}")
+        self.smart_deepening = bool(smart_deepening)
+        self._move_values: Dict[object, Dict[int, float]] = {}
+        self.workers = int(workers)
+        self.parallel = parallel
+        self._pool = None
+        self._live_move = None     # shared with the workers: id of the move being searched
+        self._move_id = 0
+        if self.use_bitboard:
+            self._apply, self._empties, self._place = bitboard.apply_move, bitboard.empty_cells, bitboard.place_tile
+            self._successors = bitboard.successors
+        else:
+            self._apply, self._empties, self._place = apply_move_on_board, empty_cells_on_board, place_tile_on_board
+            self._successors = successors_for_board
+        self._order = order_successors
+        self.time_manager = None
+        if adaptive_time or game_budget_sec is not None:
+            self.time_manager = TimeManager(self.t_budget, game_budget_sec)
+        self.early_stop_margin = early_stop_margin
+        self.last_value: Optional[float] = None
+        self.last_depth = 0
+        self.trace: Optional[List[dict]] = [] if telemetry else None
+        if telemetry:
+            instrument(self)
+
+    def _key(self, board):
+        if self.symmetric:
+            return bitboard.canonical(board if self.use_bitboard else bitboard.to_bitboard(board))
+        return board if self.use_bitboard else board.tobytes()
+
+    def _evaluate(self, board) -> float:
+        if self.evaluator is not None:
+            return self.evaluator.value_packed(board) if self.use_bitboard else self.evaluator.value(board)
+        if self.use_bitboard:
+            return heuristic_score_packed(board, self.weights, self.symmetric)
+        return heuristic_score(board, self.weights, self.symmetric)
+
+    def _evaluate_batch(self, boards: np.ndarray) -> np.ndarray:
+        if self.evaluator is not None:
+            return self.evaluator.value_batch(boards)
+        return heuristic_score_batch(boards, self.weights, self.symmetric)
+
+    def _dead_value(self, board) -> float:
+        # a learned value predicts the reward still to come: none once no move is legal
+        # (unless the evaluator opts out with zero_at_terminal = False, e.g. a fit of search values)
+        return 0.0 if self._zero_at_terminal() else self._evaluate(board)
+
+    def _zero_at_terminal(self) -> bool:
+        return self.evaluator is not None and getattr(self.evaluator, "zero_at_terminal", True)
+
+    def _expect_batch(self, board, depth: int) -> float:
+        boards = (bitboard.from_bitboard(board) if self.use_bitboard else board)[None]
+        return float(chance_values_batch(boards, depth, self.empty_cell_cap, self.rng, self.gamma,
+                                         self._evaluate_batch, self.stats,
+                                         0.0 if self._zero_at_terminal() else None)[0])
+
+    def _path_dependent(self) -> bool:
+        # with a probability cutoff or a 4-spawn cap a node's value depends on the path to it
+        # (its probability, the 4-spawns so far), which cache keys leave out: cache nothing then
+        return self.prob_threshold is not None or self.max_fours is not None
+
+    def _lookup(self, cache, board, is_max, depth):
+        if self._path_dependent():
+            return None
+        self.stats.tt_probes += 1
+        if self.tt is not None:
+            v = self.tt.get((self._key(board), is_max), depth)
+        else:
+            v = cache.get((self._key(board), is_max, depth))
+        if v is not None:
+            self.stats.tt_hits += 1
+        return v
+
+    def _store(self, cache, board, is_max, depth, v, timer):
+        if self._path_dependent():
+            return
+        if self.tt is None:
+            cache[(self._key(board), is_max, depth)] = v
+        elif not timer.expired():
+            # values finished after the deadline may be partial; keep them out of the shared table
+            self.tt.put((self._key(board), is_max), depth, v)
+        else:
+            return
+        self.stats.tt_puts += 1
+
+    def __getstate__(self):
+        # the pool cannot be pickled; copies (workers, evaluate.play_games) start their own
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        state["_live_move"] = None
+        return state
+
+    def close(self):
+        """Shut down the worker pool, if one was started."""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+            self._live_move = None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            seed = int(self.rng.integers(0, 2**63 - 1))
+            self._live_move = mp.Value("q", self._move_id, lock=False)
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_search_worker,
+                                             initargs=(self, seed, self._live_move))
+        return self._pool
 
     def select_action(self, game) -> int:
-        board = game.board.copy()
-        timer = Timer(self.t_budget); timer.start_now()
+        board = bitboard.to_bitboard(game.board) if self.use_bitboard else game.board.copy()
+        budget = self.t_budget if self.time_manager is None else self.time_manager.allocate(game.board)
+        timer = Timer(budget); timer.start_now()
         self.stats = SearchStats()
+        self._move_id += 1
+        if self._live_move is not None:
+            self._live_move.value = self._move_id
 
-        legals = legal_moves_for_board(board)
-        if not legals:
+        self.stats.budget_sec = budget
+        succs = self._successors(board)
+        if not succs:
+            self.last_value, self.last_depth = self._dead_value(board), 0
             return UP
 
-        best_move, best_value, best_depth = legals[0], -float("inf"), 0
+        if self.tt is not None:
+            self.tt.new_search()
+        self._move_values.clear()
+        best_move, best_value, best_depth = succs[0][0], -float("inf"), 0
+        root_values: Dict[int, float] = {}
+        iterations = []   # (seconds, nodes) of each completed iteration
+        stable = 0        # completed iterations in a row with the same best move
         depth = 1
-        while True:
+        hit = self.book.probe(board) if self.book is not None else None
+        if hit is not None:
+            best_move, best_value, best_depth = hit
+            self.stats.book_hit = True
+        while hit is None:
             if timer.expired(): break
-            # transposition cache per iteration to avoid mixing depths
-            cache: Dict[Tuple[bytes, bool, int], float] = {}
-            # Move ordering
-            ordered = order_moves(board, apply_move_on_board)
-            mv, val = self._search_root(board, ordered, depth, cache, timer)
+            if self.smart_deepening and not self._next_iteration_fits(iterations, timer): break
+            t0, n0 = timer.elapsed(), self.stats.nodes
+            # transposition cache per iteration to avoid mixing depths (unused when self.tt is set)
+            cache: Dict[Tuple[object, bool, int], float] = {}
+            values: Dict[int, float] = {}
+            if self.workers > 1:
+                mv, val = self._search_root_parallel(board, depth, timer, values)
+            else:
+                # Move ordering: previous iteration's root values, else merge reward
+                ordered = self._order(succs, root_values if self.smart_deepening else None)
+                mv, val = self._search_root(board, ordered, depth, cache, timer, values)
             if timer.expired():
                 break
             if val is not None:
+                stable = stable + 1 if mv == best_move else 1
                 best_move, best_value, best_depth = mv, val, depth
+                root_values = values
+            iterations.append((timer.elapsed() - t0, self.stats.nodes - n0))
+            if self.early_stop_margin is not None and stable >= 2 and self._clear_best(root_values):
+                break
             depth += 1
 
-        # Optionally: print or store self.stats
-        # print(f"[EX-TC] depth={best_depth} nodes={self.stats.nodes} tt_hits={self.stats.tt_hits}")
+        self.last_value = best_value if best_depth else None
+        self.last_depth = best_depth
+        self.stats.completed_depth = best_depth
+        self.stats.iteration_nodes = iterations[-1][1] if iterations else 0
+        self.stats.elapsed_sec = timer.elapsed()
+        if self.time_manager is not None:
+            self.time_manager.record(self.stats.elapsed_sec)
+        if self.trace is not None:
+            self.trace.append(self.stats.to_dict())
         return best_move
 
+    @staticmethod
+    def _next_iteration_fits(iterations, timer) -> bool:
+        """
+        Predict the next iteration as last_time * ebf, with ebf = last_nodes ** (1 / last_depth)
+        the observed per-ply node growth. (The plain ratio between consecutive iterations
+        overshoots badly after depth 1, which only expands the root children.)
+        """
+        if not iterations:
+            return True
+        t_last, n_last = iterations[-1]
+        ebf = max(n_last, 1) ** (1.0 / len(iterations))
+        return t_last * ebf <= timer.time_left()
+
+    def _clear_best(self, root_values: Dict[int, float]) -> bool:
+        """True when the best root move leads the runner-up by early_stop_margin (relative)."""
+        if len(root_values) < 2:
+            return True
+        best, second = sorted(root_values.values(), reverse=True)[:2]
+        return best - second >= self.early_stop_margin * abs(best)
+
     # ----- search internals -----
 
-    def _search_root(self, board, moves, depth, cache, timer):
+    def _search_root(self, board, succs, depth, cache, timer, values=None):
         best_move, best_val = None, -float("inf")
-        for a in moves:
+        for a, child, reward in succs:
             if timer.expired(): break
-            child, reward, changed = apply_move_on_board(board, a)
-            if not changed: continue
             v = reward + self.gamma * self._expect(child, depth-1, cache, timer)
+            if values is not None:
+                values[a] = v
             if v > best_val:
                 best_val, best_move = v, a
         return best_move, (None if timer.expired() else best_val)
 
-    def _max(self, board, depth, cache, timer):
+    def _spawn_tasks(self, board):
+        """
+        (weight, child, prob, fours, searched) for each child of a root-level chance node, with
+        the same subsampling, weights and pruning as _expect; unsearched children are only scored.
+        """
+        empties = self._empties(board)
+        if not empties:
+            return [(1.0, board, 1.0, 0, True)]
+        cells = empties
+        if self.prob_threshold is None and self.empty_cell_cap and len(empties) > self.empty_cell_cap:
+            idxs = self.rng.choice(len(empties), size=self.empty_cell_cap, replace=False)
+            cells = [empties[i] for i in idxs]
+        scale = 1.0 / len(cells)
+        cell_prob = 1.0 / len(empties)
+        four_ok = self.max_fours is None or self.max_fours > 0
+        tasks = []
+        for cell in cells:
+            tasks.append((0.9 * scale, self._place(board, cell, 2), 0.9 * cell_prob, 0, True))
+            tasks.append((0.1 * scale, self._place(board, cell, 4), 0.1 * cell_prob, 1, four_ok))
+        return tasks
+
+    def _search_root_parallel(self, board, depth, timer, values=None):
+        pool = self._get_pool()
+        deadline = time.time() + timer.time_left()
+        jobs = []
+        for a, child, reward in self._successors(board):
+            if self.parallel == "chance" and depth > 1:
+                for weight, spawned, prob, fours, searched in self._spawn_tasks(child):
+                    fut = pool.submit(_search_worker_task, self._move_id, True, spawned,
+                                      depth-1 if searched else 0, deadline, prob, fours)
+                    jobs.append((a, reward, weight, fut))
+            else:
+                fut = pool.submit(_search_worker_task, self._move_id, False, child, depth-1, deadline)
+                jobs.append((a, reward, 1.0, fut))
+
+        done, pending = wait([j[3] for j in jobs], timeout=timer.time_left())
+        for fut in pending:
+            fut.cancel()
+        if pending:
+            # abandoned iteration: its finished tasks still searched nodes
+            self.stats.nodes += sum(fut.result()[2] for fut in done)
+            return None, None
+
+        if values is None:
+            values = {}
+        complete = True
+        for a, reward, weight, fut in jobs:
+            v, finished, nodes = fut.result()
+            self.stats.nodes += nodes
+            complete = complete and finished
+            values[a] = values.get(a, reward) + self.gamma * weight * v
+        if not complete or timer.expired():
+            return None, None
+        self.stats.max_depth_reached = max(self.stats.max_depth_reached, depth)
+        best_move = max(values, key=values.get)
+        return best_move, values[best_move]
+
+    def _max(self, board, depth, cache, timer, prob=1.0, fours=0):
         self.stats.bump(depth)
         if depth <= 0 or timer.expired():
-            return heuristic_score(board)
-        key = (board.tobytes(), True, depth)
-        if key in cache:
-            self.stats.tt_hits += 1
-            return cache[key]
-        moves = order_moves(board, apply_move_on_board)
-        if not moves:
-            v = heuristic_score(board); cache[key] = v; self.stats.tt_puts += 1; return v
+            return self._evaluate(board)
+        cached = self._lookup(cache, board, True, depth)
+        if cached is not None:
+            return cached
+        succs = self._successors(board)
+        if not succs:
+            v = self._dead_value(board); self._store(cache, board, True, depth, v, timer); return v
+        # order by values from the previous iteration or the TT (interior nodes with at least
+        # 2 plies left); leaves near the horizon just use merge reward
+        remember = self.smart_deepening and depth >= 2
+        hints = self._move_values.get(self._key(board)) if remember else None
+        if not hints and self.tt is not None and depth >= 2:
+            hints = self._tt_hints(succs)
+        succs = self._order(succs, hints)
         best = -float("inf")
-        for a in moves:
+        q = {}
+        for a, child, reward in succs:
             if timer.expired(): break
-            child, reward, _ = apply_move_on_board(board, a)
-            v = reward + self.gamma * self._expect(child, depth-1, cache, timer)
+            v = reward + self.gamma * self._expect(child, depth-1, cache, timer, prob, fours)
+            q[a] = v
             if v > best: best = v
-        cache[key] = best; self.stats.tt_puts += 1
+        if remember and not timer.expired():
+            self._move_values[self._key(board)] = q
+        self._store(cache, board, True, depth, best, timer)
         return best
 
-    def _expect(self, board, depth, cache, timer):
+    def _tt_hints(self, succs) -> Dict[int, float]:
+        """Move values from afterstates already in the TT, at whatever depth they were stored."""
+        hints = {}
+        for a, child, reward in succs:
+            v = self.tt.peek((self._key(child), False))
+            if v is not None:
+                hints[a] = reward + self.gamma * v
+        return hints
+
+    def _expect(self, board, depth, cache, timer, prob=1.0, fours=0):
         self.stats.bump(depth)
         if depth <= 0 or timer.expired():
-            return heuristic_score(board)
-        key = (board.tobytes(), False, depth)
-        if key in cache:
-            self.stats.tt_hits += 1
-            return cache[key]
-        empties = np.argwhere(board == 0)
-        if empties.size == 0:
-            v = self._max(board, depth, cache, timer)
-            cache[key] = v; self.stats.tt_puts += 1; return v
+            return self._evaluate(board)
+        cached = self._lookup(cache, board, False, depth)
+        if cached is not None:
+            return cached
+        if self.prob_threshold is not None and prob < self.prob_threshold:
+            # improbable branch: score it, but do not cache it as a searched value
+            return self._evaluate(board)
+        if self.batch_chance and depth <= 2:
+            v = self._expect_batch(board, depth)
+            self._store(cache, board, False, depth, v, timer); return v
+
+        empties = self._empties(board)
+        if not empties:
+            v = self._max(board, depth, cache, timer, prob, fours)
+            self._store(cache, board, False, depth, v, timer); return v
 
         cells = empties
-        if self.empty_cell_cap and len(empties) > self.empty_cell_cap:
+        if self.prob_threshold is None and self.empty_cell_cap and len(empties) > self.empty_cell_cap:
             idxs = self.rng.choice(len(empties), size=self.empty_cell_cap, replace=False)
-            cells = empties[idxs]
+            cells = [empties[i] for i in idxs]
 
-        exp_val = 0.0
-        for (i, j) in cells:
+        cell_prob = prob / len(empties)
+        exp_val, searched = 0.0, 0
+        for cell in cells:
             if timer.expired(): break
-            b2 = board.copy(); b2[i, j] = 2
-            exp_val += 0.9 * self._max(b2, depth, cache, timer)
-            b4 = board.copy(); b4[i, j] = 4
-            exp_val += 0.1 * self._max(b4, depth, cache, timer)
+            searched += 1
+            exp_val += 0.9 * self._max(self._place(board, cell, 2), depth, cache, timer, 0.9 * cell_prob, fours)
+            b4 = self._place(board, cell, 4)
+            if self.max_fours is not None and fours >= self.max_fours:
+                exp_val += 0.1 * self._evaluate(b4)
+            else:
+                exp_val += 0.1 * self._max(b4, depth, cache, timer, 0.1 * cell_prob, fours + 1)
 
-        if len(cells) != len(empties) and len(cells) > 0:
-            exp_val *= (len(empties) / len(cells))
+        if searched:
+            exp_val /= searched     # mean over the searched cells (a cut-off node is discarded anyway)
 
-        cache[key] = exp_val; self.stats.tt_puts += 1
+        self._store(cache, board, False, depth, exp_val, timer)
         return exp_val
+
+
+# ----- worker side of the parallel search -----
+
+_worker_search: Optional[ExpectimaxTimeControlled] = None
+_worker_live_move = None
+
+def _init_search_worker(agent, seed, live_move):
+    global _worker_search, _worker_live_move
+    agent.workers = 1
+    agent.rng = np.random.default_rng([seed, os.getpid()])
+    agent._move_id = -1
+    _worker_search, _worker_live_move = agent, live_move
+
+def _search_worker_task(move_id, is_max, board, depth, deadline, prob=1.0, fours=0):
+    """
+    Search one subtree until 'deadline' (time.time()); returns (value, finished_in_time, nodes).
+    Tasks of a move that is no longer being searched, or picked up after the deadline, return at once.
+    """
+    budget = deadline - time.time()
+    if move_id != _worker_live_move.value or budget <= 0:
+        return 0.0, False, 0
+    agent = _worker_search
+    if move_id != agent._move_id:
+        agent._move_id = move_id
+        if agent.tt is not None:
+            agent.tt.new_search()
+    agent.stats = SearchStats()
+    timer = Timer(budget); timer.start_now()
+    search = agent._max if is_max else agent._expect
+    v = search(board, depth, {}, timer, prob, fours)
+    return v, not timer.expired(), agent.stats.nodes
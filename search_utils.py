@@ -1,5 +1,8 @@
+import json
 import time
-from dataclasses import dataclass, field
+import numpy as np
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Iterable, List, Optional
 
 class Timer:
     def __init__(self, budget_sec: float):
@@ -15,13 +18,395 @@ class Timer:
     def expired(self) -> bool:
         return self.elapsed() >= self.budget
 
+class TimeManager:
+    """
+    Per-move time allocation for a time-controlled search.
+    - Budget: an average per-move budget (move_budget), or a total per-game budget
+      (game_budget) spread over the moves still expected (at least expected_moves / 4
+      are assumed left, so a long game slows down instead of running out).
+    - Difficulty: crowded boards and boards with many distinct tiles get up to
+      max_factor x the base time, open boards down to min_factor x.
+    - Banking: in per-move mode, time left unused (or overspent) is added to (or
+      repaid from) the next payback_moves moves, so the average stays on budget.
+    - A new game is detected when the tile sum drops (it only grows within a game).
+    """
+    def __init__(self, move_budget: float = 0.05, game_budget: Optional[float] = None,
+                 expected_moves: int = 1000, min_factor: float = 0.25, max_factor: float = 4.0,
+                 payback_moves: int = 20):
+        self.move_budget = float(move_budget)
+        self.game_budget = None if game_budget is None else float(game_budget)
+        self.expected_moves = int(expected_moves)
+        self.min_factor = float(min_factor)
+        self.max_factor = float(max_factor)
+        self.payback_moves = int(payback_moves)
+        self.new_game()
+
+    def new_game(self):
+        self.moves = 0
+        self.spent = 0.0
+        self.bank = 0.0
+        self._last_sum = 0
+
+    @staticmethod
+    def difficulty(empties: int, distinct: int) -> float:
+        """About 0.6 on an open board, 1 in the midgame, up to ~2 when (nearly) full."""
+        crowd = 1.0 - empties / 16.0
+        return 0.5 + 1.5 * crowd * crowd + 0.05 * max(distinct - 6, 0)
+
+    def allocate(self, board: np.ndarray) -> float:
+        """Seconds to spend on the move from this (4,4) tile-value board."""
+        tile_sum = int(board.sum())
+        if tile_sum < self._last_sum:
+            self.new_game()
+        self._last_sum = tile_sum
+        if self.game_budget is not None:
+            left = max(self.expected_moves - self.moves, self.expected_moves / 4)
+            base = max(self.game_budget - self.spent, 0.0) / left
+        else:
+            base = max(self.move_budget + self.bank / self.payback_moves, 0.0)
+        empties = int(np.count_nonzero(board == 0))
+        distinct = len(np.unique(board[board > 0]))
+        factor = min(max(self.difficulty(empties, distinct), self.min_factor), self.max_factor)
+        return base * factor
+
+    def record(self, seconds: float):
+        """Account for the time actually spent on the last move."""
+        self.moves += 1
+        self.spent += seconds
+        if self.game_budget is None:
+            self.bank += self.move_budget - seconds
+
 @dataclass
 class SearchStats:
+    """
+    Per-move search telemetry.
+    - nodes_by_depth counts nodes by remaining depth (a max node and the chance
+      nodes below it share one depth); batched frontiers are included, parallel
+      workers only add to 'nodes'.
+    - movegen_sec / eval_sec / order_sec are filled only when the agent's hooks
+      are wrapped by instrument() (telemetry=True); they include timer overhead.
+    - completed_depth is the deepest fully searched iteration, iteration_nodes its
+      node count; elapsed_sec / budget_sec are set when the move is returned.
+    - book_hit is set when the move came from an opening book (no search).
+    """
     nodes: int = 0
     max_depth_reached: int = 0
     tt_hits: int = 0
     tt_puts: int = 0
+    tt_probes: int = 0
+    nodes_by_depth: Dict[int, int] = field(default_factory=dict)
+    movegen_sec: float = 0.0
+    eval_sec: float = 0.0
+    order_sec: float = 0.0
+    completed_depth: int = 0
+    iteration_nodes: int = 0
+    elapsed_sec: float = 0.0
+    budget_sec: float = 0.0
+    book_hit: bool = False
+    @property
+    def tt_hit_rate(self) -> float:
+        return self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+    @property
+    def ebf(self) -> float:
+        """Effective branching factor per depth of the last completed iteration."""
+        if not self.completed_depth:
+            return 0.0
+        return max(self.iteration_nodes or self.nodes, 1) ** (1.0 / self.completed_depth)
+    @property
+    def overshoot_sec(self) -> float:
+        return max(0.0, self.elapsed_sec - self.budget_sec) if self.budget_sec else 0.0
     def bump(self, depth: int):
         self.nodes += 1
+        self.nodes_by_depth[depth] = self.nodes_by_depth.get(depth, 0) + 1
         if depth > self.max_depth_reached:
             self.max_depth_reached = depth
+    def add_nodes(self, depth: int, n: int):
+        self.nodes += n
+        self.nodes_by_depth[depth] = self.nodes_by_depth.get(depth, 0) + n
+    def to_dict(self) -> dict:
+        d = asdict(self)
+        d["nodes_by_depth"] = {str(k): v for k, v in sorted(self.nodes_by_depth.items())}
+        d.update(tt_hit_rate=self.tt_hit_rate, ebf=self.ebf, overshoot_sec=self.overshoot_sec)
+        return d
+
+class TimedCall:
+    """Callable wrapper that adds the wall time of each call to owner.stats.<field>."""
+    def __init__(self, owner, fn, field: str):
+        self.owner, self.fn, self.field = owner, fn, field
+    def __call__(self, *args):
+        t0 = time.perf_counter()
+        try:
+            return self.fn(*args)
+        finally:
+            stats = self.owner.stats
+            setattr(stats, self.field, getattr(stats, self.field) + time.perf_counter() - t0)
+
+_TIMED_HOOKS = (("_successors", "movegen_sec"), ("_apply", "movegen_sec"), ("_empties", "movegen_sec"),
+                ("_place", "movegen_sec"), ("_evaluate", "eval_sec"), ("_evaluate_batch", "eval_sec"),
+                ("_order", "order_sec"), ("_tt_hints", "order_sec"))
+
+def instrument(agent):
+    """Wrap the agent's move generation, evaluation and ordering hooks in TimedCall."""
+    for name, stat in _TIMED_HOOKS:
+        fn = getattr(agent, name, None)
+        if fn is not None and not isinstance(fn, TimedCall):
+            setattr(agent, name, TimedCall(agent, fn, stat))
+    return agent
+
+# ----- per-move traces -----
+
+def write_trace_jsonl(path: str, trace: Iterable[dict], **meta) -> None:
+    """Append one JSON line per move record; meta (e.g. seed=..., agent=...) is added to each line."""
+    with open(path, "a") as f:
+        for i, rec in enumerate(trace):
+            f.write(json.dumps({**meta, "move": i, **rec}) + "\n")
+
+def read_trace_jsonl(paths) -> List[dict]:
+    """Move records from one JSONL file or a list of them."""
+    if isinstance(paths, str):
+        paths = [paths]
+    records = []
+    for p in paths:
+        with open(p) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+def aggregate_traces(records: List[dict], tolerance_sec: float = 1e-3) -> dict:
+    """
+    Summary over move records from any number of games and runs. A time-controlled
+    search always stops just past its deadline, so overshoot_rate only counts moves
+    that ran more than tolerance_sec over budget.
+    """
+    if not records:
+        return {"moves": 0}
+    col = lambda k: np.array([r[k] for r in records], dtype=float)
+    elapsed, overshoot, depth = col("elapsed_sec"), col("overshoot_sec"), col("completed_depth")
+    by_depth: Dict[str, int] = {}
+    for r in records:
+        for k, v in r["nodes_by_depth"].items():
+            by_depth[k] = by_depth.get(k, 0) + v
+    total = float(elapsed.sum()) or 1.0
+    split = {k: float(col(k + "_sec").sum()) / total for k in ("movegen", "eval", "order")}
+    split["other"] = max(0.0, 1.0 - sum(split.values()))
+    return {
+        "moves": len(records),
+        "games": len({(r.get("run"), r.get("seed")) for r in records}),
+        "mean_nodes": float(col("nodes").mean()),
+        "nodes_per_sec": float(col("nodes").sum()) / total,
+        "mean_ebf": float(col("ebf").mean()),
+        "mean_completed_depth": float(depth.mean()),
+        "completed_depth_hist": {int(d): int(np.sum(depth == d)) for d in np.unique(depth)},
+        "tt_hit_rate": float(col("tt_hits").sum() / max(col("tt_probes").sum(), 1.0)),
+        "mean_move_sec": float(elapsed.mean()),
+        "p95_move_sec": float(np.percentile(elapsed, 95)),
+        "overshoot_rate": float(np.mean(overshoot > tolerance_sec)),
+        "p95_overshoot_sec": float(np.percentile(overshoot, 95)),
+        "max_overshoot_sec": float(overshoot.max()),
+        "time_split": split,
+        "nodes_by_depth": dict(sorted(by_depth.items(), key=lambda kv: int(kv[0]))),
+    }
+
+class TranspositionTable:
+    """
+    Depth-aware transposition table that is kept across moves and iterations.
+    - Entries map key -> (value, searched_depth, age); a probe hits only when the
+      stored depth equals the requested depth, so a cached value is exactly what a
+      fresh search would return (a deeper value is a different estimate; peek()
+      returns it for move ordering).
+    - new_search() starts a new age (call once per move).
+    - Replacement: an entry from the current search is only overwritten by an
+      equal or deeper result; entries from older searches are always replaced.
+    - When max_entries is reached, the least valuable half is evicted, where
+      worth = depth - age_penalty * (moves since the entry was written).
+    """
+    def __init__(self, max_entries: int = 2_000_000, age_penalty: float = 1.0):
+        self.max_entries = int(max_entries)
+        self.age_penalty = float(age_penalty)
+        self.entries = {}
+        self.age = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def new_search(self):
+        self.age += 1
+
+    def clear(self):
+        self.entries.clear()
+
+    def get(self, key, depth: int):
+        self.probes += 1
+        e = self.entries.get(key)
+        if e is None or e[1] != depth:
+            return None
+        self.hits += 1
+        return e[0]
+
+    def peek(self, key):
+        """Stored value at any depth (a move-ordering hint); not counted as a probe."""
+        e = self.entries.get(key)
+        return None if e is None else e[0]
+
+    def put(self, key, depth: int, value: float):
+        old = self.entries.get(key)
+        if old is not None:
+            if old[2] == self.age and old[1] > depth:
+                return
+        elif len(self.entries) >= self.max_entries:
+            self._evict()
+        self.entries[key] = (value, depth, self.age)
+        self.stores += 1
+
+    def _evict(self):
+        keys = list(self.entries.keys())
+        worth = np.array([e[1] - self.age_penalty * (self.age - e[2]) for e in self.entries.values()])
+        drop = np.argpartition(worth, len(keys) // 2)[:len(keys) // 2]
+        for i in drop:
+            del self.entries[keys[i]]
+        self.evictions += len(drop)
+
+
+_HASH_MUL = 0x9E3779B97F4A7C15     # Fibonacci hashing of the packed board
+_MASK64 = (1 << 64) - 1
+_USED, _MAX_NODE = 1, 2            # slot flags
+_MAX_FLAG, _CHANCE_FLAG = _USED | _MAX_NODE, _USED
+
+
+class ArrayTranspositionTable:
+    """
+    TranspositionTable with a fixed memory footprint: preallocated NumPy arrays
+    with open addressing, sized in MB. Same get / put / peek / new_search interface.
+    - Keys are (packed 64-bit board as a Python int, is_max), as built by the agents
+      with use_bitboard=True or symmetric=True (checked by the agents, via
+      needs_packed_keys); each slot holds the board, the value
+      (float64), the searched depth, the node type and the age (22 bytes).
+    - A key lives in one of 'cluster' consecutive slots after its hash slot.
+    - A probe hits only at the stored depth, as in TranspositionTable: a table kept across
+      a whole game (agent_server) never answers with a value of another depth.
+    - Replacement: the key's own slot is updated like TranspositionTable (an entry
+      from the current search only by an equal or deeper result); otherwise a free
+      slot is taken, else the cluster's least valuable slot is overwritten, where
+      worth = depth - age_penalty * (moves since the entry was written).
+    - Stats: occupancy, collisions (new keys whose hash slot was already taken)
+      and replacements (live entries overwritten because the cluster was full).
+    """
+    needs_packed_keys = True
+
+    def __init__(self, size_mb: float = 64.0, cluster: int = 4, age_penalty: float = 1.0):
+        slot_bytes = 8 + 8 + 1 + 1 + 4
+        bits = max(4, int(np.floor(np.log2(size_mb * 2**20 / slot_bytes))))
+        self.n_slots = 1 << bits
+        self._shift = 64 - bits
+        self._mask = self.n_slots - 1
+        self.cluster = int(cluster)
+        self.age_penalty = float(age_penalty)
+        self.keys = np.zeros(self.n_slots, dtype=np.uint64)
+        self.values = np.zeros(self.n_slots, dtype=np.float64)
+        self.depths = np.zeros(self.n_slots, dtype=np.int8)
+        self.flags = np.zeros(self.n_slots, dtype=np.uint8)
+        self.ages = np.zeros(self.n_slots, dtype=np.int32)
+        self._bind()
+        self.age = 0
+        self.used = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0
+        self.replacements = 0
+
+    def _bind(self):
+        # memoryviews of the arrays: scalar reads / writes without creating NumPy scalars
+        self._k, self._v, self._d, self._f, self._a = (memoryview(a) for a in
+                                                       (self.keys, self.values, self.depths, self.flags, self.ages))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ("_k", "_v", "_d", "_f", "_a"):
+            state.pop(k)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.keys, self.values, self.depths, self.flags, self.ages))
+
+    @property
+    def occupancy(self) -> float:
+        return self.used / self.n_slots
+
+    def __len__(self):
+        return self.used
+
+    def new_search(self):
+        self.age += 1
+
+    def clear(self):
+        self.flags[:] = 0
+        self.used = 0
+
+    def _find(self, board: int, flag: int) -> int:
+        # slots are never emptied one by one, so an empty slot ends the key's cluster
+        i = ((board * _HASH_MUL) & _MASK64) >> self._shift
+        f, k = self._f, self._k
+        for _ in range(self.cluster):
+            fi = f[i]
+            if fi == flag and k[i] == board:
+                return i
+            if not fi:
+                return -1
+            i = (i + 1) & self._mask
+        return -1
+
+    def get(self, key, depth: int):
+        self.probes += 1
+        board, is_max = key
+        i = self._find(board, _MAX_FLAG if is_max else _CHANCE_FLAG)
+        if i < 0 or self._d[i] != depth:
+            return None
+        self.hits += 1
+        return self._v[i]
+
+    def peek(self, key):
+        """Stored value at any depth (a move-ordering hint); not counted as a probe."""
+        board, is_max = key
+        i = self._find(board, _MAX_FLAG if is_max else _CHANCE_FLAG)
+        return None if i < 0 else self._v[i]
+
+    def put(self, key, depth: int, value: float):
+        board, is_max = key
+        flag = _MAX_FLAG if is_max else _CHANCE_FLAG
+        f, k, d, a = self._f, self._k, self._d, self._a
+        home = i = ((board * _HASH_MUL) & _MASK64) >> self._shift
+        for _ in range(self.cluster):
+            fi = f[i]
+            if not fi:                                    # new key, free slot
+                self.used += 1
+                if i != home:
+                    self.collisions += 1
+                k[i], f[i] = board, flag
+                break
+            if fi == flag and k[i] == board:              # own slot
+                if a[i] == self.age and d[i] > depth:
+                    return
+                break
+            i = (i + 1) & self._mask
+        else:                                             # cluster full: overwrite the least valuable slot
+            self.collisions += 1
+            self.replacements += 1
+            slots = [(home + j) & self._mask for j in range(self.cluster)]
+            i = min(slots, key=lambda j: d[j] - self.age_penalty * (self.age - a[j]))
+            k[i], f[i] = board, flag
+        self._v[i], d[i], a[i] = float(value), depth, self.age
+        self.stores += 1
+
+    def stats(self) -> dict:
+        return {"slots": self.n_slots, "mb": self.nbytes / 2**20, "used": self.used, "occupancy": self.occupancy,
+                "probes": self.probes, "hits": self.hits, "stores": self.stores,
+                "collisions": self.collisions, "replacements": self.replacements}
@@ -0,0 +1,62 @@
+import threading
+import numpy as np
+from agent_server import AgentServer, MoveClient, play_remote
+from game_engine import Game2048
+
+def test_server_keeps_game_state_warm_and_pinned():
+    board = Game2048(seed=1).board
+    with AgentServer(port=0, workers=2, agent="random") as srv:
+        with MoveClient(port=srv.port) as c:
+            first = c.move("a", board, agent="expectimax")
+            again = c.move("a", board)
+            assert first["action"] == again["action"] and again["nodes"] < first["nodes"]   # warm TT
+            c.move("b", board)
+            assert c.stats()["games"] == [1, 1]
+            assert c.end("a")["ended"] and c.stats()["games"] == [0, 1]
+            over = np.array([[2, 4, 2, 4], [4, 2, 4, 2]] * 2)
+            assert c.move("b", over)["game_over"]
+            try:
+                c.move("b", [[2, 4]])
+                assert False, "bad board accepted"
+            except RuntimeError as e:
+                assert "4x4" in str(e)
+
+def test_concurrent_games():
+    results = {}
+    with AgentServer(port=0, workers=2, agent="greedy") as srv:
+        def run(k):
+            with MoveClient(port=srv.port) as c:
+                results[k] = play_remote(c, f"g{k}", seed=k)
+        threads = [threading.Thread(target=run, args=(k,)) for k in range(4)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        with MoveClient(port=srv.port) as c:
+            assert c.stats()["games"] == [0, 0]
+    assert sorted(results) == [0, 1, 2, 3] and all(r["moves"] > 0 for r in results.values())
+
+def test_evicted_games_are_released():
+    board = Game2048(seed=2).board
+    with AgentServer(port=0, workers=1, agent="greedy", max_games=2) as srv:
+        with MoveClient(port=srv.port) as c:
+            for g in ("a", "b", "c", "d"):      # never ended
+                c.move(g, board)
+            assert c.stats()["games"] == [2]
+            assert sorted(srv.assignment) == ["c", "d"]
+            c.move("a", board)                   # comes back as a new game
+            assert c.stats()["games"] == [2] and sorted(srv.assignment) == ["a", "d"]
+
+if __name__ == "__main__":
+
+    import inspect, sys
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,91 @@
+import numpy as np
+from game_engine import Game2048, UP, DOWN, LEFT, RIGHT
+from bitboard import to_bitboard, from_bitboard, apply_move, apply_move_batch, transpose, empty_cells, place_tile, successors
+from expectimax_agent import apply_move_on_board, successors_for_board, ExpectimaxAgent
+from orderings import order_successors
+
+def random_board(rng):
+    exps = rng.integers(0, 12, size=(4, 4))
+    return np.where(exps > 0, 2 ** exps, 0).astype(np.int64)
+
+def test_roundtrip():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        b = random_board(rng)
+        assert (from_bitboard(to_bitboard(b)) == b).all()
+
+def test_transpose():
+    rng = np.random.default_rng(1)
+    b = random_board(rng)
+    assert (from_bitboard(transpose(to_bitboard(b))) == b.T).all()
+
+def test_moves_match_array_engine():
+    rng = np.random.default_rng(2)
+    for _ in range(200):
+        b = random_board(rng)
+        for a in (UP, DOWN, LEFT, RIGHT):
+            out, reward, changed = apply_move_on_board(b, a)
+            pout, preward, pchanged = apply_move(to_bitboard(b), a)
+            assert (from_bitboard(pout) == out).all()
+            assert preward == reward
+            assert pchanged == changed
+
+def test_batch_moves_match_array_engine():
+    rng = np.random.default_rng(4)
+    boards = np.stack([random_board(rng) for _ in range(100)])
+    for a in (UP, DOWN, LEFT, RIGHT):
+        out, rewards, changed = apply_move_batch(boards, a)
+        for k in range(len(boards)):
+            o, r, c = apply_move_on_board(boards[k], a)
+            assert (out[k] == o).all() and rewards[k] == r and changed[k] == c
+
+def test_successors_match_array_engine():
+    rng = np.random.default_rng(5)
+    for _ in range(100):
+        b = random_board(rng)
+        packed = successors(to_bitboard(b))
+        arr = successors_for_board(b)
+        assert [s[0] for s in packed] == [s[0] for s in arr]
+        for (a, pc, pr), (_, c, r) in zip(packed, arr):
+            assert (from_bitboard(pc) == c).all() and pr == r
+        ordered = order_successors(arr, {arr[-1][0]: 1.0} if arr else None)
+        assert sorted(s[0] for s in ordered) == [s[0] for s in arr]
+        if arr:
+            assert ordered[0][0] == arr[-1][0]
+
+def test_spawn_cells():
+    b = np.array([[2, 0, 0, 0],
+                  [0, 0, 0, 0],
+                  [0, 0, 0, 0],
+                  [0, 0, 0, 4]], dtype=np.int64)
+    packed = to_bitboard(b)
+    cells = empty_cells(packed)
+    assert len(cells) == 14 and 0 not in cells and 15 not in cells
+    b[1, 2] = 4
+    assert place_tile(packed, 6, 4) == to_bitboard(b)
+
+def test_bitboard_game_and_agent():
+    g1, g2 = Game2048(seed=3), Game2048(seed=3, use_bitboard=True)
+    for a in (LEFT, UP, RIGHT, DOWN, LEFT, UP):
+        assert g1.step(a)[1] == g2.step(a)[1]
+        assert (g1.board == g2.board).all()
+    arr = ExpectimaxAgent(depth=2, empty_cell_cap=0)
+    packed = ExpectimaxAgent(depth=2, empty_cell_cap=0, use_bitboard=True)
+    batched = ExpectimaxAgent(depth=2, empty_cell_cap=0, batch_chance=True)
+    assert arr.select_action(g1) == packed.select_action(g1) == batched.select_action(g1)
+
+if __name__ == "__main__":
+
+    import inspect, sys
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
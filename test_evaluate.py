@@ -0,0 +1,26 @@
+import sys
+from agents import RandomAgent
+from expectimax_agent import ExpectimaxAgent
+from evaluate import game_seeds, play_games
+
+def test_play_games_is_seed_exact_across_workers():
+    seeds = game_seeds(6, seed=11)
+    for agent in (RandomAgent(), ExpectimaxAgent(depth=1, empty_cell_cap=4, use_bitboard=True)):
+        serial = play_games(agent, seeds, workers=1)
+        parallel = play_games(agent, seeds, workers=2)
+        assert [r["seed"] for r in parallel] == seeds
+        assert [(r["score"], r["max_tile"]) for r in parallel] == [(r["score"], r["max_tile"]) for r in serial]
+
+if __name__ == "__main__":
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
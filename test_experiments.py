@@ -0,0 +1,48 @@
+import os
+import tempfile
+import numpy as np
+from experiments import grid, run_grid, RunningSummary
+from evaluate import game_seeds, summarize
+
+def test_grid_resumes_from_cache():
+    configs = grid({"agent": "expectimax", "use_bitboard": True, "empty_cell_cap": 2}, depth=[1, 2])
+    with tempfile.TemporaryDirectory() as d:
+        first = run_grid(configs, game_seeds(2, 1), d)
+        assert [r["played"] for r in first] == [2, 2]
+        path = os.path.join(d, first[0]["key"], "games.jsonl")
+        with open(path, "a") as f:
+            f.write('{"seed": 12, "sco')          # torn line from an interrupted run
+        seen = []
+        again = run_grid(configs, game_seeds(3, 1), d, progress=lambda c, s, n, t: seen.append((n, t)))
+        assert [(r["cached"], r["played"]) for r in again] == [(2, 1), (2, 1)]
+        assert seen == [(3, 3), (3, 3)]
+        assert all(a["avg_score"] == b["avg_score"] for a, b in zip(first, run_grid(configs, game_seeds(2, 1), d)))
+        other = run_grid(configs[:1], game_seeds(2, 1), d, version="edited")
+        assert other[0]["played"] == 2 and other[0]["key"] != first[0]["key"]
+
+def test_running_summary_matches_summarize():
+    rng = np.random.default_rng(0)
+    scores, tiles = rng.integers(0, 30000, 25), 2 ** rng.integers(8, 13, 25)
+    running = RunningSummary()
+    for s, t in zip(scores, tiles):
+        running.add({"score": s, "max_tile": t})
+    got, want = running.summary(), summarize(scores, tiles)
+    for k in want:
+        assert np.isclose(got[k], want[k]) if k != "best_tile_hist" else got[k] == want[k], k
+    assert np.isclose(got["std_score"], np.std(scores, ddof=1))
+
+if __name__ == "__main__":
+
+    import inspect, sys
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,62 @@
+import numpy as np
+from heuristics import heuristic_score, heuristic_score_packed, heuristic_score_batch
+from bitboard import to_bitboard, symmetries, canonical
+
+def random_board(rng):
+    exps = rng.integers(0, 16, size=(4, 4))
+    exps[rng.random((4, 4)) < 0.4] = 0
+    return np.where(exps > 0, 2 ** exps, 0).astype(np.int64)
+
+def test_packed_matches_default_weights():
+    rng = np.random.default_rng(0)
+    for _ in range(500):
+        b = random_board(rng)
+        assert heuristic_score_packed(to_bitboard(b)) == heuristic_score(b)
+
+def test_packed_matches_custom_weights():
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        b = random_board(rng)
+        w = {"empty": 100.0, "mono": 1.5, "smooth": 0.3, "corner": 20.0, "pos": 0.7}
+        assert heuristic_score_packed(to_bitboard(b), w) == heuristic_score(b, w)
+
+def test_packed_empty_and_full_boards():
+    empty = np.zeros((4, 4), dtype=np.int64)
+    assert heuristic_score_packed(0) == heuristic_score(empty)
+    full = np.full((4, 4), 32768, dtype=np.int64)
+    assert heuristic_score_packed(to_bitboard(full)) == heuristic_score(full)
+
+def test_batch_matches_scalar():
+    rng = np.random.default_rng(2)
+    boards = np.stack([random_board(rng) for _ in range(300)])
+    scores = heuristic_score_batch(boards)
+    assert all(scores[i] == heuristic_score(boards[i]) for i in range(len(boards)))
+
+def test_symmetric_score_is_invariant():
+    rng = np.random.default_rng(3)
+    for _ in range(100):
+        b = random_board(rng)
+        ref = heuristic_score(b, symmetric=True)
+        for k in range(4):
+            for v in (np.rot90(b, k), np.rot90(b, k).T):
+                assert heuristic_score(np.ascontiguousarray(v), symmetric=True) == ref
+        packed = to_bitboard(b)
+        assert all(heuristic_score_packed(v, symmetric=True) == ref for v in symmetries(packed))
+        assert heuristic_score_batch(b[None], symmetric=True)[0] == ref
+        assert len({canonical(v) for v in symmetries(packed)}) == 1
+
+if __name__ == "__main__":
+
+    import inspect, sys
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
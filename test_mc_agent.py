@@ -0,0 +1,60 @@
+import numpy as np
+from mc_agent import MonteCarloAgent
+from game_engine import Game2048
+from evaluate import play_one_game
+
+def test_picks_legal_moves_within_budget():
+    for policy in ("random", "greedy"):
+        agent = MonteCarloAgent(0.01, rollouts_per_move=8, policy=policy, rng=np.random.default_rng(0))
+        g = Game2048(seed=3)
+        for _ in range(5):
+            a = agent.select_action(g)
+            assert a in g.legal_moves()
+            assert agent.stats.rollouts > 0 and agent.stats.rollouts_per_sec > 0
+            g.step(a)
+
+def test_without_time_the_capped_first_round_decides_deterministically():
+    g = Game2048(seed=6)
+    moves = []
+    for _ in range(2):
+        agent = MonteCarloAgent(0.0, rollouts_per_move=8, rng=np.random.default_rng(9))
+        moves.append([agent.select_action(g) for _ in range(3)])
+        assert agent.stats.rounds == 1 and agent.stats.rollout_moves <= 8 * 4 * agent.first_round_moves
+    assert moves[0] == moves[1]
+
+def test_default_budget_plays_full_rounds():
+    agent = MonteCarloAgent(rng=np.random.default_rng(0))
+    g = Game2048(seed=1)
+    agent.select_action(g)
+    assert agent.stats.full_rounds >= 1 and agent.stats.rounds == agent.stats.full_rounds + 1
+    assert agent.stats.rollout_moves <= agent.stats.rollouts * agent.max_rollout_moves
+
+def test_avoids_the_losing_move():
+    # LEFT / RIGHT merge nothing and leave one open cell; UP / DOWN merge the 2s and open more room.
+    # Zero budget: only the capped first round is played, so the move depends on the rng alone.
+    board = np.array([[2, 4, 8, 16], [2, 32, 64, 128], [256, 512, 1024, 4], [8, 16, 0, 64]])
+    agent = MonteCarloAgent(0.0, rollouts_per_move=64, policy="greedy", rng=np.random.default_rng(1))
+    assert agent.select_action(Game2048(board=board)) in (0, 1)   # UP or DOWN
+
+def test_plays_full_game_with_play_one_game():
+    agent = MonteCarloAgent(0.002, rollouts_per_move=4, max_rollout_moves=5, rng=np.random.default_rng(2),
+                            telemetry=True)
+    r = play_one_game(agent, seed=4)
+    assert r["score"] > 0 and len(agent.trace) > 10
+    assert all(t["rollout_moves"] <= 5 * t["rollouts"] + 4 * 4 * 5 for t in agent.trace)
+
+if __name__ == "__main__":
+
+    import inspect, sys
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
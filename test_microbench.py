@@ -0,0 +1,45 @@
+import numpy as np
+from microbench import welch_test, compare, measure
+
+def test_welch_test_matches_reference():
+    # reference: scipy.stats.ttest_ind(y, x, equal_var=False)
+    x = [10.0, 11.0, 9.5, 10.5, 10.2]
+    y = [12.0, 11.5, 13.0, 12.2]
+    t, df, p = welch_test(x, y)
+    assert abs(t - 4.8391) < 1e-3 and abs(df - 6.1828) < 1e-3 and abs(p - 0.0026548) < 1e-6
+
+def test_compare_flags_only_significant_slowdowns():
+    mk = lambda rates: {"ops_per_sec": rates, "mean_ops_per_sec": float(np.mean(rates))}
+    base = {"results": {"a": mk([100, 101, 99, 100, 100]), "b": mk([100, 120, 80, 110, 90])}}
+    cur = {"results": {"a": mk([80, 81, 79, 80, 80]), "b": mk([85, 120, 70, 100, 95])}}
+    verdicts = {r["name"]: r["verdict"] for r in compare(base, cur)}
+    assert verdicts == {"a": "REGRESSION", "b": "ok"}
+
+def test_compare_uses_node_rate_of_timed_searches():
+    # a 50 ms search keeps its ops/sec at 20 however slow it gets; its node rate shows the slowdown
+    mk = lambda ops, nodes: {"ops_per_sec": ops, "mean_ops_per_sec": float(np.mean(ops)),
+                             "nodes_per_sec": nodes, "mean_nodes_per_sec": float(np.mean(nodes))}
+    base = {"results": {"tc": mk([20.0, 19.9, 20.1, 20.0, 19.9], [5000, 5050, 4950, 5010, 4990])}}
+    cur = {"results": {"tc": mk([20.0, 20.1, 19.9, 20.0, 20.0], [3500, 3550, 3450, 3510, 3490])}}
+    [row] = compare(base, cur)
+    assert row["metric"] == "nodes_per_sec" and row["verdict"] == "REGRESSION" and row["change"] < -0.25
+
+def test_measure_counts_ops_and_nodes():
+    r = measure(lambda: (10, 30), warmup=1, repeats=3, min_time=0.0)
+    assert len(r["ops_per_sec"]) == 3 and r["ops"] == 10 * r["loops"] and r["nodes"] == 30 * r["loops"]
+
+if __name__ == "__main__":
+
+    import inspect, sys
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -57,6 +57,25 @@ def test_game_over_detection():
     _, _, done, info = g.step(LEFT)
     assert done and info["invalid"]
 
+def test_peeks_memoized_until_board_changes():
+    g = Game2048(seed=0)
+    g.board = board_from_rows([[2,2,0,0],
+                               [0,0,0,0],
+                               [0,0,0,0],
+                               [0,0,0,0]])
+    assert g._peek(LEFT) is g._peek(LEFT)
+    g.board[0, 2] = 4                       # direct write invalidates the memo
+    new_b, gain, changed = g._peek(LEFT)
+    assert (new_b[0] == np.array([4,4,0,0])).all() and gain == 4
+
+def test_step_fused_reports_next_legal_moves():
+    g1, g2 = Game2048(seed=5), Game2048(seed=5)
+    for a in (LEFT, UP, RIGHT, DOWN) * 5:
+        b1, r1, d1, _ = g1.step(a)
+        b2, r2, d2, info = g2.step_fused(a)
+        assert (b1 == b2).all() and r1 == r2 and d1 == d2
+        assert [a for a in (UP, DOWN, LEFT, RIGHT) if info["legal_mask"][a]] == g1.legal_moves()
+
 if __name__ == "__main__":
 
     import inspect, sys
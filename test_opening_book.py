@@ -0,0 +1,80 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import bitboard
+from game_engine import Game2048
+from expectimax_agent import ExpectimaxAgent
+from profile_search import ExpectimaxTimeControlled
+from opening_book import OpeningBook, build_book, start_positions, search_position
+
+def _random_board(rng):
+    return int(sum(int(e) << (4 * k) for k, e in enumerate(rng.integers(0, 6, 16))))
+
+def test_symmetry_actions_map_moves():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        b = _random_board(rng)
+        syms = bitboard.symmetries(b)
+        for k in range(8):
+            for a in range(4):
+                assert bitboard.symmetries(bitboard.move(b, a)[0])[k] == \
+                    bitboard.move(syms[k], bitboard.SYMMETRY_ACTIONS[k][a])[0]
+                assert bitboard.INVERSE_SYMMETRY_ACTIONS[k][bitboard.SYMMETRY_ACTIONS[k][a]] == a
+        c, k = bitboard.canonical_with_index(b)
+        assert c == bitboard.canonical(b) == syms[k]
+
+def test_start_positions_sum_to_one():
+    for symmetric in (True, False):
+        starts = start_positions(symmetric)
+        assert abs(sum(starts.values()) - 1.0) < 1e-9
+    assert len(start_positions(True)) < len(start_positions(False))
+
+def test_book_probe_matches_search_on_all_symmetries():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "book.npy")
+        n = build_book(path, plies=2, width=10, depth=2, empty_cell_cap=4)
+        book = OpeningBook(path)
+        assert len(book) == n > 10 and np.all(np.diff(book.keys.astype(np.float64)) > 0)
+        for b in book.keys[:5].tolist():
+            move, value = search_position(b, 2, 4, True)
+            for sym in bitboard.symmetries(b):
+                hit = book.probe(sym)
+                assert hit is not None and hit[2] == 2 and abs(hit[1] - value) < 1e-3 * abs(value) + 1e-3
+                # the book move on a symmetric board leads to the image of the searched move's afterstate
+                assert bitboard.canonical(bitboard.move(sym, hit[0])[0]) == bitboard.canonical(bitboard.move(b, move)[0])
+        assert book.probe(bitboard.to_bitboard(np.full((4, 4), 2))) is None and book.misses == 1
+
+def test_agents_play_book_moves():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "book.npy")
+        build_book(path, plies=1, width=20, depth=2, empty_cell_cap=4)
+        book = OpeningBook(path)
+        g = Game2048(seed=5)
+        b = bitboard.to_bitboard(g.board)
+        assert book.probe(b) is not None
+        agent = ExpectimaxAgent(depth=3, empty_cell_cap=4, symmetric=True, book=book)
+        assert agent.select_action(g) == book.probe(b)[0] and agent.stats.book_hit and agent.stats.nodes == 0
+        assert agent.stats.completed_depth == 2       # the book's depth, not the agent's
+        tc = ExpectimaxTimeControlled(0.05, use_bitboard=True, symmetric=True, book=book)
+        assert tc.select_action(g) == book.probe(b)[0] and tc.stats.book_hit and tc.last_depth == 2
+        assert tc.stats.nodes == 0 and tc.stats.completed_depth == 2
+        try:
+            ExpectimaxAgent(depth=2, book=book)
+            assert False, "symmetric mismatch should raise"
+        except ValueError:
+            pass
+
+if __name__ == "__main__":
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,216 @@
+import os
+import pickle
+import tempfile
+import numpy as np
+import bitboard
+from game_engine import Game2048
+from expectimax_agent import ExpectimaxAgent
+from profile_search import ExpectimaxTimeControlled
+from search_utils import Timer, TranspositionTable, ArrayTranspositionTable, TimeManager, write_trace_jsonl, read_trace_jsonl, aggregate_traces
+from evaluate import play_seeded_game
+
+def test_transposition_table_depth_and_age():
+    tt = TranspositionTable(max_entries=4)
+    tt.new_search()
+    tt.put("a", 2, 1.0)
+    assert tt.get("a", 2) == 1.0 and tt.get("a", 3) is None and tt.get("a", 1) is None   # exact depth only
+    tt.put("a", 1, 5.0)                      # shallower, same search: kept
+    assert tt.get("a", 2) == 1.0 and tt.peek("a") == 1.0
+    tt.new_search()
+    tt.put("a", 1, 5.0)                      # older entry: replaced
+    assert tt.peek("a") == 5.0
+    for k in "bcde":
+        tt.put(k, 1, 0.0)
+    assert len(tt) <= 4 and tt.evictions > 0
+
+def test_table_reproduces_search_without_table():
+    # a table kept across moves must not change any value: chance nodes are expectations and
+    # entries only answer probes at their own depth
+    g = Game2048(seed=2)
+    with_tt = ExpectimaxAgent(depth=2, empty_cell_cap=0, use_bitboard=True, tt=TranspositionTable())
+    for _ in range(3):
+        fresh = ExpectimaxAgent(depth=2, empty_cell_cap=0, use_bitboard=True)
+        move = with_tt.select_action(g)
+        assert move == fresh.select_action(g)
+        for a, v in fresh.root_values.items():
+            assert np.isclose(with_tt.root_values[a], v), (a, with_tt.root_values[a], v)
+        g.step(move)
+    assert with_tt.tt.hits > 0
+
+def test_path_options_that_never_fire_reproduce_plain_search():
+    g = Game2048(seed=6)
+    for _ in range(5):
+        g.step(ExpectimaxAgent(depth=1, use_bitboard=True).select_action(g))
+    plain = ExpectimaxAgent(depth=2, empty_cell_cap=0, use_bitboard=True)
+    plain.select_action(g)
+    for option in ({"prob_threshold": 1e-12}, {"max_fours": 99}):
+        a = ExpectimaxAgent(depth=2, empty_cell_cap=0, use_bitboard=True, tt=TranspositionTable(), **option)
+        a.select_action(g)
+        assert a.root_values.keys() == plain.root_values.keys() and a.tt.stores == 0
+        for m, v in plain.root_values.items():
+            assert np.isclose(a.root_values[m], v), (option, m, a.root_values[m], v)
+        tc = ExpectimaxTimeControlled(10.0, empty_cell_cap=0, use_bitboard=True, **option)
+        board = bitboard.to_bitboard(g.board)
+        values = {}
+        timer = Timer(10.0); timer.start_now()
+        tc._search_root(board, tc._successors(board), 2, {}, timer, values)
+        for m, v in plain.root_values.items():
+            assert np.isclose(values[m], v), (option, m, values[m], v)
+
+def test_array_transposition_table():
+    tt = ArrayTranspositionTable(size_mb=0.001, cluster=2)       # 32 slots
+    assert tt.n_slots == 32 and tt.nbytes <= 0.001 * 2**20
+    tt.new_search()
+    tt.put((7, True), 2, 1.0)
+    assert tt.get((7, True), 2) == 1.0 and tt.get((7, True), 3) is None and tt.get((7, False), 0) is None
+    tt.put((7, True), 1, 5.0)                # shallower, same search: kept
+    assert tt.peek((7, True)) == 1.0
+    tt.new_search()
+    tt.put((7, True), 1, 5.0)                # older entry: replaced
+    assert tt.peek((7, True)) == 5.0
+    for b in range(1000):
+        tt.put((b << 8, b % 2 == 0), 1 + b % 3, float(b))
+    assert len(tt) == 32 and tt.occupancy == 1.0 and tt.replacements > 0 and tt.collisions > 0
+    tt2 = pickle.loads(pickle.dumps(tt))
+    assert tt2.stats() == tt.stats() and tt2.peek((999 << 8, False)) == 999.0
+    tt.clear()
+    assert len(tt) == 0 and tt.peek((999 << 8, False)) is None
+
+def test_agents_with_array_table_match_dict_table():
+    g = Game2048(seed=3)
+    for _ in range(20):
+        g.step(ExpectimaxAgent(depth=1, use_bitboard=True).select_action(g))
+    # no subsampling: table hits skip rng draws, so sampled cells would differ from the table-free search
+    for make in (lambda tt: ExpectimaxAgent(depth=3, empty_cell_cap=0, use_bitboard=True, tt=tt),
+                 lambda tt: ExpectimaxTimeControlled(10.0, empty_cell_cap=0, use_bitboard=True, tt=tt,
+                                                     early_stop_margin=0.0)):
+        none, a, b = make(None), make(TranspositionTable()), make(ArrayTranspositionTable(8))
+        moves = [agent.select_action(g) for agent in (none, a, b)]
+        assert moves[0] == moves[1] == moves[2]
+        assert np.isclose(a.last_value, none.last_value) and np.isclose(b.last_value, none.last_value)
+        assert a.stats.tt_hits == b.stats.tt_hits and b.tt.stores > 0
+        if isinstance(none, ExpectimaxAgent):
+            for m, v in none.root_values.items():
+                assert np.isclose(b.root_values[m], v)
+        g2 = Game2048(seed=9)
+        g2.board[:] = g.board
+        g2.step(moves[0])
+        # the tables are kept for the next move; a fresh table-free agent must still agree
+        assert b.select_action(g2) == make(None).select_action(g2)
+    try:
+        ExpectimaxAgent(tt=ArrayTranspositionTable(1))
+        assert False, "array boards accepted"
+    except ValueError:
+        pass
+
+def test_time_manager_allocation():
+    open_board = np.zeros((4, 4), dtype=np.int64); open_board[0, :2] = 2
+    crowded = np.array([[2, 4, 8, 16], [32, 64, 128, 256], [512, 2, 4, 8], [0, 0, 2, 4]], dtype=np.int64)
+    tm = TimeManager(move_budget=0.01)
+    assert tm.allocate(crowded) > 0.01 > tm.allocate(open_board)
+    for _ in range(200):                     # unused time is banked, overspend repaid
+        tm.record(tm.allocate(crowded) * 0.5)
+    assert tm.bank > 0 and tm.allocate(crowded) > TimeManager(move_budget=0.01).allocate(crowded)
+    tm.allocate(open_board)                  # tile sum dropped: new game
+    assert tm.moves == 0 and tm.bank == 0.0
+    game = TimeManager(game_budget=1.0, expected_moves=100)
+    for _ in range(1000):
+        game.record(game.allocate(crowded))
+    assert game.spent <= 1.0 + 1e-9
+
+def test_next_iteration_fits_uses_projected_cost():
+    timer = Timer(1.0); timer.start_now()
+    fits = ExpectimaxTimeControlled._next_iteration_fits
+    assert fits([], timer)
+    # 10000 nodes after 2 plies: ebf 100, so the next iteration is projected at 0.05 s x 100 = 5 s
+    assert not fits([(0.01, 100), (0.05, 10000)], timer)
+    assert fits([(0.001, 4), (0.002, 16)], timer)          # ebf 4: 8 ms
+    assert not fits([(0.3, 4), (0.4, 16)], timer)          # ebf 4: 1.6 s > 1 s
+
+def test_smart_deepening_only_reorders_moves():
+    # at a fixed depth, values carried over from shallower iterations change the search order, not the result
+    g = Game2048(seed=8)
+    for _ in range(6):
+        g.step(ExpectimaxAgent(depth=1, use_bitboard=True).select_action(g))
+    board = bitboard.to_bitboard(g.board)
+    results = []
+    for smart in (False, True):
+        tc = ExpectimaxTimeControlled(10.0, empty_cell_cap=0, use_bitboard=True, smart_deepening=smart)
+        timer = Timer(10.0); timer.start_now()
+        succs = tc._successors(board)
+        root_values = {}
+        for depth in (1, 2, 3):
+            values = {}
+            ordered = tc._order(succs, root_values if smart else None)
+            mv, _ = tc._search_root(board, ordered, depth, {}, timer, values)
+            previous, root_values = root_values, values
+        assert not smart or tc._move_values
+        results.append((mv, root_values, ordered[0][0], max(previous, key=previous.get)))
+    (mv0, v0, _, _), (mv1, v1, first, best_at_2) = results
+    assert v0.keys() == v1.keys() and all(np.isclose(v1[a], v0[a]) for a in v0)
+    assert mv0 == mv1 and first == best_at_2              # depth 3 searched depth 2's best move first
+
+def test_early_stop_on_clear_best_move():
+    g = Game2048(seed=0)
+    g.board[:] = np.array([[2, 2, 4, 8], [0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]])
+    a = ExpectimaxTimeControlled(timer_budget_sec=2.0, use_bitboard=True, early_stop_margin=0.0,
+                                 rng=np.random.default_rng(0), telemetry=True)
+    a.select_action(g)
+    assert a.trace[-1]["completed_depth"] <= 3 and a.trace[-1]["elapsed_sec"] < 2.0
+
+def test_parallel_search_stays_within_budget():
+    for parallel in ("root", "chance"):
+        a = ExpectimaxTimeControlled(timer_budget_sec=0.05, use_bitboard=True, workers=2, parallel=parallel,
+                                     rng=np.random.default_rng(0))
+        try:
+            g = Game2048(seed=1)
+            a.select_action(g)      # starts the pool
+            for _ in range(4):
+                move = a.select_action(g)
+                assert move in g.legal_moves() and a.stats.nodes > 0
+                assert a.stats.elapsed_sec < 0.05 + 0.03
+                g.step(move)
+        finally:
+            a.close()
+        assert a._pool is None
+
+def test_telemetry_trace():
+    g = Game2048(seed=7)
+    fixed = ExpectimaxAgent(depth=2, empty_cell_cap=4, rng=np.random.default_rng(0), telemetry=True)
+    timed = ExpectimaxTimeControlled(timer_budget_sec=0.05, rng=np.random.default_rng(0), telemetry=True)
+    for agent in (fixed, timed):
+        agent.select_action(g)
+        rec = agent.trace[-1]
+        assert rec["nodes"] == sum(rec["nodes_by_depth"].values()) > 0
+        assert rec["completed_depth"] >= 1 and rec["ebf"] > 1
+        assert rec["eval_sec"] > 0 and rec["movegen_sec"] > 0
+    assert pickle.loads(pickle.dumps(timed)).select_action(g) in (0, 1, 2, 3)
+
+def test_trace_export_and_aggregate():
+    agent = ExpectimaxAgent(depth=1, empty_cell_cap=2, telemetry=True)
+    r = play_seeded_game(agent, 3)
+    assert len(r["trace"]) > 10 and agent.trace == []
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "game.jsonl")
+        write_trace_jsonl(path, r["trace"], run="t", seed=3)
+        records = read_trace_jsonl(path)
+    agg = aggregate_traces(records)
+    assert agg["moves"] == len(r["trace"]) and agg["games"] == 1
+    assert agg["completed_depth_hist"] == {1: len(records)}
+    assert abs(sum(agg["time_split"].values()) - 1.0) < 1e-9
+
+if __name__ == "__main__":
+
+    import inspect, sys
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import numpy as np
+import bitboard
+from agents import RandomAgent
+from evaluate import play_games
+from trajectory import TrajectoryStore, TrajectoryWriter, NO_ACTION, NO_SPAWN
+
+def test_recorded_games_replay():
+    with tempfile.TemporaryDirectory() as d:
+        results = play_games(RandomAgent(), [1, 2, 3], record_path=d)
+        store = TrajectoryStore(d)
+        assert store.n_games == 3 and list(store.seeds) == [1, 2, 3]
+        for g, r in enumerate(results):
+            game = store.game(g)
+            assert game["actions"][-1] == NO_ACTION and int(game["rewards"].sum()) == r["score"]
+            for t in range(len(game["boards"]) - 1):
+                b, reward, _ = bitboard.apply_move(int(game["boards"][t]), int(game["actions"][t]))
+                assert reward == game["rewards"][t]
+                if game["spawn_pos"][t] != NO_SPAWN:
+                    b |= int(game["spawn_val"][t]) << (4 * int(game["spawn_pos"][t]))
+                assert b == game["boards"][t + 1]
+            assert store.decode_boards([store.ends[g] - 1]).max() == r["max_tile"]
+        rows = store.sample(1000, np.random.default_rng(0))
+        assert (store.actions[rows] != NO_ACTION).all()
+        del store
+
+def test_writer_appends_and_drops_unindexed_rows():
+    b = np.zeros((4, 4), dtype=np.int64); b[0, 0] = 2
+    with tempfile.TemporaryDirectory() as d:
+        with TrajectoryWriter(d) as w:
+            w.record(b, 2, 0, (1, 1, 2))
+            w.end_game(b, seed=7)
+        with open(os.path.join(d, "boards.u64"), "ab") as f:   # rows of a crashed, unindexed game
+            f.write(b"\0" * 24)
+        with TrajectoryWriter(d) as w:
+            w.end_game(b, seed=8)
+        store = TrajectoryStore(d)
+        assert len(store) == 3 and list(store.ends) == [2, 3] and list(store.seeds) == [7, 8]
+        assert store.spawn_pos[0] == 5 and store.spawn_val[0] == 1
+        del store
+
+if __name__ == "__main__":
+
+    import inspect, sys
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,45 @@
+import numpy as np
+from tuner import CMAES, race, tune, WEIGHT_NAMES, FIXED_WEIGHT
+
+def test_cmaes_minimizes_ellipsoid():
+    es = CMAES(np.full(5, 3.0), 1.0, seed=0)
+    target = np.arange(5.0)
+    for _ in range(150):
+        xs = es.ask()
+        es.tell(xs, [np.sum((x - target) ** 2 * (1 + np.arange(5))) for x in xs])
+    assert np.allclose(es.mean, target, atol=1e-3)
+
+def test_race_drops_clear_losers_on_common_seeds():
+    rng = np.random.default_rng(1)
+    means = np.array([10000, 9000, 3000, 9900, 2000])
+    seed_effect = rng.normal(0, 3000, 32)       # shared by all candidates on a seed
+    r = race(5, list(range(16)), lambda tasks: [means[i] + seed_effect[s] + rng.normal(0, 300) for i, s in tasks])
+    assert r["ranking"][0] == 0 and set(r["ranking"][-2:]) == {2, 4}
+    assert r["dropped"][0] is None and r["dropped"][2] is not None
+    assert r["games"] < 5 * 16
+
+def test_tune_smoke():
+    x0 = {k: 1.0 for k in WEIGHT_NAMES}
+    out = tune({"agent": "expectimax", "depth": 1, "use_bitboard": True}, generations=1, games=2,
+               popsize=4, workers=1, x0=x0)
+    assert set(out["weights"]) == set(WEIGHT_NAMES) and all(v > 0 for v in out["weights"].values())
+    # the common scale is not tuned: the fixed weight keeps its start value in every candidate
+    assert out["weights"][FIXED_WEIGHT] == 1.0 == out["history"][0]["best_weights"][FIXED_WEIGHT]
+    assert len(set(out["weights"].values())) > 1
+    assert out["history"][0]["games"] == 8 and out["best"]["mean_score"] > 0
+
+if __name__ == "__main__":
+
+    import inspect, sys
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
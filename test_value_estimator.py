@@ -0,0 +1,82 @@
+import json
+import os
+import tempfile
+import numpy as np
+from value_estimator import generate_dataset_sharded, iter_shards, load_dataset, sample_state, board_features
+from value_estimator import board_features_batch, LinearValueModel
+from expectimax_agent import ExpectimaxAgent
+from bitboard import to_bitboard
+
+def test_sharded_generation_resumes_exactly():
+    with tempfile.TemporaryDirectory() as d:
+        assert generate_dataset_sharded(d, 10, seed=3, teacher_budget_ms=1, shard_size=4, chunk_size=3) == 10
+        with open(os.path.join(d, "shard_00001.X.f64"), "ab") as f:     # half-written chunk of a crashed run
+            f.write(b"\0" * 8 * 40)
+        assert generate_dataset_sharded(d, 10, seed=3, teacher_budget_ms=1, shard_size=4) == 0
+        assert generate_dataset_sharded(d, 13, seed=3, teacher_budget_ms=1, shard_size=4, workers=2) == 3
+        for changed in ({"teacher_budget_ms": 2}, {"teacher_empty_cell_cap": 4}, {"seed": 4}, {"teacher_depth": 2}):
+            try:
+                generate_dataset_sharded(d, 13, **{"seed": 3, "teacher_budget_ms": 1, **changed}, shard_size=4)
+                assert False, f"resume with {changed} should raise"
+            except ValueError:
+                pass
+        X, y = load_dataset(d)
+        boards = np.concatenate([b for _, _, b, _ in iter_shards(d)])
+        depths = np.concatenate([dp for _, _, _, dp in iter_shards(d)])
+        assert X.shape == (13, 33) and y.shape == (13,) and np.isfinite(y).all()
+        assert sum(len(load_dataset(d, depth=k)[1]) for k in np.unique(depths)) == 13
+        for k in range(13):
+            g = sample_state(3, k)
+            assert boards[k] == to_bitboard(g.board) and (X[k] == board_features(g.board)).all()
+
+def test_fixed_depth_teacher_labels_one_depth():
+    with tempfile.TemporaryDirectory() as d:
+        generate_dataset_sharded(d, 6, seed=1, teacher_depth=2, teacher_empty_cell_cap=0, shard_size=4)
+        _, y = load_dataset(d)
+        depths = np.concatenate([dp for _, _, _, dp in iter_shards(d)])
+        assert (depths == 2).all()
+        for k in range(6):
+            a = ExpectimaxAgent(depth=2, empty_cell_cap=0, use_bitboard=True)
+            a.select_action(sample_state(1, k))
+            assert np.isclose(y[k], a.last_value)
+        with open(os.path.join(d, "meta.json"), "w") as f:     # written before labels were averaged
+            json.dump({"seed": 1, "shard_size": 4, "feature_dim": 33, "teacher_budget_ms": 50,
+                       "teacher_empty_cell_cap": 0, "teacher_depth": 2}, f)
+        try:
+            generate_dataset_sharded(d, 6, seed=1, teacher_depth=2, teacher_empty_cell_cap=0, shard_size=4)
+            assert False, "an old label format should raise"
+        except ValueError:
+            pass
+
+def test_linear_model_matches_features_and_search_modes():
+    boards = np.stack([sample_state(5, k).board for k in range(20)])
+    X = board_features_batch(boards)
+    assert all((X[k] == board_features(b)).all() for k, b in enumerate(boards))
+    m = LinearValueModel(np.random.default_rng(0).normal(size=33), 2.5)
+    with tempfile.TemporaryDirectory() as d:
+        m.save(os.path.join(d, "m.npz"))
+        m = LinearValueModel.load(os.path.join(d, "m.npz"))
+    expected = X @ m.coef + 2.5
+    assert np.allclose(m.value_batch(boards), expected)
+    assert np.allclose([m.value_packed(to_bitboard(b)) for b in boards], expected)
+    values = []
+    for batch in (False, True):
+        a = ExpectimaxAgent(depth=2, empty_cell_cap=16, use_bitboard=True, batch_chance=batch, evaluator=m)
+        values.append(a._max_value(to_bitboard(boards[0]), 2))
+    assert np.isclose(values[0], values[1])
+
+if __name__ == "__main__":
+
+    import inspect, sys
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,59 @@
+import numpy as np
+from game_engine import Game2048
+from agents import RandomAgent, GreedyImmediateAgent
+from vec_game import VecGame2048
+from evaluate import evaluate_agent
+
+def test_reset_spawns_two_tiles():
+    venv = VecGame2048(64, seed=0)
+    assert ((venv.boards > 0).sum(axis=(1, 2)) == 2).all()
+    assert np.isin(venv.boards, [0, 2, 4]).all()
+
+def test_step_matches_single_game_moves():
+    venv = VecGame2048(32, seed=1)
+    agent = RandomAgent(rng=np.random.default_rng(1))
+    for _ in range(20):
+        before = venv.boards.copy()
+        actions = agent.select_actions(venv)
+        _, gains, _, info = venv.step(actions)
+        for k in range(venv.n_games):
+            g = Game2048(seed=0)
+            g.board = before[k].copy()
+            new_b, gain, changed = g._peek(int(actions[k]))
+            assert changed == info["changed"][k]
+            assert gain == gains[k] or not changed
+            if changed:
+                # exactly one spawned tile on top of the moved board
+                diff = venv.boards[k] != new_b
+                assert diff.sum() == 1 and new_b[diff][0] == 0
+
+def test_greedy_batch_matches_scalar():
+    venv = VecGame2048(64, seed=2)
+    agent = GreedyImmediateAgent()
+    for _ in range(30):
+        actions = agent.select_actions(venv)
+        for k in range(venv.n_games):
+            g = Game2048(seed=0)
+            g.board = venv.boards[k].copy()
+            assert agent.select_action(g) == actions[k]
+        venv.step(actions)
+
+def test_vectorized_evaluate():
+    res = evaluate_agent(RandomAgent(rng=np.random.default_rng(3)), n_games=50, seed=3, vectorized=True)
+    assert res["games"] == 50 and res["avg_score"] > 0
+
+if __name__ == "__main__":
+
+    import inspect, sys
+    passed, failed = 0, 0
+    for name, fn in list(globals().items()):
+        if name.startswith("test_") and callable(fn):
+            try:
+                fn()
+                print(f"[PASS] {name}")
+                passed += 1
+            except AssertionError as e:
+                print(f"[FAIL] {name}: {e}")
+                failed += 1
+    print(f"\nSummary: {passed} passed, {failed} failed")
+    sys.exit(1 if failed else 0)
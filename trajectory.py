@@ -0,0 +1,186 @@
+"""
+Compact on-disk store of recorded games.
+
+A store is a directory of flat little-endian arrays, one row per position:
+
+    boards.u64     packed board before the action (bitboard.py layout)
+    actions.u8     action taken (NO_ACTION on each game's final row)
+    rewards.u32    merge reward of the action
+    spawn_pos.u8   nibble index (4*i + j) of the tile spawned after the action, NO_SPAWN if none
+    spawn_val.u8   exponent of that tile (1 = 2, 2 = 4), 0 if none
+    games.i64      per game: (end row, seed); game g spans rows [end[g-1], end[g])
+
+Each game ends with its terminal board as an extra row, so rows t and t+1 of
+a game are the state before and after (action t, spawn t). Writers only
+append, and the game index is written after the game's rows. Opening a
+writer truncates rows that a crashed run left past the last indexed game.
+Readers map the files with np.memmap, so random positions can be sampled
+from any number of games without loading or decoding the store.
+"""
+import json
+import os
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from bitboard import to_bitboard
+
+NO_ACTION = 255
+NO_SPAWN = 255
+
+_COLUMNS = (("boards", np.uint64), ("actions", np.uint8), ("rewards", np.uint32),
+            ("spawn_pos", np.uint8), ("spawn_val", np.uint8))
+_EXT = {np.uint64: "u64", np.uint8: "u8", np.uint32: "u32"}
+_FORMAT_VERSION = 1
+
+
+def _column_path(path: str, name: str, dtype) -> str:
+    return os.path.join(path, f"{name}.{_EXT[dtype]}")
+
+
+class GameTrajectory:
+    """
+    Rows of one game kept in memory; the recorder interface used by
+    evaluate.play_one_game (record() per move, end_game() once).
+    """
+    def __init__(self):
+        self.boards: List[int] = []
+        self.actions: List[int] = []
+        self.rewards: List[int] = []
+        self.spawn_pos: List[int] = []
+        self.spawn_val: List[int] = []
+        self.seed = -1
+
+    def __len__(self):
+        return len(self.boards)
+
+    def record(self, board, action: int, reward: int, spawn: Optional[Tuple[int, int, int]]):
+        """board: (4,4) array or packed int before the action; spawn: (i, j, value) or None."""
+        self.boards.append(board if isinstance(board, int) else to_bitboard(board))
+        self.actions.append(action)
+        self.rewards.append(reward)
+        if spawn is None:
+            self.spawn_pos.append(NO_SPAWN); self.spawn_val.append(0)
+        else:
+            i, j, value = spawn
+            self.spawn_pos.append(4 * i + j); self.spawn_val.append(int(value).bit_length() - 1)
+
+    def end_game(self, board, seed: Optional[int] = None):
+        self.record(board, NO_ACTION, 0, None)
+        self.seed = -1 if seed is None else int(seed)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {name: np.asarray(getattr(self, name), dtype=dtype) for name, dtype in _COLUMNS}
+
+
+class TrajectoryWriter:
+    """
+    Append-only writer. Use it directly as a recorder (record / end_game) or
+    append finished GameTrajectory objects, e.g. ones returned by worker processes.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"version": _FORMAT_VERSION, "columns": {n: np.dtype(d).name for n, d in _COLUMNS},
+                       "games": "int64 pairs (end_row, seed)"}, f)
+        games_path = os.path.join(path, "games.i64")
+        self.n_rows = 0
+        if os.path.exists(games_path):
+            n_games = os.path.getsize(games_path) // 16
+            with open(games_path, "r+b") as f:
+                f.truncate(16 * n_games)
+                if n_games:
+                    f.seek(16 * (n_games - 1))
+                    self.n_rows = int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+        self._files = {}
+        for name, dtype in _COLUMNS:
+            p = _column_path(path, name, dtype)
+            f = open(p, "ab")
+            f.truncate(self.n_rows * np.dtype(dtype).itemsize)
+            self._files[name] = f
+        self._games = open(games_path, "ab")
+        self._current = GameTrajectory()
+
+    def record(self, board, action: int, reward: int, spawn):
+        self._current.record(board, action, reward, spawn)
+
+    def end_game(self, board, seed: Optional[int] = None):
+        self._current.end_game(board, seed)
+        self.append_game(self._current)
+        self._current = GameTrajectory()
+
+    def append_game(self, traj: GameTrajectory):
+        cols = traj.columns()
+        for name, _ in _COLUMNS:
+            cols[name].tofile(self._files[name])
+            self._files[name].flush()
+        self.n_rows += len(traj)
+        np.array([self.n_rows, traj.seed], dtype=np.int64).tofile(self._games)
+        self._games.flush()
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._games.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _memmap(path: str, dtype, n: int) -> np.ndarray:
+    if n == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(n,))
+
+
+class TrajectoryStore:
+    """Read-only memory-mapped view of a store directory (rows of unfinished games are hidden)."""
+    def __init__(self, path: str):
+        self.path = path
+        games_path = os.path.join(path, "games.i64")
+        n_games = os.path.getsize(games_path) // 16 if os.path.exists(games_path) else 0
+        index = _memmap(games_path, np.int64, 2 * n_games).reshape(n_games, 2)
+        self.ends = np.asarray(index[:, 0])
+        self.seeds = np.asarray(index[:, 1])
+        self.starts = np.concatenate([[0], self.ends[:-1]]).astype(np.int64)
+        n = int(self.ends[-1]) if n_games else 0
+        for name, dtype in _COLUMNS:
+            setattr(self, name, _memmap(_column_path(path, name, dtype), dtype, n))
+
+    def __len__(self):
+        return len(self.boards)
+
+    @property
+    def n_games(self) -> int:
+        return len(self.ends)
+
+    def game(self, g: int) -> Dict[str, np.ndarray]:
+        """Column slices (memmap views) of game g."""
+        s, e = int(self.starts[g]), int(self.ends[g])
+        return {name: getattr(self, name)[s:e] for name, _ in _COLUMNS}
+
+    def game_of(self, rows: np.ndarray) -> np.ndarray:
+        """Game index of each row."""
+        return np.searchsorted(self.ends, rows, side="right")
+
+    def sample(self, n: int, rng=None, include_terminal: bool = False) -> np.ndarray:
+        """n uniformly random row indices (by default only rows where an action was taken)."""
+        rng = rng or np.random.default_rng()
+        if include_terminal:
+            return rng.integers(0, len(self), size=n)
+        # each game has exactly one terminal row (its last): map [0, len - n_games) around them
+        k = rng.integers(0, len(self) - self.n_games, size=n)
+        return k + np.searchsorted(self.ends - np.arange(1, self.n_games + 1), k, side="right")
+
+    def decode_boards(self, rows) -> np.ndarray:
+        """(k,4,4) int64 tile-value boards for the given rows."""
+        return unpack_boards(self.boards[rows])
+
+
+def unpack_boards(packed: np.ndarray) -> np.ndarray:
+    """Vectorized from_bitboard for an array of packed boards."""
+    shifts = np.arange(16, dtype=np.uint64) * np.uint64(4)
+    exps = ((np.asarray(packed, dtype=np.uint64)[:, None] >> shifts) & np.uint64(0xF)).astype(np.int64)
+    return np.where(exps > 0, np.left_shift(1, exps), 0).reshape(-1, 4, 4)
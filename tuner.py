@@ -0,0 +1,195 @@
+"""
+Heuristic weight tuning with CMA-ES, common random seeds and racing.
+
+The optimizer works on log(weights), so every weight stays positive and steps are
+relative. Only the ratios between weights shape the heuristic's preferences, so scaling
+them all together is a (nearly) flat direction: FIXED_WEIGHT keeps its start value and
+the other weights (TUNED_NAMES) are tuned relative to it. Each generation:
+- all candidates play the same game seeds (common random numbers: a candidate is
+  compared with the others on identical spawn sequences), in rounds of
+  'race_batch' games spread over a process pool;
+- after each round (once min_games are played), a candidate is dropped when its
+  paired score difference to the current leader is below zero by more than
+  race_z standard errors;
+- the ranking (survivors by mean score, then dropped candidates, later drops first)
+  updates the CMA-ES distribution.
+
+    python tuner.py            # tunes the expectimax depth-2 weights, saves tuned_weights.json
+"""
+import json
+import math
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from heuristics import DEFAULT_WEIGHTS
+from evaluate import game_seeds, play_seeded_game
+from experiments import build_agent
+
+WEIGHT_NAMES = tuple(DEFAULT_WEIGHTS)
+FIXED_WEIGHT = "empty"
+TUNED_NAMES = tuple(k for k in WEIGHT_NAMES if k != FIXED_WEIGHT)
+DEFAULT_TUNING_CONFIG = {"agent": "expectimax", "depth": 2, "empty_cell_cap": 4, "use_bitboard": True}
+
+
+class CMAES:
+    """(mu/mu_w, lambda)-CMA-ES minimizing a loss (Hansen's tutorial defaults); only the ranking of losses is used."""
+    def __init__(self, x0: Sequence[float], sigma0: float, popsize: Optional[int] = None, seed: Optional[int] = None):
+        self.mean = np.asarray(x0, dtype=np.float64).copy()
+        n = self.n = len(self.mean)
+        self.sigma = float(sigma0)
+        self.popsize = popsize or 4 + int(3 * math.log(n))
+        self.mu = self.popsize // 2
+        w = math.log(self.mu + 0.5) - np.log(np.arange(1, self.mu + 1))
+        self.weights = w / w.sum()
+        self.mueff = 1.0 / np.sum(self.weights ** 2)
+        self.cc = (4 + self.mueff / n) / (n + 4 + 2 * self.mueff / n)
+        self.cs = (self.mueff + 2) / (n + self.mueff + 5)
+        self.c1 = 2 / ((n + 1.3) ** 2 + self.mueff)
+        self.cmu = min(1 - self.c1, 2 * (self.mueff - 2 + 1 / self.mueff) / ((n + 2) ** 2 + self.mueff))
+        self.damps = 1 + 2 * max(0.0, math.sqrt((self.mueff - 1) / (n + 1)) - 1) + self.cs
+        self.chi_n = math.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n * n))
+        self.pc, self.ps = np.zeros(n), np.zeros(n)
+        self.C = np.eye(n)
+        self.generation = 0
+        self.rng = np.random.default_rng(seed)
+        self._eigen()
+
+    def _eigen(self):
+        self.C = np.triu(self.C) + np.triu(self.C, 1).T      # keep it exactly symmetric
+        d2, self.B = np.linalg.eigh(self.C)
+        self.D = np.sqrt(np.maximum(d2, 1e-20))
+        self.inv_sqrt_C = self.B @ np.diag(1 / self.D) @ self.B.T
+
+    def ask(self) -> np.ndarray:
+        """(popsize, n) candidate points."""
+        z = self.rng.standard_normal((self.popsize, self.n))
+        return self.mean + self.sigma * (z * self.D) @ self.B.T
+
+    def tell(self, xs: np.ndarray, losses: Sequence[float]):
+        n = self.n
+        order = np.argsort(losses, kind="stable")
+        old = self.mean
+        y = (xs[order[:self.mu]] - old) / self.sigma
+        step = self.weights @ y
+        self.mean = old + self.sigma * step
+        self.generation += 1
+        self.ps = (1 - self.cs) * self.ps + math.sqrt(self.cs * (2 - self.cs) * self.mueff) * self.inv_sqrt_C @ step
+        hsig = (np.linalg.norm(self.ps) / math.sqrt(1 - (1 - self.cs) ** (2 * self.generation)) / self.chi_n
+                < 1.4 + 2 / (n + 1))
+        self.pc = (1 - self.cc) * self.pc + hsig * math.sqrt(self.cc * (2 - self.cc) * self.mueff) * step
+        rank_mu = (y.T * self.weights) @ y
+        self.C = ((1 - self.c1 - self.cmu) * self.C
+                  + self.c1 * (np.outer(self.pc, self.pc) + (1 - hsig) * self.cc * (2 - self.cc) * self.C)
+                  + self.cmu * rank_mu)
+        self.sigma *= math.exp((self.cs / self.damps) * (np.linalg.norm(self.ps) / self.chi_n - 1))
+        self._eigen()
+
+
+# ----- racing -----
+
+def race(n_candidates: int, seeds: Sequence[int], play: Callable[[List[Tuple[int, int]]], List[float]],
+         race_batch: int = 2, min_games: int = 4, race_z: float = 2.0) -> Dict[str, Any]:
+    """
+    Play candidates on common seeds, race_batch seeds per round, dropping clearly worse ones.
+    play(tasks) scores a list of (candidate, seed) games. Returns "scores" (per candidate, the
+    scores on the seeds it played), "dropped" (round of the drop, or None), "ranking"
+    (candidate indices, best first) and "games" (total games played).
+    """
+    scores: List[List[float]] = [[] for _ in range(n_candidates)]
+    dropped: List[Optional[int]] = [None] * n_candidates
+    alive = list(range(n_candidates))
+    for rnd, lo in enumerate(range(0, len(seeds), race_batch)):
+        batch = seeds[lo:lo + race_batch]
+        tasks = [(i, s) for i in alive for s in batch]
+        for (i, _), score in zip(tasks, play(tasks)):
+            scores[i].append(score)
+        if len(scores[alive[0]]) < min_games or len(alive) == 1:
+            continue
+        leader = max(alive, key=lambda i: np.mean(scores[i]))
+        for i in alive:
+            if i == leader:
+                continue
+            d = np.asarray(scores[i]) - np.asarray(scores[leader])
+            sem = d.std(ddof=1) / math.sqrt(len(d))
+            if d.mean() + race_z * sem < 0:
+                dropped[i] = rnd
+        alive = [i for i in alive if dropped[i] is None]
+    survivors = sorted(alive, key=lambda i: -np.mean(scores[i]))
+    losers = sorted((i for i in range(n_candidates) if dropped[i] is not None),
+                    key=lambda i: (-dropped[i], -np.mean(scores[i])))
+    return {"scores": scores, "dropped": dropped, "ranking": survivors + losers,
+            "games": sum(len(s) for s in scores)}
+
+
+# ----- tuning -----
+
+def weights_from_log(x: Sequence[float], fixed: float = DEFAULT_WEIGHTS[FIXED_WEIGHT]) -> Dict[str, float]:
+    """All weights from log values of TUNED_NAMES, with FIXED_WEIGHT set to 'fixed'."""
+    tuned = {k: float(math.exp(v)) for k, v in zip(TUNED_NAMES, x)}
+    return {k: tuned.get(k, float(fixed)) for k in WEIGHT_NAMES}
+
+
+def _play_candidate(config: Dict[str, Any], seed: int) -> float:
+    return float(play_seeded_game(build_agent(config), seed)["score"])
+
+
+def tune(config: Optional[Dict[str, Any]] = None, generations: int = 20, games: int = 8, popsize: Optional[int] = None,
+         sigma0: float = 0.5, race_batch: int = 2, min_games: int = 4, race_z: float = 2.0, workers: int = 0,
+         seed: int = 0, x0: Optional[Dict[str, float]] = None,
+         progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Tune the heuristic weights of 'config' (an experiments.build_agent config; its "weights" are
+    overwritten) for mean game score; FIXED_WEIGHT stays at its value in x0. Each generation plays up to 'games' common seeds per
+    candidate (new seeds every generation). workers <= 0 uses all cores. progress(record) gets
+    each generation's record. Returns {"weights": CMA-ES mean, "best": best survivor of the last
+    generation with its mean score, "history": per-generation records}.
+    """
+    config = dict(config or DEFAULT_TUNING_CONFIG)
+    start = x0 or DEFAULT_WEIGHTS
+    fixed = start[FIXED_WEIGHT]
+    es = CMAES(np.log([start[k] for k in TUNED_NAMES]), sigma0, popsize, seed)
+    if workers is not None and workers <= 0:
+        workers = os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=workers) if workers and workers > 1 else None
+    history = []
+    try:
+        for g in range(generations):
+            xs = es.ask()
+            candidates = [{**config, "weights": weights_from_log(x, fixed)} for x in xs]
+
+            def play(tasks):
+                if pool is None:
+                    return [_play_candidate(candidates[i], s) for i, s in tasks]
+                return list(pool.map(_play_candidate, [candidates[i] for i, _ in tasks], [s for _, s in tasks]))
+
+            result = race(len(xs), game_seeds(games, seed * 100_003 + g), play, race_batch, min_games, race_z)
+            losses = np.empty(len(xs))
+            losses[result["ranking"]] = np.arange(len(xs))
+            es.tell(xs, losses)
+            top = result["ranking"][0]
+            record = {"generation": g, "games": result["games"], "full_games": len(xs) * games,
+                      "dropped": sum(d is not None for d in result["dropped"]),
+                      "best_mean_score": float(np.mean(result["scores"][top])),
+                      "best_weights": candidates[top]["weights"],
+                      "mean_weights": weights_from_log(es.mean, fixed), "sigma": es.sigma}
+            history.append(record)
+            if progress: progress(record)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    last = history[-1] if history else None
+    return {"weights": weights_from_log(es.mean, fixed),
+            "best": None if last is None else {"weights": last["best_weights"], "mean_score": last["best_mean_score"]},
+            "history": history}
+
+
+if __name__ == "__main__":
+    def report(r):
+        print(f"gen {r['generation']:3d}: {r['games']}/{r['full_games']} games ({r['dropped']} dropped), "
+              f"best mean {r['best_mean_score']:.0f}, sigma {r['sigma']:.3f}, "
+              + ", ".join(f"{k}={v:.3g}" for k, v in r["mean_weights"].items()))
+    out = tune(generations=30, games=8, workers=0, progress=report)
+    with open("tuned_weights.json", "w") as f:
+        json.dump(out, f, indent=1)
+    print("Saved: tuned_weights.json", out["weights"])
@@ -1,45 +1,273 @@
+import json
+import os
 import numpy as np
-import joblib as _joblib  
-from typing import List, Tuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Iterator, Optional, Tuple, Union
 from game_engine import Game2048
+from agents import RandomAgent
 from expectimax_tc_agent import ExpectimaxTimeControlled
+from expectimax_agent import ExpectimaxAgent
 from heuristics import heuristic_score
+from bitboard import to_bitboard, ROW_MASK
 
 def board_features(b: np.ndarray) -> np.ndarray:
-    x = b.flatten().astype(np.float64)
-    x_log = np.where(x > 0, np.log2(x), 0.0)
-    empty = np.array([np.sum(b == 0)], dtype=np.float64)
-    return np.concatenate([x, x_log, empty], axis=0)
+    return board_features_batch(b[None])[0]
+
+def board_features_batch(boards: np.ndarray) -> np.ndarray:
+    """(N,33) features of a (N,4,4) stack: 16 tile values, 16 log2 tiles (0 for empty), #empty cells."""
+    x = boards.reshape(len(boards), 16).astype(np.float64)
+    x_log = np.log2(np.maximum(x, 1.0))
+    empty = np.sum(x == 0, axis=1, keepdims=True, dtype=np.float64)
+    return np.concatenate([x, x_log, empty], axis=1)
+
+FEATURE_DIM = 33
+
+class LinearValueModel:
+    """
+    A linear model over board_features (e.g. the fitted Ridge) as plain NumPy: coef (33,) and bias.
+    - predict_batch / value_batch: one matrix multiply over board_features_batch.
+    - value_packed: the features are per-cell, so the model is a sum of per-row terms; four
+      65536-entry row tables (built once) score a packed board in four lookups.
+    Has the evaluator interface of the expectimax agents (value / value_packed / value_batch).
+    It is fit to search values, which score dead boards like any other, so zero_at_terminal is off.
+    """
+    zero_at_terminal = False
+
+    def __init__(self, coef: np.ndarray, intercept: float):
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+        if self.coef.shape != (FEATURE_DIM,):
+            raise ValueError(f"expected {FEATURE_DIM} coefficients, got {self.coef.shape}")
+        self._bind()
+
+    def _bind(self):
+        exps = np.arange(16)
+        values = np.where(exps > 0, 2.0 ** exps, 0.0)
+        # cell_terms[c, e]: contribution of exponent e on cell c
+        cell_terms = (self.coef[:16, None] * values + self.coef[16:32, None] * np.maximum(exps, 0)
+                      + self.coef[32] * (exps == 0))
+        codes = np.arange(65536)
+        nibbles = [(codes >> (4 * j)) & 0xF for j in range(4)]
+        self._rows = [sum(cell_terms[4 * i + j][nibbles[j]] for j in range(4)).tolist() for i in range(4)]
+
+    def __getstate__(self):
+        # the row tables are rebuilt from coef in the receiving process
+        return {"coef": self.coef, "intercept": self.intercept}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bind()
+
+    @classmethod
+    def from_sklearn(cls, model) -> "LinearValueModel":
+        return cls(model.coef_, model.intercept_)
+
+    @classmethod
+    def load(cls, path: str = "value_model.npz") -> "LinearValueModel":
+        with np.load(path) as z:
+            return cls(z["coef"], float(z["intercept"]))
+
+    def save(self, path: str = "value_model.npz"):
+        np.savez(path, coef=self.coef, intercept=np.float64(self.intercept))
+
+    def predict_batch(self, boards: np.ndarray) -> np.ndarray:
+        return board_features_batch(boards) @ self.coef + self.intercept
+
+    value_batch = predict_batch
+
+    def value_packed(self, b: int) -> float:
+        r0, r1, r2, r3 = self._rows
+        return (self.intercept + r0[b & ROW_MASK] + r1[(b >> 16) & ROW_MASK]
+                + r2[(b >> 32) & ROW_MASK] + r3[(b >> 48) & ROW_MASK])
+
+    def value(self, board: np.ndarray) -> float:
+        return self.value_packed(to_bitboard(board))
+
+def sample_state(seed: int, k: int) -> Game2048:
+    """State k of a dataset: a fresh game after 2-11 random moves, determined by (seed, k) alone."""
+    rng = np.random.default_rng([seed, k])
+    g = Game2048(seed=int(rng.integers(0, 1_000_000_000)))
+    walker = RandomAgent(rng=rng)
+    for _ in range(int(rng.integers(2, 12))):
+        if g.is_game_over(): break
+        g.step(walker.select_action(g))
+    return g
+
+def teacher_label(teacher: Union[ExpectimaxTimeControlled, ExpectimaxAgent], g: Game2048) -> Tuple[float, int]:
+    """
+    (value, depth): the teacher's search value for the state and the depth it was searched to;
+    the heuristic value at depth 0 if no search finished (in time, or on a dead board).
+    """
+    teacher.select_action(g)
+    if teacher.last_value is None:
+        return heuristic_score(g.board), 0
+    return teacher.last_value, teacher.stats.completed_depth
+
+def _make_teacher(teacher_budget_ms: float, teacher_empty_cell_cap: int, teacher_depth: Optional[int], rng=None):
+    """Fixed-depth ExpectimaxAgent if teacher_depth is set (the budget is then unused), else the time-controlled one."""
+    if teacher_depth is not None:
+        return ExpectimaxAgent(depth=teacher_depth, empty_cell_cap=teacher_empty_cell_cap, rng=rng, use_bitboard=True)
+    return ExpectimaxTimeControlled(timer_budget_sec=teacher_budget_ms/1000.0, empty_cell_cap=teacher_empty_cell_cap,
+                                    rng=rng)
 
 def generate_dataset(n_states=2000, seed=0, teacher_budget_ms=50):
-    rng = np.random.default_rng(seed)
     X, y = [], []
     teacher = ExpectimaxTimeControlled(timer_budget_sec=teacher_budget_ms/1000.0, empty_cell_cap=8)
     for k in range(n_states):
-        s = int(rng.integers(0, 1_000_000_000))
-        g = Game2048(seed=s)
-        steps = int(rng.integers(2, 12))
-        for _ in range(steps):
-            if g.is_game_over(): break
-            from agents import RandomAgent
-            a = RandomAgent(rng=rng).select_action(g)
-            g.step(a)
-
-        board = g.board.copy()
-        _ = teacher.select_action(g)  
-        val = heuristic_score(board)
-        X.append(board_features(board)); y.append(val)
+        g = sample_state(seed, k)
+        X.append(board_features(g.board)); y.append(teacher_label(teacher, g)[0])
     X = np.stack(X, axis=0); y = np.array(y, dtype=np.float64)
     np.savez("value_data.npz", X=X, y=y)
     print("Saved value_data.npz with", X.shape, "features")
     return X, y
 
+# ----- sharded, resumable generation -----
+#
+# out_dir/meta.json holds (seed, shard_size, feature_dim, teacher settings); shard i covers states
+# [i*shard_size, (i+1)*shard_size) and is four raw append-only files:
+#   shard_00000.X.f64 (rows of FEATURE_DIM), .y.f64 (teacher values), .boards.u64 (packed boards),
+#   .depth.u8 (search depth of each teacher value)
+# A time-controlled teacher reaches different depths on different states; values of
+# different depths are not on one scale, so train on one depth (load_dataset(depth=...))
+# or label with a fixed-depth teacher (teacher_depth).
+# Rows are streamed in chunks, so memory stays at one chunk per worker. A rerun
+# (after a crash, or with a larger n_states) keeps the complete rows of each shard
+# and continues from the first missing state; states depend only on (seed, k).
+
+_SHARD_COLUMNS = (("X", np.float64, FEATURE_DIM), ("y", np.float64, 1), ("boards", np.uint64, 1),
+                  ("depth", np.uint8, 1))
+# bumped when the meaning of stored labels changes (2: chance nodes average their cells, depth column)
+_LABEL_FORMAT = 2
+
+def _shard_path(out_dir: str, shard: int, column: str) -> str:
+    ext = {"X": "f64", "y": "f64", "boards": "u64", "depth": "u8"}[column]
+    return os.path.join(out_dir, f"shard_{shard:05d}.{column}.{ext}")
+
+def _complete_rows(out_dir: str, shard: int, truncate: bool = False) -> int:
+    """Rows present in all columns of a shard; with truncate, longer columns are cut back to it."""
+    sizes = []
+    for column, dtype, width in _SHARD_COLUMNS:
+        p = _shard_path(out_dir, shard, column)
+        sizes.append(os.path.getsize(p) // (np.dtype(dtype).itemsize * width) if os.path.exists(p) else 0)
+    n = min(sizes)
+    for column, dtype, width in (_SHARD_COLUMNS if truncate else ()):
+        p = _shard_path(out_dir, shard, column)
+        if os.path.exists(p):
+            with open(p, "r+b") as f:
+                f.truncate(n * np.dtype(dtype).itemsize * width)
+    return n
+
+def generate_shard(out_dir: str, shard: int, stop: int, seed: int, shard_size: int,
+                   teacher_budget_ms: float = 50, chunk_size: int = 100, teacher_empty_cell_cap: int = 8,
+                   teacher_depth: Optional[int] = None) -> int:
+    """Fill shard up to global state index 'stop'; returns the number of rows added."""
+    start = shard * shard_size + _complete_rows(out_dir, shard, truncate=True)
+    teacher = _make_teacher(teacher_budget_ms, teacher_empty_cell_cap, teacher_depth, np.random.default_rng([seed, shard]))
+    files = {c: open(_shard_path(out_dir, shard, c), "ab") for c, _, _ in _SHARD_COLUMNS}
+    try:
+        for lo in range(start, stop, chunk_size):
+            X, y, boards, depths = [], [], [], []
+            for k in range(lo, min(lo + chunk_size, stop)):
+                g = sample_state(seed, k)
+                X.append(board_features(g.board)); boards.append(to_bitboard(g.board))
+                v, d = teacher_label(teacher, g)
+                y.append(v); depths.append(d)
+            np.asarray(X, dtype=np.float64).tofile(files["X"])
+            np.asarray(boards, dtype=np.uint64).tofile(files["boards"])
+            np.asarray(depths, dtype=np.uint8).tofile(files["depth"])
+            np.asarray(y, dtype=np.float64).tofile(files["y"])
+            for f in files.values():
+                f.flush()
+    finally:
+        for f in files.values():
+            f.close()
+    return max(stop - start, 0)
+
+def generate_dataset_sharded(out_dir: str, n_states: int, seed: int = 0, teacher_budget_ms: float = 50,
+                             workers: int = 1, shard_size: int = 1000, chunk_size: int = 100,
+                             progress: Optional[Callable[[int, int], None]] = None,
+                             teacher_empty_cell_cap: int = 8, teacher_depth: Optional[int] = None) -> int:
+    """
+    Generate (or resume) n_states teacher-labelled states into out_dir, one shard per task
+    on 'workers' processes (workers <= 0 uses all cores). progress(rows_done, n_states)
+    is called as shards finish. Returns the number of rows added by this call.
+    'teacher_depth' labels every state with a fixed-depth search instead of the
+    teacher_budget_ms time-controlled one, so all labels share one depth.
+    Resuming with a different seed, shard size, teacher setting or label format raises ValueError.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    meta_path = os.path.join(out_dir, "meta.json")
+    meta = {"seed": seed, "shard_size": shard_size, "feature_dim": FEATURE_DIM, "label_format": _LABEL_FORMAT,
+            "teacher_budget_ms": teacher_budget_ms, "teacher_empty_cell_cap": teacher_empty_cell_cap,
+            "teacher_depth": teacher_depth}
+    if os.path.exists(meta_path):
+        with open(meta_path) as f:
+            old = json.load(f)
+        if any(old.get(k) != v for k, v in meta.items()):
+            raise ValueError(f"{out_dir} was generated with {old}, not {meta}")
+    with open(meta_path, "w") as f:
+        json.dump({**meta, "n_states": max(n_states, _stored_states(out_dir, shard_size))}, f)
+
+    n_shards = -(-n_states // shard_size)
+    tasks = [(s, min((s + 1) * shard_size, n_states)) for s in range(n_shards)]
+    done = sum(_complete_rows(out_dir, s) for s in range(n_shards))
+    if workers is not None and workers <= 0:
+        workers = os.cpu_count() or 1
+    added = 0
+    if not workers or workers == 1:
+        for s, stop in tasks:
+            n = generate_shard(out_dir, s, stop, seed, shard_size, teacher_budget_ms, chunk_size,
+                               teacher_empty_cell_cap, teacher_depth)
+            added += n
+            if progress: progress(done + added, n_states)
+        return added
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(generate_shard, out_dir, s, stop, seed, shard_size, teacher_budget_ms, chunk_size,
+                               teacher_empty_cell_cap, teacher_depth) for s, stop in tasks]
+        for fut in as_completed(futures):
+            added += fut.result()
+            if progress: progress(done + added, n_states)
+    return added
+
+def _stored_states(out_dir: str, shard_size: int) -> int:
+    n, s = 0, 0
+    while os.path.exists(_shard_path(out_dir, s, "y")):
+        n = s * shard_size + os.path.getsize(_shard_path(out_dir, s, "y")) // 8
+        s += 1
+    return n
+
+def iter_shards(out_dir: str) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]]:
+    """(X, y, boards, depth) memory-mapped per shard, in state order."""
+    s = 0
+    while os.path.exists(_shard_path(out_dir, s, "y")):
+        n = _complete_rows(out_dir, s)
+        if n:
+            X = np.memmap(_shard_path(out_dir, s, "X"), dtype=np.float64, mode="r", shape=(n, FEATURE_DIM))
+            y = np.memmap(_shard_path(out_dir, s, "y"), dtype=np.float64, mode="r", shape=(n,))
+            b = np.memmap(_shard_path(out_dir, s, "boards"), dtype=np.uint64, mode="r", shape=(n,))
+            d = np.memmap(_shard_path(out_dir, s, "depth"), dtype=np.uint8, mode="r", shape=(n,))
+            yield X, y, b, d
+        s += 1
+
+def load_dataset(out_dir: str, depth: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    All shards concatenated in memory (for datasets that fit; otherwise use iter_shards).
+    'depth' keeps only the rows labelled by a search of that depth.
+    """
+    parts = [(X, y) if depth is None else (X[d == depth], y[d == depth]) for X, y, _, d in iter_shards(out_dir)]
+    if not parts:
+        return np.zeros((0, FEATURE_DIM)), np.zeros(0)
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
 def train_ridge(X, y, alpha=1.0):
+    """Fit Ridge; saves value_model.joblib and the NumPy export value_model.npz (see LinearValueModel)."""
     try:
+        import joblib as _joblib
         from sklearn.linear_model import Ridge
         model = Ridge(alpha=alpha).fit(X, y)
         _joblib.dump(model, "value_model.joblib")
-        print("Saved value_model.joblib")
+        LinearValueModel.from_sklearn(model).save("value_model.npz")
+        print("Saved value_model.joblib, value_model.npz")
         return model
     except Exception as e:
         print("sklearn not available or failed:", e)
@@ -47,5 +275,7 @@ def train_ridge(X, y, alpha=1.0):
         return None
 
 if __name__ == "__main__":
-    X, y = generate_dataset(n_states=1000, seed=0, teacher_budget_ms=30)
+    generate_dataset_sharded("value_data", n_states=1000, seed=0, teacher_depth=2, workers=0,
+                             progress=lambda done, n: print(f"{done}/{n} states"))
+    X, y = load_dataset("value_data")
     train_ridge(X, y, alpha=1.0)
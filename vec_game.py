@@ -0,0 +1,84 @@
+import numpy as np
+from typing import Dict, Optional, Tuple
+from game_engine import UP, DOWN, LEFT, RIGHT
+from bitboard import apply_move_batch
+
+ACTIONS = (UP, DOWN, LEFT, RIGHT)
+
+
+class VecGame2048:
+    """
+    N games of 2048 played in lockstep on an (N,4,4) board array.
+    - All spawns come from one RNG stream (2 with 90%, 4 with 10%).
+    - Moves of all four directions are computed once per state (peek_all) and
+      shared by legal_mask(), batch agents and step().
+    - With auto_reset, finished games are restarted inside step(); their final
+      score and max tile are reported in info.
+    """
+    def __init__(self, n_games: int, seed: Optional[int] = None, auto_reset: bool = True):
+        self.n_games = int(n_games)
+        self.auto_reset = auto_reset
+        self.rng = np.random.default_rng(seed)
+        self.boards = np.zeros((self.n_games, 4, 4), dtype=np.int64)
+        self.scores = np.zeros(self.n_games, dtype=np.int64)
+        self._peek = None
+        self.reset()
+
+    def reset(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """Reset all games (or those selected by a boolean mask) to two random tiles."""
+        if mask is None:
+            mask = np.ones(self.n_games, dtype=bool)
+        self.boards[mask] = 0
+        self.scores[mask] = 0
+        self._spawn(mask)
+        self._spawn(mask)
+        self._peek = None
+        return self.boards.copy()
+
+    def _spawn(self, mask: np.ndarray) -> None:
+        """Spawn one tile in a uniformly random empty cell of every selected game."""
+        flat = self.boards.reshape(self.n_games, 16)
+        r = self.rng.random((self.n_games, 16))
+        r[flat != 0] = -1.0
+        cell = np.argmax(r, axis=1)
+        values = np.where(self.rng.random(self.n_games) < 0.1, 4, 2)
+        ok = mask & (r.max(axis=1) >= 0.0)
+        idx = np.nonzero(ok)[0]
+        flat[idx, cell[idx]] = values[idx]
+
+    def peek_all(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(after (4,N,4,4), merge_rewards (4,N), changed (4,N)) for every action, cached per state."""
+        if self._peek is None:
+            outs, rewards, changed = zip(*(apply_move_batch(self.boards, a) for a in ACTIONS))
+            self._peek = (np.stack(outs), np.stack(rewards), np.stack(changed))
+        return self._peek
+
+    def legal_mask(self) -> np.ndarray:
+        """(N,4) boolean mask of moves that change each board, indexed by action."""
+        return self.peek_all()[2].T
+
+    def step(self, actions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Dict]:
+        """Apply one action per game; games whose move is invalid are left untouched."""
+        actions = np.asarray(actions, dtype=np.int64)
+        after, rewards, changed = self.peek_all()
+        idx = np.arange(self.n_games)
+        moved = changed[actions, idx]
+        gain = np.where(moved, rewards[actions, idx], 0)
+
+        self.boards[moved] = after[actions[moved], idx[moved]]
+        self.scores += gain
+        self._spawn(moved)
+        self._peek = None
+
+        dones = ~self.legal_mask().any(axis=1)
+        info = {"changed": moved, "invalid": ~moved}
+        if dones.any():
+            info["done_index"] = np.nonzero(dones)[0]
+            info["final_score"] = self.scores[dones].copy()
+            info["final_max_tile"] = self.boards[dones].max(axis=(1, 2))
+            if self.auto_reset:
+                self.reset(dones)
+        return self.boards.copy(), gain, dones, info
+
+    def max_tiles(self) -> np.ndarray:
+        return self.boards.max(axis=(1, 2))